@@ -0,0 +1,90 @@
+"""Пропускная способность анализа треков (music.analysis) в пуле процессов.
+
+Скрипт пишет --tracks синтетических WAV по --seconds секунд и прогоняет
+analyze_file через ProcessPoolExecutor с 1, 2, 4 ... --workers процессами.
+Печатает треков в секунду и каким путем считались окна (NumPy или Python).
+
+    python benchmarks/analysis_throughput.py --tracks 16 --workers 4
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import wave
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "music_app")
+RATE = 22050
+
+
+def setup() -> None:
+    sys.path.insert(0, APP_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "music_app.settings")
+    import django
+
+    django.setup()
+
+
+def write_track(path: str, seconds: int, rng: random.Random) -> None:
+    frequency = rng.uniform(100, 2000)
+    second = array(
+        "h",
+        (
+            round(12000 * math.sin(2 * math.pi * frequency * n / RATE))
+            + rng.randint(-800, 800)
+            for n in range(RATE)
+        ),
+    )
+    with wave.open(path, "wb") as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(RATE)
+        output.writeframes(second.tobytes() * seconds)
+
+
+def analyze(path: str) -> float:
+    from music.analysis import analyze_file
+
+    return analyze_file(path).loudness
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=16)
+    parser.add_argument("--seconds", type=int, default=180)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup()
+    from music import analysis
+
+    print(f"windows: {'numpy' if analysis.numpy is not None else 'python'}")
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"{n}.wav") for n in range(args.tracks)]
+        for path in paths:
+            write_track(path, args.seconds, rng)
+
+        workers = 1
+        while workers <= args.workers:
+            with ProcessPoolExecutor(workers, initializer=setup) as pool:
+                # Прогрев: запуск процессов и django.setup() не входят в замер
+                list(pool.map(int, range(workers)))
+                began = time.perf_counter()
+                list(pool.map(analyze, paths))
+                elapsed = time.perf_counter() - began
+            print(
+                f"{workers:>3} workers: {args.tracks / elapsed:7.2f} tracks/s "
+                f"({args.tracks * args.seconds / elapsed:8.0f}x realtime)"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""JSON API (music.api) против HTML-страниц: размер ответа и CPU на запрос.
+
+Скрипт создает отдельную базу (--db) с артистом и плейлистом по --tracks
+треков и запрашивает через django.test.Client одну и ту же информацию:
+страницу артиста и плейлиста (первые 50 треков) и эквивалентные вызовы API.
+Печатает байты ответа и процессорное время на запрос (process_time, база
+в том же процессе, поэтому сюда входит и SQLite).
+
+    python benchmarks/api_payload.py --db /tmp/api.sqlite3 --requests 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "music_app"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "music_app.settings")
+
+
+def seed(tracks: int) -> tuple:
+    from django.core.management import call_command
+    from music import playlists
+    from music.models import Artist, Playlist, Track
+    from users.models import User
+
+    call_command("migrate", verbosity=0)
+    user = User.objects.create_user("listener", password="password")
+    artist = Artist.objects.create(name="Benchmark Artist", bio="bio " * 50)
+    created = Track.objects.bulk_create(
+        # Файлы не нужны: страницы только строят ссылки на них
+        Track(
+            title=f"Track number {number}",
+            artist=artist,
+            duration=200 + number,
+            audio_file=f"tracks/{number}.mp3",
+        )
+        for number in range(tracks)
+    )
+    playlist = Playlist.objects.create(title="Mix", owner=user, is_public=True)
+    playlists.append(playlist, [track.pk for track in created])
+    return user, artist, playlist, [track.pk for track in created[:50]]
+
+
+def measure(client, url: str, params: dict, requests: int) -> tuple:
+    response = client.get(url, params)
+    assert response.status_code == 200, (url, response.status_code)
+    began = time.process_time()
+    for _ in range(requests):
+        client.get(url, params)
+    return len(response.content), (time.process_time() - began) / requests
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="Файл SQLite (будет пересоздан)")
+    parser.add_argument("--tracks", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    from django.conf import settings
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    settings.DATABASES["default"]["NAME"] = args.db
+    import django
+
+    django.setup()
+    from django.test import Client
+    from django.urls import reverse
+    from music import api
+
+    print(f"serializer: {'orjson' if api.orjson is not None else 'json'}")
+    user, artist, playlist, first_page = seed(args.tracks)
+    client = Client(HTTP_HOST="localhost")
+    client.force_login(user)
+    ids = ",".join(map(str, first_page))
+    api_url = "music:api_collection"
+    cases = [
+        ("artist html", reverse("music:artist_detail", kwargs={"pk": artist.pk}), {}),
+        (
+            "artist api",
+            reverse(api_url, kwargs={"kind": "tracks"}),
+            {"artist": artist.pk, "limit": 50},
+        ),
+        (
+            "playlist html",
+            reverse("music:playlist_detail", kwargs={"pk": playlist.pk}),
+            {},
+        ),
+        (
+            "playlist api",
+            reverse(api_url, kwargs={"kind": "tracks"}),
+            {"ids": ids, "fields": "id,title,artist_name,duration,stream"},
+        ),
+    ]
+    for label, url, params in cases:
+        size, cpu = measure(client, url, params, args.requests)
+        print(f"{label:<14} {size:>8} bytes {cpu * 1000:8.2f} ms CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Пропускная способность записи в SQLite: прежний профиль против WAL.
+
+Процессы-писатели (как воркеры gunicorn) лайкают, снимают лайки и
+добавляют треки в плейлисты, процессы-читатели в это время листают
+плейлисты. Профиль baseline — режим журнала DELETE, synchronous=FULL и
+отложенные транзакции, как было до настройки; tuned — настройки из
+settings.py (WAL, synchronous=NORMAL, mmap, IMMEDIATE-транзакции).
+Каждый профиль получает свою свежую базу в --dir.
+
+    python benchmarks/db_writes.py --writers 4 --readers 4 --duration 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "music_app")
+PROFILES = ("baseline", "tuned")
+
+
+def setup(db: str, profile: str) -> None:
+    sys.path.insert(0, APP_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "music_app.settings")
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db
+    if profile == "baseline":
+        settings.DATABASES["default"]["OPTIONS"] = {}
+        settings.MUSIC_SQLITE_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+    import django
+
+    django.setup()
+
+
+def seed(db: str, profile: str, args) -> None:
+    setup(db, profile)
+    from django.core.management import call_command
+    from music.models import Artist, Playlist, Track
+    from users.models import User
+
+    call_command("migrate", verbosity=0)
+    artist = Artist.objects.create(name="bench")
+    Track.objects.bulk_create(
+        Track(title=f"track {number}", artist=artist) for number in range(args.tracks)
+    )
+    for number in range(args.writers):
+        user = User.objects.create_user(f"bench{number}")
+        Playlist.objects.create(title=f"bench {number}", owner=user)
+
+
+def write(db: str, profile: str, args, number: int, start: float, results) -> None:
+    setup(db, profile)
+    from django.db import OperationalError
+    from music import likes, playlists
+    from music.models import Playlist, Track
+    from users.models import User
+
+    rng = random.Random(number)
+    user = User.objects.get(username=f"bench{number}")
+    playlist = Playlist.objects.get(owner=user, is_liked_playlist=False)
+    track_ids = list(Track.objects.values_list("pk", flat=True))
+    done = errors = 0
+    time.sleep(max(0.0, start - time.time()))
+    while time.time() < start + args.duration:
+        track_id = rng.choice(track_ids)
+        operation = rng.random()
+        try:
+            if operation < 0.4:
+                likes.like(user, track_id)
+            elif operation < 0.8:
+                likes.unlike(user, track_id)
+            else:
+                playlists.append(playlist, [track_id])
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(("write", done, errors))
+
+
+def read(db: str, profile: str, args, number: int, start: float, results) -> None:
+    setup(db, profile)
+    from django.db import OperationalError
+    from music import playlists
+    from music.models import Playlist
+
+    rng = random.Random(1000 + number)
+    playlist_ids = list(Playlist.objects.values_list("pk", flat=True))
+    done = errors = 0
+    time.sleep(max(0.0, start - time.time()))
+    while time.time() < start + args.duration:
+        try:
+            list(
+                playlists.ordered(rng.choice(playlist_ids))
+                .select_related("track__artist")[:50]
+            )
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(("read", done, errors))
+
+
+def run(profile: str, args) -> dict:
+    db = os.path.join(args.dir, f"{profile}.sqlite3")
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    context = multiprocessing.get_context("spawn")
+    seeder = context.Process(target=seed, args=(db, profile, args))
+    seeder.start()
+    seeder.join()
+
+    results = context.Queue()
+    # Запас на запуск процессов и django.setup(), чтобы все начали одновременно
+    start = time.time() + 3
+    workers = [
+        context.Process(target=write, args=(db, profile, args, number, start, results))
+        for number in range(args.writers)
+    ] + [
+        context.Process(target=read, args=(db, profile, args, number, start, results))
+        for number in range(args.readers)
+    ]
+    for worker in workers:
+        worker.start()
+    totals = {"write": [0, 0], "read": [0, 0]}
+    for _ in workers:
+        role, done, errors = results.get()
+        totals[role][0] += done
+        totals[role][1] += errors
+    for worker in workers:
+        worker.join()
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=tempfile.gettempdir())
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--tracks", type=int, default=2000)
+    parser.add_argument("--profile", choices=PROFILES, action="append")
+    args = parser.parse_args()
+
+    for profile in args.profile or PROFILES:
+        totals = run(profile, args)
+        writes, write_errors = totals["write"]
+        reads, read_errors = totals["read"]
+        print(
+            f"{profile:>8}: {writes / args.duration:8.1f} writes/s "
+            f"({write_errors} locked), {reads / args.duration:8.1f} reads/s "
+            f"({read_errors} locked)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Пересчет соседей (music.recommendations) на синтетическом каталоге.
+
+Скрипт строит --playlists плейлистов длиной до --length треков из каталога
+в --tracks треков (популярность по закону Ципфа), замеряет compute_neighbors
+и слияние соседей для пользователя с --likes лайками: по последним
+MUSIC_RECOMMENDATIONS_SEEDS и по всем сразу. База не используется.
+
+    python benchmarks/recommendations_build.py --tracks 50000 --playlists 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import accumulate
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "music_app")
+
+
+def setup() -> None:
+    sys.path.insert(0, APP_DIR)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "music_app.settings")
+    import django
+
+    django.setup()
+
+
+def make_playlists(tracks: int, count: int, length: int, rng: random.Random) -> list:
+    weights = list(accumulate(1 / rank for rank in range(1, tracks + 1)))
+    playlists = []
+    for _ in range(count):
+        size = rng.randint(2, length)
+        chosen = rng.choices(range(1, tracks + 1), cum_weights=weights, k=size)
+        playlists.append(list(dict.fromkeys(chosen)))
+    return playlists
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=20000)
+    parser.add_argument("--playlists", type=int, default=5000)
+    parser.add_argument("--length", type=int, default=40)
+    parser.add_argument("--likes", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup()
+    from music import recommendations
+
+    print(f"scoring: {'scipy' if recommendations.numpy is not None else 'python'}")
+    rng = random.Random(args.seed)
+    playlists = make_playlists(args.tracks, args.playlists, args.length, rng)
+    entries = sum(map(len, playlists))
+    print(f"{args.playlists} playlists, {entries} entries")
+
+    k = recommendations.get_neighbors_count()
+    began = time.perf_counter()
+    neighbors = recommendations.compute_neighbors(playlists, k)
+    elapsed = time.perf_counter() - began
+    print(f"compute_neighbors: {elapsed:8.2f} s ({len(neighbors)} tracks)")
+
+    began = time.perf_counter()
+    packed = {
+        track_id: (
+            recommendations.pack(others, "I"),
+            recommendations.pack(scores, "f"),
+        )
+        for track_id, (others, scores) in neighbors.items()
+    }
+    print(f"pack:              {time.perf_counter() - began:8.2f} s")
+
+    liked = rng.sample(sorted(packed), min(args.likes, len(packed)))
+    exclude = frozenset(liked)
+    for seeds in (liked[-recommendations.get_seeds_count() :], liked):
+        rows = [packed[track_id] for track_id in seeds]
+        began = time.perf_counter()
+        for _ in range(10):
+            recommendations.merge(rows, exclude, 40)
+        elapsed = (time.perf_counter() - began) / 10
+        print(f"merge {len(seeds):>5} seeds:  {elapsed * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
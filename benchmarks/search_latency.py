@@ -0,0 +1,108 @@
+"""Задержка поиска music.search на большом каталоге.
+
+Скрипт создает отдельную базу (--db), заполняет ее случайным каталогом из
+--tracks треков, строит индекс и замеряет music.search.search() на
+запросах-подсказках: префиксы из 2-6 букв, одно или два слова.
+
+    python benchmarks/search_latency.py --db /tmp/search.sqlite3 --tracks 1000000
+    python benchmarks/search_latency.py --db /tmp/search.sqlite3 --no-seed
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "music_app"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "music_app.settings")
+
+SYLLABLES = [
+    "ka", "ri", "mo", "lu", "ne", "sa", "to", "vi", "da", "pe", "zo", "mi",
+    "ra", "lo", "ve", "ny", "ko", "sti", "bra", "gel", "mor", "lin", "tra", "dor",
+]
+
+
+def word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def phrase(rng: random.Random, words: int) -> str:
+    return " ".join(word(rng) for _ in range(rng.randint(1, words))).title()
+
+
+def seed(args, rng: random.Random) -> None:
+    from django.core.management import call_command
+    from music import search
+    from music.models import Album, Artist, Track
+
+    call_command("migrate", verbosity=0)
+    artists_count = max(1, args.tracks // 20)
+    began = time.perf_counter()
+    Artist.objects.bulk_create(
+        (Artist(name=phrase(rng, 2)) for _ in range(artists_count)), batch_size=5000
+    )
+    artist_ids = list(Artist.objects.values_list("pk", flat=True))
+    Album.objects.bulk_create(
+        (
+            Album(title=phrase(rng, 3), artist_id=rng.choice(artist_ids))
+            for _ in range(args.tracks // 10)
+        ),
+        batch_size=5000,
+    )
+    for start in range(0, args.tracks, 50000):
+        Track.objects.bulk_create(
+            (
+                Track(title=phrase(rng, 4), artist_id=rng.choice(artist_ids))
+                for _ in range(min(50000, args.tracks - start))
+            ),
+            batch_size=5000,
+        )
+    search.rebuild()
+    print(f"seeded {args.tracks} tracks in {time.perf_counter() - began:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True, help="Файл SQLite для каталога")
+    parser.add_argument("--tracks", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = args.db
+    import django
+
+    django.setup()
+    from music.search import search
+
+    rng = random.Random(args.seed)
+    if not args.no_seed:
+        seed(args, rng)
+
+    queries = []
+    for _ in range(args.queries):
+        terms = [word(rng) for _ in range(rng.randint(1, 2))]
+        terms[-1] = terms[-1][: rng.randint(2, 6)]
+        queries.append(" ".join(terms))
+
+    timings = []
+    for query in queries:
+        began = time.perf_counter()
+        search(query)
+        timings.append((time.perf_counter() - began) * 1000)
+    timings.sort()
+    quantiles = statistics.quantiles(timings, n=100)
+    print(
+        f"{len(timings)} queries: p50 {quantiles[49]:.2f} ms, "
+        f"p95 {quantiles[94]:.2f} ms, p99 {quantiles[98]:.2f} ms, "
+        f"max {timings[-1]:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
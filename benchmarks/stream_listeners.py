@@ -0,0 +1,84 @@
+"""Сколько слушателей держит один процесс: WSGI против ASGI.
+
+Каждый слушатель открывает поток трека и читает его со скоростью
+воспроизведения (--bitrate). Слушатель считается обслуженным, если получил
+первый байт за --ttfb-limit секунд и ни разу не ждал данных дольше
+--stall-limit секунд. Число слушателей растет шагами, пока доля
+обслуженных не упадет ниже --min-served.
+
+    gunicorn music_app.wsgi -w 1 --threads 32 -b 127.0.0.1:8000
+    python benchmarks/stream_listeners.py --track 1 --path stream/{track}/
+
+    uvicorn music_app.asgi:application --workers 1 --port 8001
+    python benchmarks/stream_listeners.py --track 1 --port 8001 --path stream/{track}/async/
+"""
+
+import argparse
+import asyncio
+import time
+
+
+async def listen(args) -> bool:
+    path = "/music/" + args.path.format(track=args.track)
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(args.host, args.port), args.ttfb_limit
+        )
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: {args.host}\r\nConnection: close\r\n\r\n".encode()
+    )
+    bytes_per_second = args.bitrate * 1000 // 8
+    try:
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), args.ttfb_limit)
+        began = time.perf_counter()
+        received = 0
+        while time.perf_counter() - began < args.duration:
+            chunk = await asyncio.wait_for(reader.read(64 * 1024), args.stall_limit)
+            if not chunk:
+                break
+            received += len(chunk)
+            # Читаем не быстрее, чем играет плеер
+            ahead = received / bytes_per_second - (time.perf_counter() - began)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+        return True
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        writer.close()
+
+
+async def run_step(args, listeners: int) -> float:
+    results = await asyncio.gather(*(listen(args) for _ in range(listeners)))
+    return sum(results) / listeners
+
+
+async def main(args) -> None:
+    listeners = args.start
+    best = 0
+    while listeners <= args.max_listeners:
+        served = await run_step(args, listeners)
+        print(f"{listeners:6d} слушателей: обслужено {served:.1%}")
+        if served < args.min_served:
+            break
+        best = listeners
+        listeners *= 2
+    print(f"listeners-per-process: {best}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--track", type=int, required=True)
+    parser.add_argument("--path", default="stream/{track}/")
+    parser.add_argument("--bitrate", type=int, default=320, help="кбит/с")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--ttfb-limit", type=float, default=2.0)
+    parser.add_argument("--stall-limit", type=float, default=2.0)
+    parser.add_argument("--min-served", type=float, default=0.99)
+    parser.add_argument("--start", type=int, default=16)
+    parser.add_argument("--max-listeners", type=int, default=16384)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""Нагрузочный тест range-запросов к music/stream/<track_id>/.
+
+Имитирует перемотку: каждый запрос берет случайный диапазон файла.
+Запускать против поднятого сервера с разными MUSIC_STREAM_DELIVERY:
+
+    MUSIC_STREAM_DELIVERY=python gunicorn music_app.wsgi -w 4
+    python benchmarks/stream_ranges.py --track 1 --concurrency 64 --requests 5000
+"""
+
+import argparse
+import http.client
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+
+def get_file_size(host: str, port: int, path: str) -> int:
+    conn = http.client.HTTPConnection(host, port)
+    conn.request("GET", path, headers={"Range": "bytes=0-0"})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    if response.status != 206:
+        raise SystemExit(f"Ожидался 206, сервер ответил {response.status}")
+    return int(response.getheader("Content-Range").rsplit("/", 1)[1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--track", type=int, required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--range-size", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    url = urlsplit(args.base_url)
+    host, port = url.hostname, url.port or 80
+    path = f"/music/stream/{args.track}/"
+    file_size = get_file_size(host, port, path)
+    local = threading.local()
+
+    def fetch(_):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(host, port)
+        start = random.randrange(0, max(file_size - args.range_size, 1))
+        end = min(start + args.range_size, file_size) - 1
+        began = time.perf_counter()
+        conn.request("GET", path, headers={"Range": f"bytes={start}-{end}"})
+        response = conn.getresponse()
+        body = response.read()
+        return time.perf_counter() - began, len(body), response.status
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(fetch, range(args.requests)))
+    elapsed = time.perf_counter() - began
+
+    latencies = sorted(result[0] for result in results)
+    total_bytes = sum(result[1] for result in results)
+    errors = sum(1 for result in results if result[2] != 206)
+    print(f"requests:   {len(results)} ({errors} ошибок)")
+    print(f"throughput: {len(results) / elapsed:.1f} req/s")
+    print(f"bandwidth:  {total_bytes / elapsed / 2**20:.1f} MiB/s")
+    print(f"p50:        {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"p99:        {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
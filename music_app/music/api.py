@@ -0,0 +1,251 @@
+"""Read-only JSON API каталога: артисты, альбомы, треки и плейлисты.
+
+Поля ответа выбираются параметром fields=a,b и превращаются в .only() и
+select_related: в SELECT попадают только нужные столбцы. ?ids=1,2,3 отдает
+записи одним запросом в порядке ids; без ids — keyset-страница по id
+(?cursor=) с фильтрами ресурса (?artist=, ?album=). Поля-списки (tracks у
+альбома и плейлиста) добираются загрузчиками запроса (music.loaders) одним
+запросом на всю страницу.
+
+Сериализация — orjson, если он установлен, иначе json без пробелов.
+"""
+
+import json
+from typing import Callable, NamedTuple, Optional
+
+from django.db.models import Q, QuerySet
+from django.urls import reverse
+
+from .loaders import Loaders, album_track_ids, playlist_track_ids
+from .mixins import paginate_by_cursor
+from .models import Album, Artist, Playlist, Track
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен
+    orjson = None
+
+MAX_IDS = 100
+# Первичные ключи — положительные BIGINT; больше SQLite не принимает
+MAX_ID = 2**63 - 1
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class Field(NamedTuple):
+    # Столбцы для .only(); пусто — поле добирается batch
+    only: tuple = ()
+    value: Optional[Callable] = None
+    related: str = ""
+    # Функция загрузчика music.loaders: (список id) -> {id: значение}
+    batch: Optional[Callable] = None
+
+
+class Resource(NamedTuple):
+    model: type
+    fields: dict
+    default: tuple
+    # Параметр запроса -> поле модели для фильтра списка
+    filters: dict
+
+
+class APIError(Exception):
+    pass
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def attribute(name: str) -> Field:
+    return Field((name,), lambda obj: getattr(obj, name))
+
+
+def date(name: str) -> Field:
+    return Field((name,), lambda obj: getattr(obj, name).isoformat())
+
+
+def file_url(name: str) -> Field:
+    def value(obj) -> Optional[str]:
+        file = getattr(obj, name)
+        return file.url if file else None
+
+    return Field((name,), value)
+
+
+def artist_name() -> Field:
+    return Field(
+        ("artist", "artist__name"), lambda obj: obj.artist.name, related="artist"
+    )
+
+
+RESOURCES = {
+    "artists": Resource(
+        Artist,
+        {
+            "id": attribute("id"),
+            "name": attribute("name"),
+            "bio": attribute("bio"),
+            "image": file_url("image"),
+            "month_listeners": attribute("month_listeners"),
+        },
+        default=("id", "name", "image"),
+        filters={},
+    ),
+    "albums": Resource(
+        Album,
+        {
+            "id": attribute("id"),
+            "title": attribute("title"),
+            "artist": attribute("artist_id"),
+            "artist_name": artist_name(),
+            "image": file_url("image"),
+            "release_date": date("release_date"),
+            "is_explicit": attribute("is_explicit"),
+            "tracks": Field(batch=album_track_ids),
+        },
+        default=("id", "title", "artist", "artist_name", "image", "release_date"),
+        filters={"artist": "artist_id"},
+    ),
+    "tracks": Resource(
+        Track,
+        {
+            "id": attribute("id"),
+            "title": attribute("title"),
+            "artist": attribute("artist_id"),
+            "artist_name": artist_name(),
+            "album": attribute("album_id"),
+            "genre": attribute("genre_id"),
+            "duration": attribute("duration"),
+            "image": file_url("image"),
+            "release_date": date("release_date"),
+            "is_explicit": attribute("is_explicit"),
+            "status": attribute("status"),
+            "stream": Field(
+                value=lambda track: reverse(
+                    "music:stream_audio", kwargs={"track_id": track.pk}
+                )
+            ),
+        },
+        default=("id", "title", "artist", "artist_name", "album", "duration"),
+        filters={"artist": "artist_id", "album": "album_id"},
+    ),
+    "playlists": Resource(
+        Playlist,
+        {
+            "id": attribute("id"),
+            "title": attribute("title"),
+            "owner": attribute("owner_id"),
+            "is_public": attribute("is_public"),
+            "image": file_url("image"),
+            "tracks": Field(batch=playlist_track_ids),
+        },
+        default=("id", "title", "owner", "is_public", "image"),
+        filters={},
+    ),
+}
+
+
+def parse_list(value: str) -> list:
+    return [item for item in value.split(",") if item] if value else []
+
+
+def parse_id(value: str, name: str) -> int:
+    try:
+        pk = int(value)
+    except ValueError:
+        raise APIError(f"Invalid {name}")
+    if not 1 <= pk <= MAX_ID:
+        raise APIError(f"Invalid {name}")
+    return pk
+
+
+def parse_ids(value: str) -> list:
+    ids = list(dict.fromkeys(parse_id(item, "ids") for item in parse_list(value)))
+    if len(ids) > MAX_IDS:
+        raise APIError(f"At most {MAX_IDS} ids")
+    return ids
+
+
+def select_fields(resource: Resource, value: str) -> tuple:
+    names = tuple(parse_list(value)) or resource.default
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise APIError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def queryset(resource: Resource, names: tuple, user) -> QuerySet:
+    fields = [resource.fields[name] for name in names]
+    rows = resource.model.objects.all()
+    related = {field.related for field in fields if field.related}
+    if related:
+        rows = rows.select_related(*related)
+    only = {"id"}.union(*(field.only for field in fields))
+    rows = rows.only(*only)
+    if resource.model is Playlist:
+        visible = Q(is_public=True)
+        if user.is_authenticated:
+            visible |= Q(owner=user)
+        rows = rows.filter(visible)
+    return rows
+
+
+def serialize(resource: Resource, names: tuple, objects: list, loaders) -> list:
+    values = {}
+    ids = [obj.pk for obj in objects]
+    for name in names:
+        field = resource.fields[name]
+        if field.batch is not None:
+            loaded = loaders.batch(field.batch).load_many(ids)
+            values[name] = dict(zip(ids, loaded))
+    return [
+        {
+            name: (
+                values[name][obj.pk]
+                if name in values
+                else resource.fields[name].value(obj)
+            )
+            for name in names
+        }
+        for obj in objects
+    ]
+
+
+def fetch(kind: str, params, user, loaders: Loaders) -> dict:
+    """Ответ списка: {"results": [...], "next": курсор или None}"""
+    resource = RESOURCES[kind]
+    names = select_fields(resource, params.get("fields", ""))
+    rows = queryset(resource, names, user)
+    if "ids" in params:
+        ids = parse_ids(params["ids"])
+        by_id = rows.in_bulk(ids)
+        objects = [by_id[pk] for pk in ids if pk in by_id]
+        results = serialize(resource, names, objects, loaders)
+        return {"results": results, "next": None}
+
+    for param, field in resource.filters.items():
+        if param in params:
+            rows = rows.filter(**{field: parse_id(params[param], param)})
+    try:
+        limit = int(params.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise APIError("Invalid limit")
+    objects, next_cursor, _ = paginate_by_cursor(
+        rows, ("id",), params.get("cursor"), max(1, min(limit, MAX_PAGE_SIZE))
+    )
+    results = serialize(resource, names, objects, loaders)
+    return {"results": results, "next": next_cursor}
+
+
+def fetch_one(kind: str, pk: int, params, user, loaders: Loaders) -> Optional[dict]:
+    resource = RESOURCES[kind]
+    names = select_fields(resource, params.get("fields", ""))
+    if not 1 <= pk <= MAX_ID:
+        return None
+    obj = queryset(resource, names, user).filter(pk=pk).first()
+    if obj is None:
+        return None
+    return serialize(resource, names, [obj], loaders)[0]
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MusicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'music'
+
+    def ready(self):
+        from . import database, metrics, signals, tasks  # noqa: F401 tasks регистрирует фоновые задачи
+
+        database.connect()
+        metrics.connect()
+        signals.connect()
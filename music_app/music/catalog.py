@@ -0,0 +1,273 @@
+"""Массовый импорт каталога лейбла (manage.py import_catalog).
+
+Источник — каталог с аудиофайлами или manifest.csv с колонкой path (путь
+относительно манифеста) и необязательными title, artist, album, genre,
+которые перекрывают теги. Теги и длительность читает mutagen в пуле
+процессов; артисты, альбомы и жанры сопоставляются со словарями в памяти,
+новые строки и треки пишутся bulk_create пачками. После каждой пачки ее
+пути дописываются в файл контрольной точки, поэтому прерванный импорт
+продолжается с места остановки. Треки создаются в статусе pending, дальше
+их обрабатывает обычная задача ingest_track.
+"""
+
+import csv
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, NamedTuple
+
+import django
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from mutagen import File as AudioFile
+from mutagen import MutagenError
+
+from . import search
+from .jobs import enqueue_many
+from .models import Album, Artist, Genre, Track
+from .storage import change_references, is_content_addressed
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".flac", ".m4a")
+MANIFEST_COLUMNS = ("title", "artist", "album", "genre")
+FIELD_LENGTHS = {"title": 256, "artist": 128, "album": 256, "genre": 64}
+
+
+class CatalogEntry(NamedTuple):
+    path: str
+    # Путь относительно источника: ключ в файле контрольной точки
+    key: str
+    overrides: dict
+
+
+def iter_entries(source: str) -> Iterator[CatalogEntry]:
+    """Файлы каталога в стабильном порядке или строки манифеста"""
+    if os.path.isdir(source):
+        for root, directories, filenames in os.walk(source):
+            directories.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, filename)
+                    yield CatalogEntry(path, os.path.relpath(path, source), {})
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline="", encoding="utf-8") as manifest:
+        for row in csv.DictReader(manifest):
+            overrides = {
+                column: row[column].strip()
+                for column in MANIFEST_COLUMNS
+                if (row.get(column) or "").strip()
+            }
+            yield CatalogEntry(os.path.join(base, row["path"]), row["path"], overrides)
+
+
+def first_tag(tags, name: str) -> str:
+    values = tags.get(name) if tags else None
+    return values[0].strip() if values else ""
+
+
+def read_tags(path: str) -> dict:
+    """Теги и длительность файла; выполняется в процессах пула"""
+    try:
+        audio = AudioFile(path, easy=True)
+    except (MutagenError, OSError) as error:
+        return {"error": str(error)}
+    if audio is None:
+        return {"error": "неизвестный формат"}
+    tags = audio.tags
+    return {
+        "title": first_tag(tags, "title"),
+        # Альбом группируется по исполнителю альбома, если он указан
+        "artist": first_tag(tags, "albumartist") or first_tag(tags, "artist"),
+        "album": first_tag(tags, "album"),
+        "genre": first_tag(tags, "genre"),
+        "duration": int(audio.info.length),
+    }
+
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as checkpoint:
+        return {line.rstrip("\n") for line in checkpoint if line.strip()}
+
+
+def write_checkpoint(path: str, keys: Iterable[str]) -> None:
+    with open(path, "a", encoding="utf-8") as checkpoint:
+        checkpoint.writelines(f"{key}\n" for key in keys)
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+
+def normalize(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+class CatalogImporter:
+    """Пишет пачки треков лейбла, помня уже созданных артистов, альбомы и жанры"""
+
+    def __init__(self, label):
+        self.label = label
+        self.artists = {
+            normalize(artist.name): artist
+            for artist in Artist.objects.filter(user=label).only("name")
+        }
+        self.albums = {
+            (artist_id, normalize(title)): pk
+            for artist_id, title, pk in Album.objects.filter(
+                artist__user=label
+            ).values_list("artist_id", "title", "pk")
+        }
+        self.genres = {
+            normalize(title): pk
+            for title, pk in Genre.objects.values_list("title", "pk")
+        }
+        self.counts = Counter()
+        self.errors = []
+
+    def create_artists(self, names: set) -> None:
+        new = {normalize(name): name for name in names}
+        for key in self.artists.keys() & new.keys():
+            del new[key]
+        created = Artist.objects.bulk_create(
+            Artist(name=name, user=self.label) for name in new.values()
+        )
+        for artist in created:
+            self.artists[normalize(artist.name)] = artist
+            search.index_object(artist)
+        self.counts["artists"] += len(created)
+
+    def create_genres(self, titles: set) -> None:
+        new = {normalize(title): title for title in titles}
+        for key in self.genres.keys() & new.keys():
+            del new[key]
+        for genre in Genre.objects.bulk_create(Genre(title=t) for t in new.values()):
+            self.genres[normalize(genre.title)] = genre.pk
+
+    def create_albums(self, pairs: set) -> None:
+        new = {}
+        for artist_name, title in pairs:
+            artist = self.artists[normalize(artist_name)]
+            key = (artist.pk, normalize(title))
+            if key not in self.albums and key not in new:
+                new[key] = Album(title=title, artist=artist)
+        for key, album in zip(new, Album.objects.bulk_create(new.values())):
+            self.albums[key] = album.pk
+            search.index_object(album)
+        self.counts["albums"] += len(new)
+
+    def import_batch(self, rows: list) -> None:
+        """rows — пары (CatalogEntry, теги); ошибки копятся в self.errors"""
+        valid = []
+        for entry, tags in rows:
+            if "error" in tags:
+                self.errors.append((entry.key, tags["error"]))
+                continue
+            meta = {**tags, **entry.overrides}
+            # Обрезаем до длины полей сразу: по этим строкам сопоставляются объекты
+            for field, length in FIELD_LENGTHS.items():
+                meta[field] = meta[field][:length]
+            if not meta["artist"]:
+                self.errors.append((entry.key, "нет исполнителя"))
+                continue
+            if not meta["title"]:
+                meta["title"] = os.path.splitext(os.path.basename(entry.path))[0]
+            valid.append((entry, meta))
+
+        # Копирование файлов не держит блокировку записи SQLite; если пачка
+        # откатится, файлы без ссылок уберет gc_media
+        names = self.store_files(valid)
+        with transaction.atomic():
+            self.create_artists({meta["artist"] for _, meta in valid})
+            self.create_genres({meta["genre"] for _, meta in valid if meta["genre"]})
+            self.create_albums(
+                {(meta["artist"], meta["album"]) for _, meta in valid if meta["album"]}
+            )
+            tracks = self.build_tracks(valid, names)
+            Track.objects.bulk_create(tracks)
+            change_references([track.audio_file.name for track in tracks], +1)
+            enqueue_many("ingest_track", [{"track_id": track.pk} for track in tracks])
+        self.counts["tracks"] += len(tracks)
+        self.counts["skipped"] += len(valid) - len(tracks)
+
+    def store_files(self, valid: list) -> list:
+        """Сохраняет файлы пачки в хранилище; возвращает их имена"""
+        field = Track._meta.get_field("audio_file")
+        names = []
+        for entry, _ in valid:
+            with open(entry.path, "rb") as audio:
+                upload = field.generate_filename(None, os.path.basename(entry.path))
+                names.append(default_storage.save(upload, File(audio)))
+        return names
+
+    def build_tracks(self, valid: list, names: list) -> list:
+        # Тот же файл у того же артиста уже импортирован (повтор без контрольной точки)
+        existing = set(
+            Track.objects.filter(audio_file__in=names).values_list(
+                "artist_id", "audio_file"
+            )
+        )
+        tracks = []
+        for (entry, meta), name in zip(valid, names):
+            artist = self.artists[normalize(meta["artist"])]
+            if (artist.pk, name) in existing:
+                continue
+            existing.add((artist.pk, name))
+            album_key = (artist.pk, normalize(meta["album"]))
+            tracks.append(
+                Track(
+                    title=meta["title"],
+                    artist=artist,
+                    album_id=self.albums.get(album_key) if meta["album"] else None,
+                    genre_id=self.genres.get(normalize(meta["genre"])),
+                    duration=meta["duration"],
+                    audio_file=name,
+                    # Имя контентно-адресуемого файла — его SHA-256
+                    content_hash=(
+                        os.path.splitext(os.path.basename(name))[0]
+                        if is_content_addressed(name)
+                        else ""
+                    ),
+                    status=Track.Status.PENDING,
+                )
+            )
+        return tracks
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_catalog(
+    source: str,
+    label,
+    checkpoint: str,
+    workers: int = 1,
+    batch_size: int = 1000,
+    progress=None,
+) -> CatalogImporter:
+    """Импортирует source в каталог label, пропуская пути из checkpoint"""
+    done = read_checkpoint(checkpoint)
+    entries = [entry for entry in iter_entries(source) if entry.key not in done]
+    importer = CatalogImporter(label)
+    paths = (entry.path for entry in entries)
+    pool = None
+    if workers > 1:
+        # Воркеры только читают файлы, но модуль импортирует модели Django
+        pool = ProcessPoolExecutor(workers, initializer=django.setup)
+        tags = pool.map(read_tags, paths, chunksize=64)
+    else:
+        tags = map(read_tags, paths)
+    try:
+        for batch in batched(zip(entries, tags), batch_size):
+            importer.import_batch(batch)
+            write_checkpoint(checkpoint, (entry.key for entry, _ in batch))
+            if progress is not None:
+                progress(importer)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return importer
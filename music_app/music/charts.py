@@ -0,0 +1,114 @@
+"""Чарты главной страницы: топ артистов, топ треков и новые релизы.
+
+Чарты считаются командой manage.py refresh_charts (по расписанию) и
+сохраняются снимком ChartSnapshot. Снимок публикуется в кэш под ключом с
+его версией, затем переключается ключ текущей версии — читатели никогда не
+видят половину обновления. При промахе кэша снимок из базы читает один
+процесс, остальные ждут его результата.
+"""
+
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+
+from .models import Album, Artist, ChartSnapshot, Track
+
+VERSION_KEY = "music:charts:version"
+LOCK_KEY = "music:charts:lock"
+LOCK_TIMEOUT = 10
+# Сколько ждать, пока другой процесс загрузит снимок, прежде чем читать самим
+WAIT_STEP = 0.05
+WAIT_ATTEMPTS = 20
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+def get_cache():
+    return caches[getattr(settings, "MUSIC_CHARTS_CACHE", "default")]
+
+
+def get_size() -> int:
+    return getattr(settings, "MUSIC_CHARTS_SIZE", 10)
+
+
+def data_key(version: int) -> str:
+    return f"music:charts:{version}"
+
+
+def page_key(version: int) -> str:
+    return f"music:charts:{version}:index"
+
+
+def compute() -> dict:
+    size = get_size()
+    top_artists = Artist.objects.order_by("-month_listeners").values(
+        "id", "name", "image", "month_listeners"
+    )
+    top_tracks = (
+        Track.objects.filter(status=Track.Status.READY)
+        .order_by("-month_plays")
+        .values("id", "title", "image", "month_plays", "artist_id")
+        .annotate(artist_name=F("artist__name"))
+    )
+    new_releases = (
+        Album.objects.order_by("-release_date")
+        .values("id", "title", "image", "artist_id")
+        .annotate(artist_name=F("artist__name"))
+    )
+    return {
+        "top_artists": list(top_artists[:size]),
+        "top_tracks": list(top_tracks[:size]),
+        "new_releases": list(new_releases[:size]),
+    }
+
+
+def publish(snapshot: ChartSnapshot) -> dict:
+    charts = {"version": snapshot.pk, **snapshot.data}
+    cache = get_cache()
+    cache.set(data_key(snapshot.pk), charts, timeout=SNAPSHOT_TIMEOUT)
+    cache.set(VERSION_KEY, snapshot.pk, timeout=None)
+    return charts
+
+
+def refresh() -> dict:
+    """Пересчитывает чарты и публикует новую версию"""
+    with transaction.atomic():
+        snapshot = ChartSnapshot.objects.create(data=compute())
+        ChartSnapshot.objects.filter(pk__lt=snapshot.pk).delete()
+    return publish(snapshot)
+
+
+def load() -> dict:
+    snapshot = ChartSnapshot.objects.order_by("-pk").first()
+    if snapshot is None:
+        return refresh()
+    return publish(snapshot)
+
+
+def cached() -> Optional[dict]:
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        return None
+    return cache.get(data_key(version))
+
+
+def get_charts() -> dict:
+    charts = cached()
+    if charts is not None:
+        return charts
+    cache = get_cache()
+    if cache.add(LOCK_KEY, True, timeout=LOCK_TIMEOUT):
+        try:
+            return load()
+        finally:
+            cache.delete(LOCK_KEY)
+    for _ in range(WAIT_ATTEMPTS):
+        time.sleep(WAIT_STEP)
+        charts = cached()
+        if charts is not None:
+            return charts
+    return load()
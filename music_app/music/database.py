@@ -0,0 +1,39 @@
+"""Настройка соединений с базой данных.
+
+Профиль базы выбирается переменной окружения MUSIC_DB_PROFILE в settings.py.
+Для SQLite каждое новое соединение получает PRAGMA из DEFAULT_SQLITE_PRAGMAS,
+дополненные и переопределенные MUSIC_SQLITE_PRAGMAS:
+WAL позволяет читать во время записи, synchronous=NORMAL в WAL не теряет
+целостность и не ждет fsync на каждый коммит, busy_timeout заставляет
+писателя ждать блокировку вместо мгновенного "database is locked".
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULT_SQLITE_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "memory",
+    "cache_size": -20000,
+}
+
+
+def sqlite_pragmas() -> dict:
+    return {**DEFAULT_SQLITE_PRAGMAS, **getattr(settings, "MUSIC_SQLITE_PRAGMAS", {})}
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def connect() -> None:
+    connection_created.connect(
+        configure_connection, dispatch_uid="music.database.configure_connection"
+    )
@@ -0,0 +1,155 @@
+"""Аудит планов запросов: EXPLAIN для всех SELECT, которые делают представления.
+
+Используется командой manage.py explain_views. Полным сканированием
+считается "SCAN <таблица>" без индекса в SQLite и "Seq Scan" в Postgres.
+Представления, чей GET пишет мимо базы (SIDE_EFFECT_VIEWS), пропускаются.
+"""
+
+import logging
+from typing import Iterator, NamedTuple, Optional
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.urls.converters import IntConverter
+
+URLCONFS = ("music.urls", "users.urls")
+# Модели для параметров URL, которые не совпадают с view.model
+SAMPLE_MODELS = {
+    "artist_id": "music.Artist",
+    "album_id": "music.Album",
+    "track_id": "music.Track",
+}
+# GET этих представлений меняет то, что не откатывается вместе с транзакцией:
+# буфер прослушиваний music.plays, файлы хранилища
+SIDE_EFFECT_VIEWS = frozenset(
+    {
+        "music:stream_audio",
+        "music:stream_audio_async",
+        "music:hls_master",
+        "music:rendition",
+    }
+)
+
+
+class QueryPlan(NamedTuple):
+    sql: str
+    plan: list
+    full_scans: list
+
+
+class ViewAudit(NamedTuple):
+    name: str
+    url: Optional[str]
+    status: Optional[int]
+    queries: list
+    skipped: str = ""
+
+
+def explain(sql: str) -> list:
+    with connection.cursor() as cursor:
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+        rows = cursor.fetchall()
+    if connection.vendor == "sqlite":
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def full_scans(plan: list) -> list:
+    if connection.vendor == "sqlite":
+        return [
+            line
+            for line in plan
+            if line.startswith("SCAN ")
+            and " USING " not in line
+            and "VIRTUAL TABLE" not in line
+            and "CONSTANT ROW" not in line
+        ]
+    return [line.strip() for line in plan if "Seq Scan" in line]
+
+
+def plan_queries(captured: list) -> list:
+    plans = []
+    seen = set()
+    for query in captured:
+        sql = query["sql"]
+        if not sql.lstrip().upper().startswith("SELECT") or sql in seen:
+            continue
+        seen.add(sql)
+        plan = explain(sql)
+        plans.append(QueryPlan(sql, plan, full_scans(plan)))
+    return plans
+
+
+def iter_patterns(urlconf: str, namespace: str = "") -> Iterator[tuple]:
+    for pattern in get_resolver(urlconf).url_patterns:
+        if isinstance(pattern, URLResolver):
+            continue
+        if isinstance(pattern, URLPattern) and pattern.name:
+            yield f"{namespace}{pattern.name}", pattern
+
+
+def sample_kwargs(pattern: URLPattern) -> Optional[dict]:
+    """Параметры URL из последних объектов в базе или None, если подобрать нельзя"""
+    view_class = getattr(pattern.callback, "view_class", None)
+    kwargs = {}
+    for name, converter in getattr(pattern.pattern, "converters", {}).items():
+        if not isinstance(converter, IntConverter):
+            return None
+        model = SAMPLE_MODELS.get(name)
+        model = apps.get_model(model) if model else getattr(view_class, "model", None)
+        if model is None:
+            return None
+        pk = model.objects.order_by("-pk").values_list("pk", flat=True).first()
+        if pk is None:
+            return None
+        kwargs[name] = pk
+    return kwargs
+
+
+def audit_view(client: Client, name: str, pattern: URLPattern) -> ViewAudit:
+    if name in SIDE_EFFECT_VIEWS:
+        return ViewAudit(name, None, None, [], "побочные эффекты")
+    view_class = getattr(pattern.callback, "view_class", None)
+    if view_class is not None and not hasattr(view_class, "get"):
+        return ViewAudit(name, None, None, [], "без GET")
+    kwargs = sample_kwargs(pattern)
+    if kwargs is None:
+        return ViewAudit(name, None, None, [], "нет данных для параметров URL")
+    url = reverse(name, kwargs=kwargs)
+    with CaptureQueriesContext(connection) as captured:
+        # Ответ не закрываем: request_finished закрыл бы соединение внутри транзакции
+        response = client.get(url)
+    return ViewAudit(
+        name, url, response.status_code, plan_queries(captured.captured_queries)
+    )
+
+
+def audit(user=None) -> list:
+    """Обходит GET-представления music.urls и users.urls; все изменения откатываются"""
+    results = []
+    # 403/404 на подставленных объектах — ожидаемы, не засоряем вывод
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        results = audit_urls(user)
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+def audit_urls(user) -> list:
+    results = []
+    with transaction.atomic():
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        for urlconf in URLCONFS:
+            namespace = f"{urlconf.split('.')[0]}:"
+            for name, pattern in iter_patterns(urlconf, namespace):
+                results.append(audit_view(client, name, pattern))
+        transaction.set_rollback(True)
+    return results
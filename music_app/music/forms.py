@@ -2,7 +2,6 @@ from typing import Optional
 
 from django import forms
 from django.core.exceptions import ValidationError
-from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
 from django.forms import ModelForm
 from PIL import Image
@@ -68,11 +67,6 @@ class CreateTrackForm(ModelForm):
         )
         if audio:
             allowed_types: list[str] = ["audio/mpeg", "audio/wav", "audio/ogg"]
-            fs = FileSystemStorage()
-            filename = f"tracks/{audio.name}"
-            saved_name = fs.save(filename, audio)
-            fs.path(saved_name)
-
             if audio.content_type not in allowed_types:
                 raise ValidationError("Файл должен быть в формате MP3, WAV или OGG!")
 
@@ -0,0 +1,228 @@
+"""Адаптивный стриминг: варианты трека по битрейту и плейлисты HLS.
+
+Задача transcode_track режет трек на сегменты по MUSIC_HLS_SEGMENT_SECONDS
+секунд. С ffmpeg (MUSIC_FFMPEG) строится AAC-вариант на каждый битрейт из
+MUSIC_HLS_BITRATES, не выше исходного. Без ffmpeg MP3 режется по границам
+кадров без перекодирования (packed audio, RFC 8216 3.4) — один вариант с
+исходным битрейтом; другие форматы остаются только в progressive-виде.
+
+Сегменты — обычные файлы хранилища (tracks/hls/), плейлисты собираются
+на лету из TrackSegment: master playlist перечисляет варианты от меньшего
+битрейта к большему, плеер стартует с легкого и переключается сам.
+"""
+
+import math
+import os
+import subprocess
+import tempfile
+from typing import Iterator, NamedTuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from mutagen import File as AudioFile
+from mutagen.mp3 import MP3, HeaderNotFoundError
+
+from .analysis import ffmpeg_binary
+from .models import Track, TrackRendition, TrackSegment
+from .seeking import iter_frames
+from .storage import change_references, local_file
+
+AAC_CODECS = "mp4a.40.2"
+MP3_CODECS = "mp4a.40.34"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+ID3_TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp\x00"
+
+
+def get_bitrates() -> tuple:
+    return tuple(getattr(settings, "MUSIC_HLS_BITRATES", (64, 128, 256)))
+
+
+def get_segment_seconds() -> int:
+    return getattr(settings, "MUSIC_HLS_SEGMENT_SECONDS", 6)
+
+
+def syncsafe(value: int) -> bytes:
+    return bytes((value >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def id3_timestamp(seconds: float) -> bytes:
+    """Тег ID3 с PTS начала сегмента: обязателен для packed audio в HLS"""
+    pts = round(seconds * 90000) & ((1 << 33) - 1)
+    data = ID3_TIMESTAMP_OWNER + pts.to_bytes(8, "big")
+    frame = b"PRIV" + syncsafe(len(data)) + b"\x00\x00" + data
+    return b"ID3\x04\x00\x00" + syncsafe(len(frame)) + frame
+
+
+def read_range(fileobj, start: int, end: int) -> bytes:
+    fileobj.seek(start)
+    return fileobj.read(end - start)
+
+
+def segment_mp3(fileobj, seconds: float) -> Iterator[tuple]:
+    """Режет MP3 по границам кадров на куски ~seconds: (байты, длительность).
+
+    В памяти только текущий сегмент: кадры ищет music.seeking.iter_frames.
+    """
+    sample_rate = MP3(fileobj).info.sample_rate
+    start = end = None
+    elapsed = duration = 0.0
+    for pos, length, samples in iter_frames(fileobj, sample_rate):
+        if start is None:
+            start = pos
+        if duration >= seconds:
+            yield id3_timestamp(elapsed) + read_range(fileobj, start, pos), duration
+            elapsed += duration
+            start, duration = pos, 0.0
+        duration += samples / sample_rate
+        end = pos + length
+    if duration:
+        yield id3_timestamp(elapsed) + read_range(fileobj, start, end), duration
+
+
+def parse_media_playlist(path: str) -> list:
+    """(имя файла, длительность) сегментов из плейлиста, записанного ffmpeg"""
+    segments = []
+    duration = None
+    with open(path) as playlist:
+        for line in playlist:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:") :].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((line, duration))
+                duration = None
+    return segments
+
+
+def transcode(ffmpeg: str, source: str, bitrate: int, workdir: str) -> Iterator[tuple]:
+    """AAC-вариант с битрейтом bitrate в сегментах MPEG-TS: (байты, длительность)"""
+    playlist = os.path.join(workdir, "index.m3u8")
+    command = [ffmpeg, "-nostdin", "-v", "error", "-y", "-i", source, "-vn"]
+    command += ["-map", "0:a:0", "-c:a", "aac", "-b:a", f"{bitrate}k", "-ac", "2"]
+    command += ["-f", "hls", "-hls_time", str(get_segment_seconds())]
+    command += ["-hls_playlist_type", "vod"]
+    command += ["-hls_segment_filename", os.path.join(workdir, "%05d.ts"), playlist]
+    subprocess.run(command, check=True, capture_output=True, timeout=15 * 60)
+    for filename, duration in parse_media_playlist(playlist):
+        with open(os.path.join(workdir, filename), "rb") as segment:
+            yield segment.read(), duration
+
+
+class PreparedRendition(NamedTuple):
+    bitrate: int
+    codecs: str
+    bandwidth: int
+    # (имя файла в хранилище, длительность) по порядку
+    segments: list
+
+
+def store_segments(
+    bitrate: int, codecs: str, extension: str, segments: Iterator
+) -> PreparedRendition:
+    """Сохраняет сегменты в хранилище вне транзакции.
+
+    Файл без ссылок (упавшая или откатившаяся сборка) заберет gc_media.
+    """
+    field = TrackSegment._meta.get_field("file")
+    stored = []
+    bandwidth = 0
+    for number, (data, duration) in enumerate(segments):
+        name = field.generate_filename(None, f"{number}.{extension}")
+        stored.append((field.storage.save(name, ContentFile(data)), duration))
+        bandwidth = max(bandwidth, math.ceil(len(data) * 8 / duration))
+    return PreparedRendition(bitrate, codecs, bandwidth, stored)
+
+
+def save_rendition(track: Track, prepared: PreparedRendition) -> TrackRendition:
+    rendition = TrackRendition.objects.create(
+        track=track,
+        bitrate=prepared.bitrate,
+        bandwidth=prepared.bandwidth,
+        codecs=prepared.codecs,
+    )
+    rows = [
+        TrackSegment(rendition=rendition, number=number, duration=duration, file=name)
+        for number, (name, duration) in enumerate(prepared.segments)
+    ]
+    # bulk_create не шлет сигналы: ссылки на файлы считаем сами
+    TrackSegment.objects.bulk_create(rows)
+    change_references([name for name, _ in prepared.segments], +1)
+    return rendition
+
+
+def package(track: Track) -> list:
+    """Пересобирает HLS-варианты трека; пустой список — сегментировать нечем.
+
+    Перекодирование и запись сегментов идут вне транзакции (ffmpeg работает
+    минутами), в транзакции только замена строк TrackRendition.
+    """
+    ffmpeg = ffmpeg_binary()
+    if ffmpeg is None:
+        prepared = package_mp3(track)
+    else:
+        prepared = package_ffmpeg(track, ffmpeg)
+    with transaction.atomic():
+        TrackRendition.objects.filter(track=track).delete()
+        return [save_rendition(track, rendition) for rendition in prepared]
+
+
+def package_mp3(track: Track) -> list:
+    with track.audio_file.open("rb") as audio:
+        try:
+            bitrate = MP3(audio).info.bitrate // 1000
+        except HeaderNotFoundError:
+            return []
+        segments = segment_mp3(audio, get_segment_seconds())
+        return [store_segments(bitrate, MP3_CODECS, "mp3", segments)]
+
+
+def package_ffmpeg(track: Track, ffmpeg: str) -> list:
+    with local_file(track.audio_file) as source:
+        return transcode_all(ffmpeg, source)
+
+
+def transcode_all(ffmpeg: str, source: str) -> list:
+    with tempfile.TemporaryDirectory() as workdir:
+        info = AudioFile(source)
+        source_bitrate = info.info.bitrate // 1000 if info and info.info.bitrate else 0
+        # Выше исходного битрейта кодировать бессмысленно
+        bitrates = [
+            bitrate
+            for bitrate in get_bitrates()
+            if not source_bitrate or bitrate <= source_bitrate
+        ]
+        prepared = []
+        for bitrate in bitrates or get_bitrates()[:1]:
+            output = os.path.join(workdir, str(bitrate))
+            os.mkdir(output)
+            segments = transcode(ffmpeg, source, bitrate, output)
+            prepared.append(store_segments(bitrate, AAC_CODECS, "ts", segments))
+        return prepared
+
+
+def master_playlist(renditions: list, playlist_url) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for rendition in renditions:
+        lines.append(
+            f"#EXT-X-STREAM-INF:BANDWIDTH={rendition.bandwidth},"
+            f'AVERAGE-BANDWIDTH={rendition.bitrate * 1000},CODECS="{rendition.codecs}"'
+        )
+        lines.append(playlist_url(rendition))
+    return "\n".join(lines) + "\n"
+
+
+def media_playlist(segments: list, segment_url) -> str:
+    target = max((math.ceil(segment.duration) for segment in segments), default=0)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for segment in segments:
+        lines.append(f"#EXTINF:{segment.duration:.3f},")
+        lines.append(segment_url(segment))
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
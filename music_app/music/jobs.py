@@ -0,0 +1,119 @@
+"""Очередь фоновых задач в базе данных, без внешнего брокера.
+
+Задачи регистрируются декоратором @task, ставятся в очередь через enqueue()
+и выполняются командой manage.py run_jobs. Захват задачи — условный UPDATE,
+поэтому несколько воркеров не выполнят одну задачу дважды ни в SQLite,
+ни в Postgres. Итог задачи пишется тем же условным UPDATE: если задачу после
+LOCK_TIMEOUT забрал другой воркер, результат первого отбрасывается.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS: dict = {}
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(seconds=30)
+# Задача в статусе running дольше этого считается брошенной упавшим воркером.
+# Больше самого долгого обработчика: ffmpeg в music.hls ограничен 15 минутами
+LOCK_TIMEOUT = timedelta(minutes=30)
+
+
+def task(name: str, on_failure: Optional[Callable] = None):
+    """Регистрирует функцию как задачу; on_failure вызывается после последней попытки"""
+
+    def decorator(func: Callable) -> Callable:
+        TASKS[name] = (func, on_failure)
+        return func
+
+    return decorator
+
+
+def enqueue(name: str, **payload) -> Job:
+    if name not in TASKS:
+        raise KeyError(f"Unknown job {name!r}")
+    job = Job.objects.create(name=name, payload=payload)
+    if getattr(settings, "MUSIC_JOBS_EAGER", False):
+        transaction.on_commit(lambda: run_job(job))
+    return job
+
+
+def enqueue_many(name: str, payloads: list) -> list:
+    """enqueue() для пачки задач одним INSERT"""
+    if name not in TASKS:
+        raise KeyError(f"Unknown job {name!r}")
+    jobs = Job.objects.bulk_create(
+        Job(name=name, payload=payload) for payload in payloads
+    )
+    if getattr(settings, "MUSIC_JOBS_EAGER", False):
+        for job in jobs:
+            transaction.on_commit(lambda job=job: run_job(job))
+    return jobs
+
+
+def claim_next() -> Optional[Job]:
+    """Забирает следующую готовую задачу или возвращает None"""
+    now = timezone.now()
+    ready = Q(status=Job.Status.QUEUED, run_after__lte=now) | Q(
+        status=Job.Status.RUNNING, locked_at__lt=now - LOCK_TIMEOUT
+    )
+    for job in Job.objects.filter(ready).order_by("run_after")[:10]:
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, locked_at=job.locked_at
+        ).update(status=Job.Status.RUNNING, locked_at=now)
+        if claimed:
+            job.status, job.locked_at = Job.Status.RUNNING, now
+            return job
+    return None
+
+
+def save_result(held, job: Job, fields: list) -> bool:
+    """Пишет итог, если задачу не перехватил другой воркер после LOCK_TIMEOUT"""
+    if held.update(**{field: getattr(job, field) for field in fields}):
+        return True
+    logger.warning("Job %s was claimed again, result discarded", job)
+    return False
+
+
+def run_job(job: Job) -> bool:
+    func, on_failure = TASKS[job.name]
+    held = Job.objects.filter(pk=job.pk, status=job.status, locked_at=job.locked_at)
+    job.attempts += 1
+    try:
+        func(**job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        logger.exception("Job %s failed (attempt %s)", job, job.attempts)
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = Job.Status.FAILED
+        else:
+            job.status = Job.Status.QUEUED
+            job.run_after = timezone.now() + RETRY_DELAY * job.attempts
+        saved = save_result(held, job, ["attempts", "error", "status", "run_after"])
+        if saved and job.status == Job.Status.FAILED and on_failure is not None:
+            on_failure(**job.payload)
+        return False
+    job.status = Job.Status.DONE
+    return save_result(held, job, ["attempts", "status"])
+
+
+def run_pending(limit: Optional[int] = None) -> int:
+    """Выполняет готовые задачи, возвращает число выполненных"""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
@@ -0,0 +1,205 @@
+"""Кэш лайков: id плейлиста "Мне нравится" и множество id треков на пользователя.
+
+По умолчанию кэш живет в памяти процесса: LRU на MUSIC_LIKES_CACHE_SIZE
+пользователей, запись живет MUSIC_LIKES_CACHE_TIMEOUT секунд — столько
+другой воркер может не видеть новый лайк. MUSIC_LIKES_CACHE — алиас общего
+кэша Django (redis/memcached): в нем like и unlike удаляют запись, а не
+переписывают ее, потому что атомарного чтения-записи у кэша Django нет, и
+следующее чтение берет лайки из базы. При попадании в кэш unlike — одна
+запись в базу без чтений; like дополнительно проверяет дубликат по базе под
+блокировкой.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Playlist, PlaylistTrack
+
+
+class LikedEntry(NamedTuple):
+    playlist_id: Optional[int]
+    track_ids: frozenset
+
+
+class LRUCache:
+    def __init__(self, maxsize: int, timeout: float):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        # ключ -> (момент устаревания по time.monotonic, значение)
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        """Живое значение или None; вызывается под self.lock"""
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return item[1]
+
+    def get(self, key):
+        with self.lock:
+            return self.lookup(key)
+
+    def set(self, key, value) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def update(self, key, change) -> None:
+        """Заменяет живое значение на change(значение) атомарно для процесса"""
+        with self.lock:
+            value = self.lookup(key)
+            if value is not None:
+                self.entries[key] = (self.entries[key][0], change(value))
+
+    def delete(self, key) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LRUCache(
+    getattr(settings, "MUSIC_LIKES_CACHE_SIZE", 10000),
+    getattr(settings, "MUSIC_LIKES_CACHE_TIMEOUT", 60),
+)
+
+
+def shared_cache():
+    alias = getattr(settings, "MUSIC_LIKES_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def cache_key(user_id: int) -> str:
+    return f"music:likes:{user_id}"
+
+
+def load_entry(user_id: int) -> LikedEntry:
+    playlist_id = (
+        Playlist.objects.filter(owner_id=user_id, is_liked_playlist=True)
+        .values_list("pk", flat=True)
+        .first()
+    )
+    track_ids = frozenset()
+    if playlist_id is not None:
+        track_ids = frozenset(
+            PlaylistTrack.objects.filter(playlist_id=playlist_id).values_list(
+                "track_id", flat=True
+            )
+        )
+    return LikedEntry(playlist_id, track_ids)
+
+
+def store_entry(user_id: int, entry: LikedEntry) -> None:
+    cache = shared_cache()
+    if cache is not None:
+        cache.set(cache_key(user_id), entry, timeout=None)
+    else:
+        local_cache.set(user_id, entry)
+
+
+def get_entry(user_id: int) -> LikedEntry:
+    cache = shared_cache()
+    if cache is not None:
+        entry = cache.get(cache_key(user_id))
+    else:
+        entry = local_cache.get(user_id)
+    if entry is None:
+        entry = load_entry(user_id)
+        store_entry(user_id, entry)
+    return entry
+
+
+def change_entry(user_id: int, change) -> None:
+    """Применяет change к записи кэша после записи в базу"""
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(cache_key(user_id))
+    else:
+        local_cache.update(user_id, change)
+
+
+def invalidate(user_id: int) -> None:
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(cache_key(user_id))
+    local_cache.delete(user_id)
+
+
+def clear() -> None:
+    local_cache.clear()
+
+
+def liked_track_ids(user) -> frozenset:
+    if not user.is_authenticated:
+        return frozenset()
+    return get_entry(user.pk).track_ids
+
+
+def is_liked(user, track_id: int) -> bool:
+    return track_id in liked_track_ids(user)
+
+
+def liked_among(user, track_ids: Iterable[int]) -> set:
+    """Какие из track_ids пользователь лайкнул"""
+    return liked_track_ids(user).intersection(track_ids)
+
+
+def get_liked_playlist_id(user) -> int:
+    entry = get_entry(user.pk)
+    if entry.playlist_id is not None:
+        return entry.playlist_id
+    playlist, _ = Playlist.objects.get_or_create(
+        owner=user,
+        is_liked_playlist=True,
+        defaults={"title": "favorite", "image": "playlists_images/favorite.jpg"},
+    )
+    change_entry(user.pk, lambda entry: entry._replace(playlist_id=playlist.pk))
+    return playlist.pk
+
+
+def like(user, track_id: int) -> None:
+    playlist_id = get_liked_playlist_id(user)
+    entry = get_entry(user.pk)
+    if track_id in entry.track_ids:
+        return
+    with transaction.atomic():
+        # Кэш другого воркера или двойной клик могут не знать о лайке: проверяем
+        # по базе под блокировкой плейлиста (в SQLite запись и так одна)
+        Playlist.objects.select_for_update().filter(pk=playlist_id).exists()
+        rows = PlaylistTrack.objects.filter(playlist_id=playlist_id, track_id=track_id)
+        if not rows.exists():
+            PlaylistTrack.objects.create(
+                playlist_id=playlist_id,
+                track_id=track_id,
+                position=PlaylistTrack.next_position(playlist_id),
+            )
+    change_entry(
+        user.pk, lambda entry: entry._replace(track_ids=entry.track_ids | {track_id})
+    )
+
+
+def unlike(user, track_id: int) -> None:
+    entry = get_entry(user.pk)
+    if entry.playlist_id is None:
+        return
+    PlaylistTrack.objects.filter(
+        playlist_id=entry.playlist_id, track_id=track_id
+    ).delete()
+    change_entry(
+        user.pk, lambda entry: entry._replace(track_ids=entry.track_ids - {track_id})
+    )
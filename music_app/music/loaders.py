@@ -0,0 +1,187 @@
+"""Загрузчики на время запроса: связи строк пачками вместо запроса на строку.
+
+DataLoader собирает ключи (load), а при первом обращении к значению
+(Deferred.get) или в load_many выбирает все накопленные ключи одним
+запросом; повторные ключи берутся из кэша загрузчика. attach() раскладывает
+загруженные объекты в кэш ForeignKey, поэтому track.artist.name в шаблоне
+не делает запросов. Плейлист из 500 треков 200 артистов — три запроса:
+id треков плейлиста, треки и артисты.
+
+Загрузчики живут в request.loaders (DataLoaderMiddleware, работает и под
+ASGI без перехода в поток) и запоминают размеры пачек; после ответа они
+пишутся в лог music.loaders.
+"""
+
+import logging
+from typing import Callable, Hashable, Iterable, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .models import PlaylistTrack, Track
+
+logger = logging.getLogger(__name__)
+
+
+class DataLoader:
+    def __init__(self, batch_load: Callable):
+        # batch_load(список ключей) -> {ключ: значение}; нет ключа — None
+        self.batch_load = batch_load
+        self.cache: dict = {}
+        self.pending: dict = {}
+        self.batches: list = []
+        self.hits = 0
+
+    def prime(self, key: Hashable, value) -> None:
+        self.cache.setdefault(key, value)
+
+    def load(self, key: Hashable) -> "Deferred":
+        """Откладывает ключ до ближайшей выборки"""
+        if key in self.cache:
+            self.hits += 1
+        else:
+            self.pending[key] = None
+        return Deferred(self, key)
+
+    def load_many(self, keys: Iterable[Hashable]) -> list:
+        deferred = [self.load(key) for key in keys]
+        self.dispatch()
+        return [item.get() for item in deferred]
+
+    def dispatch(self) -> None:
+        keys = [key for key in self.pending if key not in self.cache]
+        self.pending.clear()
+        if not keys:
+            return
+        self.batches.append(len(keys))
+        values = self.batch_load(keys)
+        for key in keys:
+            self.cache[key] = values.get(key)
+
+
+class Deferred:
+    def __init__(self, loader: DataLoader, key: Hashable):
+        self.loader = loader
+        self.key = key
+
+    def get(self):
+        if self.key not in self.loader.cache:
+            self.loader.dispatch()
+        return self.loader.cache[self.key]
+
+
+def playlist_track_ids(playlist_ids: list) -> dict:
+    """id треков плейлистов в порядке плейлиста"""
+    tracks = {pk: [] for pk in playlist_ids}
+    rows = PlaylistTrack.objects.filter(playlist_id__in=playlist_ids).order_by(
+        "position", "id"
+    )
+    for playlist_id, track_id in rows.values_list("playlist_id", "track_id"):
+        tracks[playlist_id].append(track_id)
+    return tracks
+
+
+def album_track_ids(album_ids: list) -> dict:
+    tracks = {pk: [] for pk in album_ids}
+    rows = Track.objects.filter(album_id__in=album_ids).order_by("id")
+    for album_id, track_id in rows.values_list("album_id", "id"):
+        tracks[album_id].append(track_id)
+    return tracks
+
+
+class Loaders:
+    """Набор загрузчиков одного запроса"""
+
+    def __init__(self):
+        self.loaders: dict = {}
+
+    def get(self, name: str, batch_load: Callable) -> DataLoader:
+        if name not in self.loaders:
+            self.loaders[name] = DataLoader(batch_load)
+        return self.loaders[name]
+
+    def model(self, model) -> DataLoader:
+        return self.get(model._meta.label_lower, model._default_manager.in_bulk)
+
+    def batch(self, batch_load: Callable) -> DataLoader:
+        """Загрузчик для функции модуля; имя в статистике — имя функции"""
+        return self.get(batch_load.__name__, batch_load)
+
+    @property
+    def playlist_track_ids(self) -> DataLoader:
+        return self.batch(playlist_track_ids)
+
+    @property
+    def album_track_ids(self) -> DataLoader:
+        return self.batch(album_track_ids)
+
+    def attach(self, objects: list, name: str) -> list:
+        """Заполняет ForeignKey name у objects одной выборкой связанных строк"""
+        if not objects:
+            return objects
+        field = objects[0]._meta.get_field(name)
+        loader = self.model(field.related_model)
+        for obj in objects:
+            if field.is_cached(obj):
+                related = field.get_cached_value(obj)
+                if related is not None:
+                    loader.prime(related.pk, related)
+        missing = [
+            obj
+            for obj in objects
+            if not field.is_cached(obj) and getattr(obj, field.attname) is not None
+        ]
+        values = loader.load_many(getattr(obj, field.attname) for obj in missing)
+        for obj, value in zip(missing, values):
+            field.set_cached_value(obj, value)
+        return objects
+
+    def stats(self) -> dict:
+        """{имя: {"batches": [размеры пачек], "hits": попаданий в кэш}}"""
+        return {
+            name: {"batches": loader.batches, "hits": loader.hits}
+            for name, loader in self.loaders.items()
+        }
+
+
+def get_loaders(request) -> Loaders:
+    """request.loaders; без middleware (тесты, команды) создается на месте"""
+    loaders: Optional[Loaders] = getattr(request, "loaders", None)
+    if loaders is None:
+        loaders = request.loaders = Loaders()
+    return loaders
+
+
+class DataLoaderMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request.loaders = Loaders()
+        response = self.get_response(request)
+        self.log(request)
+        return response
+
+    async def __acall__(self, request):
+        request.loaders = Loaders()
+        response = await self.get_response(request)
+        self.log(request)
+        return response
+
+    def log(self, request) -> None:
+        stats = request.loaders.stats()
+        if stats:
+            logger.debug(
+                "%s %s loaders %s",
+                request.method,
+                request.path,
+                stats,
+                extra={"loaders": stats},
+            )
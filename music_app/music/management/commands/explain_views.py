@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from users.models import User
+
+from music.explain import audit
+
+
+class Command(BaseCommand):
+    help = "Выполняет EXPLAIN для запросов GET-представлений и ищет полные сканирования"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Выполнять запросы от имени пользователя")
+        parser.add_argument(
+            "--verbose-plans", action="store_true", help="Печатать планы всех запросов"
+        )
+        parser.add_argument(
+            "--fail-on-scan",
+            action="store_true",
+            help="Завершиться с ошибкой, если найдено полное сканирование",
+        )
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Пользователь {options['user']} не найден")
+
+        # Тестовое окружение: testserver в ALLOWED_HOSTS и сбор контекста шаблонов
+        setup_test_environment()
+        try:
+            results = audit(user)
+        finally:
+            teardown_test_environment()
+
+        scans = 0
+        for view in results:
+            if view.skipped:
+                self.stdout.write(f"{view.name}: пропущено ({view.skipped})")
+                continue
+            flagged = [query for query in view.queries if query.full_scans]
+            scans += len(flagged)
+            self.stdout.write(
+                f"{view.name} {view.url} -> {view.status}: "
+                f"запросов {len(view.queries)}, полных сканирований {len(flagged)}"
+            )
+            for query in view.queries:
+                if not (query.full_scans or options["verbose_plans"]):
+                    continue
+                self.stdout.write(f"    {query.sql}")
+                for line in query.plan:
+                    style = self.style.WARNING if line in query.full_scans else str
+                    self.stdout.write(style(f"        {line}"))
+
+        self.stdout.write(f"Всего запросов с полным сканированием: {scans}")
+        if scans and options["fail_on_scan"]:
+            raise CommandError("Найдены полные сканирования")
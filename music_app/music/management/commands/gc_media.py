@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from music.storage import collect_garbage, migrate_legacy_files
+
+
+class Command(BaseCommand):
+    help = "Удаляет медиафайлы, на которые не ссылается ни одна модель"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=1.0,
+            help="Не трогать файлы, потерявшие ссылки позже этого срока",
+        )
+        parser.add_argument(
+            "--migrate-legacy",
+            action="store_true",
+            help="Сначала перенести старые файлы в контентно-адресуемую схему",
+        )
+
+    def handle(self, *args, **options):
+        if options["migrate_legacy"]:
+            updated = migrate_legacy_files(dry_run=options["dry_run"])
+            self.stdout.write(f"Перенесено ссылок на старые файлы: {updated}")
+
+        deleted = collect_garbage(
+            grace=timedelta(hours=options["grace_hours"]), dry_run=options["dry_run"]
+        )
+        for name in deleted:
+            self.stdout.write(name)
+        self.stdout.write(f"Удалено файлов без ссылок: {len(deleted)}")
@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music.catalog import import_catalog
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Импортирует каталог лейбла из папки с аудиофайлами или manifest.csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Папка или CSV с колонками path,title,...")
+        parser.add_argument("--label", required=True, help="Имя пользователя лейбла")
+        parser.add_argument(
+            "--checkpoint",
+            help="Файл с импортированными путями (по умолчанию <source>.checkpoint)",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.exists(source):
+            raise CommandError(f"Нет такого файла или папки: {source}")
+        label = User.objects.filter(username=options["label"], is_label=True).first()
+        if label is None:
+            raise CommandError(f"Лейбл {options['label']} не найден")
+        checkpoint = options["checkpoint"] or source.rstrip("/\\") + ".checkpoint"
+
+        def progress(importer):
+            self.stdout.write(
+                f"Треков: {importer.counts['tracks']}, ошибок: {len(importer.errors)}"
+            )
+
+        importer = import_catalog(
+            source,
+            label,
+            checkpoint,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        for key, error in importer.errors:
+            self.stderr.write(f"{key}: {error}")
+        counts = importer.counts
+        self.stdout.write(
+            f"Импортировано треков: {counts['tracks']}, новых артистов: "
+            f"{counts['artists']}, альбомов: {counts['albums']}, "
+            f"уже были: {counts['skipped']}, ошибок: {len(importer.errors)}"
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from music import recommendations
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает похожие треки по совместным плейлистам"
+
+    def handle(self, *args, **options):
+        count = recommendations.rebuild()
+        self.stdout.write(f"Соседи посчитаны для {count} треков")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from music import search
+
+
+class Command(BaseCommand):
+    help = "Строит поисковый индекс music_search заново"
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError(f"Поиск не поддерживается для {connection.vendor}")
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write("Поисковый индекс перестроен")
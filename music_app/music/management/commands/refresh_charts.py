@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from music.charts import refresh
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает чарты главной страницы и публикует их в кэш"
+
+    def handle(self, *args, **options):
+        charts = refresh()
+        self.stdout.write(f"Опубликована версия чартов {charts['version']}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from music import plays
+
+
+class Command(BaseCommand):
+    help = "Убирает из счетчиков прослушиваний дни, выпавшие из 30-дневного окна"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Пересчитать счетчики заново по суточным корзинам",
+        )
+
+    def handle(self, *args, **options):
+        expired = plays.expire()
+        self.stdout.write(f"Удалено устаревших корзин: {expired}")
+        if options["rebuild"]:
+            plays.rebuild()
+            self.stdout.write("Счетчики пересчитаны")
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from music.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые задачи из очереди music.Job"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Выполнить готовые задачи и выйти"
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=1.0, help="Пауза при пустой очереди, с"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            done = run_pending()
+            if done:
+                self.stdout.write(f"Выполнено задач: {done}")
+            if options["once"]:
+                return
+            if not done:
+                time.sleep(options["sleep"])
@@ -0,0 +1,318 @@
+"""Метрики запросов: число и время SQL, рендер шаблонов, отданные байты.
+
+Каждое соединение при открытии получает обертку execute_wrapper (connect()),
+которая пишет SQL в статистику текущего запроса из ContextVar — контекст
+переносится и в потоки sync_to_async, поэтому MetricsMiddleware работает в
+синхронном и асинхронном стеке. Статистика копится по имени представления
+(view_name из URL): число запросов, время
+ответа (гистограмма), время в базе и в шаблонах (бэкенд DjangoTemplates
+этого модуля), байты ответа и пачки загрузчиков (music.loaders). Метрики
+отдает music:metrics в текстовом формате Prometheus — только с заголовком
+Authorization: Bearer <MUSIC_METRICS_TOKEN>; без токена адрес отключен.
+Адрес клиента не проверяется: за nginx все запросы приходят с 127.0.0.1.
+
+Запросы дольше MUSIC_SLOW_REQUEST_MS пишутся в лог music.metrics одной
+JSON-строкой с самыми долгими SQL. Счетчики живут в памяти процесса: при
+нескольких воркерах Prometheus опрашивает каждый из них.
+"""
+
+import hmac
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_QUERIES = 5
+# Больше SQL одного запроса не запоминаем: для отчета хватит самых долгих
+MAX_RECORDED_QUERIES = 1000
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS = {
+    "music_requests_total": ("counter", "Ответы по представлению и статусу"),
+    "music_request_duration_seconds": ("histogram", "Время ответа"),
+    "music_db_queries_total": ("counter", "SQL-запросы"),
+    "music_db_duration_seconds_total": ("counter", "Время в базе"),
+    "music_template_duration_seconds_total": ("counter", "Время рендера шаблонов"),
+    "music_response_bytes_total": ("counter", "Отданные байты тела ответа"),
+    "music_loader_batches_total": ("counter", "Выборки загрузчиков music.loaders"),
+    "music_loader_keys_total": ("counter", "Ключи в выборках загрузчиков"),
+}
+
+
+def get_slow_request_ms() -> int:
+    return getattr(settings, "MUSIC_SLOW_REQUEST_MS", 500)
+
+
+def get_token() -> str:
+    return getattr(settings, "MUSIC_METRICS_TOKEN", "")
+
+
+def is_authorized(request) -> bool:
+    token = get_token()
+    if not token:
+        return False
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        credentials.strip().encode(), token.encode()
+    )
+
+
+class Registry:
+    """Счетчики и гистограммы процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict = {}
+        self.histograms: dict = {}
+
+    def inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        with self.lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        with self.lock:
+            key = (name, labels)
+            buckets = self.histograms.setdefault(
+                key, [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            )
+            buckets[bisect_left(DURATION_BUCKETS, value)] += 1
+            buckets[-1] += value
+
+    def get(self, name: str, labels: tuple) -> float:
+        return self.counters.get((name, labels), 0)
+
+    def render(self) -> str:
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(buckets)) for key, buckets in self.histograms.items()
+            )
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in counters:
+                if metric == name:
+                    value = format_value(value)
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            for (metric, labels), buckets in histograms:
+                if metric == name:
+                    lines.extend(histogram_lines(name, labels, buckets))
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape(str(value))}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def histogram_lines(name: str, labels: tuple, buckets: list) -> list:
+    lines = []
+    total = 0
+    for bound, count in zip(DURATION_BUCKETS + ("+Inf",), buckets):
+        total += count
+        bucket_labels = format_labels(labels + (("le", bound),))
+        lines.append(f"{name}_bucket{bucket_labels} {total}")
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(buckets[-1])}")
+    lines.append(f"{name}_count{format_labels(labels)} {total}")
+    return lines
+
+
+registry = Registry()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.sql: list = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper"""
+        began = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - began
+            self.queries += 1
+            self.db_seconds += elapsed
+            if len(self.sql) < MAX_RECORDED_QUERIES:
+                self.sql.append((elapsed, sql))
+
+    def slowest(self) -> list:
+        return sorted(self.sql, key=lambda item: item[0], reverse=True)[:SLOW_QUERIES]
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "music_request_stats", default=None
+)
+
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        began = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats = current_stats.get()
+            if stats is not None:
+                stats.template_seconds += time.perf_counter() - began
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """Стандартный бэкенд, который засекает время рендера для метрик"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def count_bytes(content, labels: tuple):
+    for chunk in content:
+        registry.inc("music_response_bytes_total", labels, len(chunk))
+        yield chunk
+
+
+async def acount_bytes(content, labels: tuple):
+    async for chunk in content:
+        registry.inc("music_response_bytes_total", labels, len(chunk))
+        yield chunk
+
+
+def record_body(response, labels: tuple) -> None:
+    """Байты тела; файл через sendfile считается по Content-Length.
+
+    При X-Accel-Redirect тело отдает nginx, здесь оно не учитывается.
+    """
+    if not response.streaming:
+        registry.inc("music_response_bytes_total", labels, len(response.content))
+    elif response.has_header("Content-Length"):
+        length = int(response["Content-Length"])
+        registry.inc("music_response_bytes_total", labels, length)
+    elif response.is_async:
+        response.streaming_content = acount_bytes(response.streaming_content, labels)
+    else:
+        response.streaming_content = count_bytes(response.streaming_content, labels)
+
+
+def view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unresolved"
+
+
+def record(request, response, stats: RequestStats, elapsed: float) -> None:
+    view = view_name(request)
+    labels = (("view", view),)
+    registry.inc(
+        "music_requests_total",
+        labels + (("method", request.method), ("status", response.status_code)),
+    )
+    registry.observe("music_request_duration_seconds", labels, elapsed)
+    registry.inc("music_db_queries_total", labels, stats.queries)
+    registry.inc("music_db_duration_seconds_total", labels, stats.db_seconds)
+    registry.inc(
+        "music_template_duration_seconds_total", labels, stats.template_seconds
+    )
+    loaders = getattr(request, "loaders", None)
+    if loaders is not None:
+        for loader in loaders.stats().values():
+            registry.inc("music_loader_batches_total", labels, len(loader["batches"]))
+            registry.inc("music_loader_keys_total", labels, sum(loader["batches"]))
+    record_body(response, labels)
+
+    if elapsed * 1000 >= get_slow_request_ms():
+        sample = {
+            "view": view,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "ms": round(elapsed * 1000, 1),
+            "queries": stats.queries,
+            "db_ms": round(stats.db_seconds * 1000, 1),
+            "template_ms": round(stats.template_seconds * 1000, 1),
+            "slowest_sql": [
+                {"ms": round(seconds * 1000, 2), "sql": sql}
+                for seconds, sql in stats.slowest()
+            ],
+        }
+        logger.warning("slow request %s", json.dumps(sample, ensure_ascii=False))
+
+
+def measure(execute, sql, params, many, context):
+    """Постоянная обертка соединения: считает SQL, если идет запрос"""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    if measure not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, measure)
+
+
+def connect() -> None:
+    connection_created.connect(
+        install_wrapper, dispatch_uid="music.metrics.install_wrapper"
+    )
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        record(request, response, stats, time.perf_counter() - began)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        record(request, response, stats, time.perf_counter() - began)
+        return response
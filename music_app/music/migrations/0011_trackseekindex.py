@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0010_playlist_is_liked_playlist_alter_playlist_title_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackSeekIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.FloatField()),
+                ('offsets', models.BinaryField()),
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='seek_index', to='music.track')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('music', '0011_trackseekindex'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Расхождение модели Playlist с 0010 (unique у title и порядок
+    # unique_together); уникальность title снимает 0021_query_audit_indexes
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='playlist',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='playlist',
+            name='title',
+            field=models.CharField(default='favorite', max_length=128, unique=True, verbose_name='Мне нравится'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playlist',
+            unique_together={('owner', 'is_liked_playlist', 'title')},
+        ),
+    ]
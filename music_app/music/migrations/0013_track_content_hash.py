@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0012_playlist_liked_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
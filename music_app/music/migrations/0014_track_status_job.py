@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0013_track_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Обрабатывается'), ('ready', 'Готов'), ('failed', 'Ошибка обработки')], default='ready', max_length=16),
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='music_job_status_aac138_idx')],
+            },
+        ),
+    ]
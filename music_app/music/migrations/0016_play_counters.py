@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0015_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='month_plays',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='month_listeners',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.CreateModel(
+            name='TrackPlayDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('plays', models.PositiveIntegerField(default=0)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.track')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='music_track_day_2eb86f_idx')],
+                'unique_together': {('track', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# SQL зафиксирован на момент миграции: music.search может меняться дальше
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS music_search USING fts5("
+    "title, subtitle, kind UNINDEXED, object_id UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+]
+POSTGRES_DDL = [
+    "CREATE TABLE IF NOT EXISTS music_search ("
+    "id bigint PRIMARY KEY, title text NOT NULL, subtitle text NOT NULL, "
+    "kind varchar(16) NOT NULL, object_id bigint NOT NULL, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', subtitle), 'B')) STORED)",
+    "CREATE INDEX IF NOT EXISTS music_search_document "
+    "ON music_search USING gin (document)",
+]
+# Ключ строки — object_id * 4 + номер типа (artist, album, track, playlist)
+SOURCES = [
+    "SELECT a.id * 4 + 0, a.name, '', 'artist', a.id FROM music_artist a",
+    "SELECT a.id * 4 + 1, a.title, ar.name, 'album', a.id "
+    "FROM music_album a JOIN music_artist ar ON ar.id = a.artist_id",
+    "SELECT a.id * 4 + 2, a.title, ar.name, 'track', a.id "
+    "FROM music_track a JOIN music_artist ar ON ar.id = a.artist_id "
+    "WHERE a.status = 'ready'",
+    "SELECT a.id * 4 + 3, a.title, u.username, 'playlist', a.id "
+    "FROM music_playlist a JOIN users_user u ON u.id = a.owner_id "
+    "WHERE a.is_public AND NOT a.is_liked_playlist",
+]
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ("sqlite", "postgresql"):
+        return
+    sqlite = connection.vendor == "sqlite"
+    key = "rowid" if sqlite else "id"
+    with connection.cursor() as cursor:
+        for statement in SQLITE_DDL if sqlite else POSTGRES_DDL:
+            cursor.execute(statement)
+        cursor.execute("DELETE FROM music_search")
+        for source in SOURCES:
+            cursor.execute(
+                f"INSERT INTO music_search ({key}, title, subtitle, kind, object_id) "
+                + source
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor in ("sqlite", "postgresql"):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS music_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0017_chartsnapshot"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0018_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['artist', 'id'], name='album_artist_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['owner', 'id'], name='playlist_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['artist', 'id'], name='track_artist_id_idx'),
+        ),
+        # Автоматическая M2M-таблица: страницы треков плейлиста по порядку добавления
+        migrations.RunSQL(
+            "CREATE INDEX playlist_tracks_playlist_id_idx "
+            "ON music_playlist_tracks (playlist_id, id)",
+            "DROP INDEX playlist_tracks_playlist_id_idx",
+        ),
+    ]
@@ -0,0 +1,90 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+STEP = 1 << 16
+
+
+def number_entries(apps, schema_editor):
+    # Существующий порядок — порядок добавления
+    PlaylistTrack = apps.get_model("music", "PlaylistTrack")
+    PlaylistTrack.objects.update(position=models.F("id") * STEP)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0019_keyset_indexes"),
+    ]
+
+    operations = [
+        # Индекс из 0018 заменяется индексом по position
+        migrations.RunSQL(
+            "DROP INDEX IF EXISTS playlist_tracks_playlist_id_idx",
+            "CREATE INDEX playlist_tracks_playlist_id_idx "
+            "ON music_playlist_tracks (playlist_id, id)",
+        ),
+        # Автоматическая M2M-таблица становится явной моделью без изменений в базе
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="PlaylistTrack",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "playlist",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="music.playlist",
+                            ),
+                        ),
+                        (
+                            "track",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                to="music.track",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "db_table": "music_playlist_tracks",
+                        "unique_together": {("playlist", "track")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="playlist",
+                    name="tracks",
+                    field=models.ManyToManyField(
+                        through="music.PlaylistTrack", to="music.track"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="playlisttrack",
+            name="position",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="playlisttrack",
+            name="added_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(number_entries, migrations.RunPython.noop),
+        # Один трек может стоять в плейлисте несколько раз
+        migrations.AlterUniqueTogether(name="playlisttrack", unique_together=set()),
+        migrations.AddIndex(
+            model_name="playlisttrack",
+            index=models.Index(
+                fields=["playlist", "position", "id"], name="playlist_track_order_idx"
+            ),
+        ),
+    ]
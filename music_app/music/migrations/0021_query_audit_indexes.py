@@ -0,0 +1,46 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def keep_one_liked_playlist(apps, schema_editor):
+    # Лишние плейлисты "Мне нравится" становятся обычными, треки в них остаются
+    Playlist = apps.get_model("music", "Playlist")
+    first_seen = set()
+    liked = Playlist.objects.filter(is_liked_playlist=True).order_by("owner_id", "pk")
+    for pk, owner_id in liked.values_list("pk", "owner_id"):
+        if owner_id in first_seen:
+            Playlist.objects.filter(pk=pk).update(
+                is_liked_playlist=False, title=f"favorite {pk}"
+            )
+        first_seen.add(owner_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0020_playlisttrack'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='playlist',
+            name='title',
+            field=models.CharField(default='favorite', max_length=128, verbose_name='Мне нравится'),
+        ),
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-release_date'], name='album_release_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(condition=models.Q(('album__isnull', True)), fields=['artist'], name='track_artist_single_idx'),
+        ),
+        migrations.RunPython(keep_one_liked_playlist, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='playlist',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_liked_playlist', True)), fields=('owner',), name='one_liked_playlist_per_owner'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0021_query_audit_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bitrate', models.PositiveIntegerField()),
+                ('bandwidth', models.PositiveIntegerField()),
+                ('codecs', models.CharField(max_length=64)),
+                ('track', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='music.track')),
+            ],
+            options={
+                'unique_together': {('track', 'bitrate')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TrackSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('duration', models.FloatField()),
+                ('file', models.FileField(upload_to='tracks/hls/')),
+                ('rendition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='music.trackrendition')),
+            ],
+            options={
+                'unique_together': {('rendition', 'number')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0022_hls_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peaks', models.BinaryField()),
+                ('loudness', models.FloatField(null=True)),
+                ('replay_gain', models.FloatField(null=True)),
+                ('peak', models.FloatField()),
+                ('trim_start', models.FloatField()),
+                ('trim_end', models.FloatField()),
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analysis', to='music.track')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 05:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0023_track_analysis'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrackNeighbors',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track_ids', models.BinaryField()),
+                ('scores', models.BinaryField()),
+                ('track', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='music.track')),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 05:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def reset_month_listeners(apps, schema_editor):
+    # Раньше здесь копились прослушивания; слушателей по ним не восстановить,
+    # счетчик заново наберется за окно music.plays
+    Artist = apps.get_model("music", "Artist")
+    Artist.objects.update(month_listeners=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0024_track_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistListener',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listener', models.CharField(max_length=40)),
+                ('last_day', models.DateField()),
+                ('artist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.artist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_day'], name='music_artis_last_da_5637bd_idx')],
+                'unique_together': {('artist', 'listener')},
+            },
+        ),
+        migrations.RunPython(reset_month_listeners, migrations.RunPython.noop),
+    ]
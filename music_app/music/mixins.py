@@ -1,6 +1,12 @@
-from typing import Optional
+import base64
+import binascii
+import json
+from typing import Optional, Sequence
 
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
 from .models import Artist
@@ -18,3 +24,152 @@ class ArtistAccessMixin:
     def dispatch(self, request, *args, **kwargs):
         self.artist = self.get_artist()
         return super().dispatch(request, *args, **kwargs)
+
+
+def encode_cursor(backwards: bool, values: list) -> str:
+    data = json.dumps([int(backwards), values], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> tuple:
+    """(назад ли, значения ключа); некорректный курсор — 404, как неверная страница"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        backwards, values = json.loads(data)
+    except (ValueError, TypeError, binascii.Error):
+        raise Http404("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise Http404("Invalid cursor")
+    return bool(backwards), values
+
+
+def clean_cursor_values(model, ordering: Sequence[str], values: list) -> list:
+    """Значения ключа в типах полей ordering; чужой тип — 404, а не ошибка SQL"""
+    cleaned = []
+    for field, value in zip(ordering, values):
+        model_field = model._meta.get_field(field.lstrip("-"))
+        try:
+            value = model_field.to_python(value)
+        except ValidationError:
+            raise Http404("Invalid cursor")
+        if value is None and not model_field.null:
+            raise Http404("Invalid cursor")
+        cleaned.append(value)
+    return cleaned
+
+
+def keyset_filter(ordering: Sequence[str], values: list, backwards: bool) -> Q:
+    """Строки строго после (или до) ключа values в порядке ordering"""
+    condition = Q()
+    equal: dict = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        descending = field.startswith("-") != backwards
+        condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+        equal[name] = value
+    return condition
+
+
+def reverse_ordering(ordering: Sequence[str]) -> list:
+    return [field[1:] if field.startswith("-") else f"-{field}" for field in ordering]
+
+
+class CursorPage:
+    """Страница keyset-пагинации; ссылки — page.next_query / page.previous_query"""
+
+    def __init__(self, object_list: list, next_cursor, previous_cursor, query, param):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query = query
+        self.param = param
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+    def link(self, cursor: str) -> str:
+        query = self.query.copy()
+        query[self.param] = cursor
+        return "?" + query.urlencode()
+
+    @property
+    def next_query(self) -> str:
+        return self.link(self.next_cursor) if self.has_next() else ""
+
+    @property
+    def previous_query(self) -> str:
+        return self.link(self.previous_cursor) if self.has_previous() else ""
+
+
+def paginate_by_cursor(
+    queryset: QuerySet, ordering: Sequence[str], cursor: Optional[str], page_size: int
+) -> tuple:
+    """(строки, курсор вперед, курсор назад).
+
+    Последнее поле ordering должно быть уникальным (обычно id), а для порядка
+    нужен индекс — тогда любая страница стоит как первая: ни OFFSET, ни COUNT.
+    """
+    backwards = False
+    if cursor:
+        backwards, values = decode_cursor(cursor, len(ordering))
+        values = clean_cursor_values(queryset.model, ordering, values)
+        queryset = queryset.filter(keyset_filter(ordering, values, backwards))
+    order = reverse_ordering(ordering) if backwards else ordering
+    rows = list(queryset.order_by(*order)[: page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    def key(row) -> list:
+        return [getattr(row, field.lstrip("-")) for field in ordering]
+
+    # Со страницы, открытой курсором назад, всегда есть путь вперед, и наоборот
+    next_cursor = previous_cursor = None
+    if has_more or backwards:
+        next_cursor = encode_cursor(False, key(rows[-1]))
+    if (has_more and backwards) or (cursor and not backwards):
+        previous_cursor = encode_cursor(True, key(rows[0]))
+    return rows, next_cursor, previous_cursor
+
+
+class CursorPaginationMixin:
+    """Keyset-пагинация вместо OFFSET для ListView и вложенных списков"""
+
+    cursor_ordering: Sequence[str] = ("-id",)
+    cursor_param = "cursor"
+
+    def paginate_by_cursor(
+        self,
+        queryset: QuerySet,
+        page_size: int,
+        param: Optional[str] = None,
+        ordering: Optional[Sequence[str]] = None,
+    ) -> CursorPage:
+        param = param or self.cursor_param
+        rows, next_cursor, previous_cursor = paginate_by_cursor(
+            queryset,
+            ordering or self.cursor_ordering,
+            self.request.GET.get(param),
+            page_size,
+        )
+        return CursorPage(rows, next_cursor, previous_cursor, self.request.GET, param)
+
+    def paginate_queryset(self, queryset, page_size):
+        # Контракт MultipleObjectMixin: (paginator, page, object_list, is_paginated)
+        page = self.paginate_by_cursor(queryset, page_size)
+        return None, page, page.object_list, page.has_other_pages()
@@ -1,6 +1,17 @@
+import hashlib
+from typing import Optional
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from users.models import User
 
+from .analysis import POINTS, analyze_file
+from .seeking import build_seek_index, lookup_offset
+from .storage import local_file
+
 # Create your models here.
 
 
@@ -9,7 +20,8 @@ class Artist(models.Model):
     image = models.ImageField(upload_to="artists_cards/")
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     bio = models.TextField(null=True, blank=True)
-    month_listeners = models.PositiveIntegerField(default=0)
+    # Прослушивания за скользящие 30 дней, поддерживается music.plays
+    month_listeners = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return self.name
@@ -23,38 +35,71 @@ class Album(models.Model):
     is_explicit = models.BooleanField(default=False, null=False)
     # не опубликованный
 
+    class Meta:
+        indexes = [
+            # Keyset-пагинация дискографии артиста
+            models.Index(fields=["artist", "id"], name="album_artist_id_idx"),
+            # Новые релизы на главной (music.charts)
+            models.Index(fields=["-release_date"], name="album_release_date_idx"),
+        ]
+
 
 class Genre(models.Model):
     title = models.CharField(max_length=64, null=False, blank=False)
 
 
 class Track(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Обрабатывается"
+        READY = "ready", "Готов"
+        FAILED = "failed", "Ошибка обработки"
+
     title = models.CharField(max_length=256, null=False, blank=False)
     album = models.ForeignKey(Album, null=True, blank=True, on_delete=models.CASCADE)
     artist = models.ForeignKey(Artist, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="tracks_images/")
     duration = models.PositiveIntegerField(default=0)
     audio_file = models.FileField(upload_to="tracks/")
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
     release_date = models.DateTimeField(auto_now_add=True)
     genre = models.ForeignKey(Genre, on_delete=models.SET_NULL, null=True, blank=True)
     is_explicit = models.BooleanField(default=False, null=False)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.READY
+    )
+    month_plays = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return f"{self.artist} - {self.title}"
 
+    def update_content_hash(self) -> None:
+        """SHA-256 аудиофайла, используется как ETag при стриминге"""
+        with self.audio_file.open("rb") as audio:
+            self.content_hash = hashlib.file_digest(audio, "sha256").hexdigest()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["artist", "id"], name="track_artist_id_idx"),
+            # Треки артиста вне альбомов: выбор треков при создании альбома
+            models.Index(
+                fields=["artist"],
+                condition=models.Q(album__isnull=True),
+                name="track_artist_single_idx",
+            ),
+        ]
+
 
 class Playlist(models.Model):
     title = models.CharField(
         max_length=128,
         null=False,
         default="favorite",
-        unique=True,
         verbose_name="Мне нравится",
     )
     image = models.ImageField(upload_to="playlists_images/")
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     is_public = models.BooleanField(default=False)
-    tracks = models.ManyToManyField(Track)
+    tracks = models.ManyToManyField(Track, through="PlaylistTrack")
     is_liked_playlist = models.BooleanField(default=False)
 
     def __str__(self):
@@ -62,3 +107,207 @@ class Playlist(models.Model):
 
     class Meta:
         unique_together = ("owner", "is_liked_playlist", "title")
+        indexes = [models.Index(fields=["owner", "id"], name="playlist_owner_id_idx")]
+        constraints = [
+            # Один плейлист "Мне нравится" на пользователя; им же ищется music.likes
+            models.UniqueConstraint(
+                fields=["owner"],
+                condition=models.Q(is_liked_playlist=True),
+                name="one_liked_playlist_per_owner",
+            )
+        ]
+
+
+class PlaylistTrack(models.Model):
+    """Трек в плейлисте. Порядок задает разреженный ключ position (см. music.playlists)"""
+
+    # Шаг между соседними позициями: место для ~16 перемещений в одну точку
+    STEP = 1 << 16
+
+    playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE)
+    track = models.ForeignKey(Track, on_delete=models.CASCADE)
+    position = models.BigIntegerField(default=0)
+    added_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = "music_playlist_tracks"
+        indexes = [
+            models.Index(
+                fields=["playlist", "position", "id"], name="playlist_track_order_idx"
+            )
+        ]
+
+    @classmethod
+    def next_position(cls, playlist_id: int):
+        """Позиция в конце плейлиста — выражение для INSERT без отдельного чтения"""
+        last = (
+            cls.objects.filter(playlist_id=playlist_id)
+            .order_by("-position")
+            .values("position")[:1]
+        )
+        return Coalesce(Subquery(last), Value(0)) + cls.STEP
+
+
+class TrackSeekIndex(models.Model):
+    """Таблица перемотки трека: время -> смещение кадра в audio_file"""
+
+    track = models.OneToOneField(
+        Track, on_delete=models.CASCADE, related_name="seek_index"
+    )
+    step = models.FloatField()
+    offsets = models.BinaryField()
+
+    def offset_for(self, seconds: float) -> int:
+        return lookup_offset(bytes(self.offsets), self.step, seconds)
+
+    @classmethod
+    def build_for(cls, track: Track) -> Optional["TrackSeekIndex"]:
+        """Строит таблицу по audio_file трека; для не-MP3 возвращает None"""
+        step = getattr(settings, "MUSIC_SEEK_INDEX_STEP", 0.5)
+        with track.audio_file.open("rb") as audio:
+            offsets = build_seek_index(audio, step)
+        if offsets is None:
+            return None
+        index, _ = cls.objects.update_or_create(
+            track=track, defaults={"step": step, "offsets": offsets}
+        )
+        return index
+
+
+class TrackAnalysis(models.Model):
+    """Волна и громкость трека, считаются при загрузке (см. music.analysis)"""
+
+    track = models.OneToOneField(
+        Track, on_delete=models.CASCADE, related_name="analysis"
+    )
+    # Пики волны: по байту 0..255 на точку
+    peaks = models.BinaryField()
+    loudness = models.FloatField(null=True)  # LUFS, None — тишина
+    replay_gain = models.FloatField(null=True)  # дБ
+    peak = models.FloatField()  # пиковый уровень сэмпла, 1.0 — полная шкала
+    trim_start = models.FloatField()  # секунды до начала звука
+    trim_end = models.FloatField()  # секунда конца звука
+
+    @classmethod
+    def build_for(cls, track: Track) -> Optional["TrackAnalysis"]:
+        """Анализирует audio_file трека; None, если формат нечем декодировать"""
+        points = getattr(settings, "MUSIC_WAVEFORM_POINTS", POINTS)
+        with local_file(track.audio_file) as path:
+            result = analyze_file(path, points)
+        if result is None:
+            return None
+        fields = result._asdict()
+        del fields["duration"]
+        analysis, _ = cls.objects.update_or_create(track=track, defaults=fields)
+        return analysis
+
+
+class TrackNeighbors(models.Model):
+    """Похожие треки по совместным плейлистам (см. music.recommendations)"""
+
+    track = models.OneToOneField(
+        Track, on_delete=models.CASCADE, related_name="neighbors"
+    )
+    # uint64 id соседей и float32 сходства (little-endian) по убыванию сходства
+    track_ids = models.BinaryField()
+    scores = models.BinaryField()
+
+
+class TrackRendition(models.Model):
+    """Вариант трека для HLS с заданным битрейтом (см. music.hls)"""
+
+    track = models.ForeignKey(
+        Track, on_delete=models.CASCADE, related_name="renditions"
+    )
+    bitrate = models.PositiveIntegerField()  # кбит/с
+    # Пиковый битрейт сегментов с учетом контейнера, бит/с: BANDWIDTH в master playlist
+    bandwidth = models.PositiveIntegerField()
+    codecs = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ("track", "bitrate")
+
+
+class TrackSegment(models.Model):
+    rendition = models.ForeignKey(
+        TrackRendition, on_delete=models.CASCADE, related_name="segments"
+    )
+    number = models.PositiveIntegerField()
+    duration = models.FloatField()
+    file = models.FileField(upload_to="tracks/hls/")
+
+    class Meta:
+        unique_together = ("rendition", "number")
+
+
+class TrackPlayDay(models.Model):
+    """Прослушивания трека за сутки: корзина скользящего окна music.plays"""
+
+    track = models.ForeignKey(Track, on_delete=models.CASCADE)
+    day = models.DateField()
+    plays = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("track", "day")
+        indexes = [models.Index(fields=["day"])]
+
+
+class ArtistListener(models.Model):
+    """Слушатель артиста в окне music.plays: из них складывается month_listeners"""
+
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE)
+    # sha1 ключа слушателя: cookie сессии или адрес с User-Agent
+    listener = models.CharField(max_length=40)
+    last_day = models.DateField()
+
+    class Meta:
+        unique_together = ("artist", "listener")
+        indexes = [models.Index(fields=["last_day"])]
+
+
+class ChartSnapshot(models.Model):
+    """Предрасчитанные чарты главной страницы, см. music.charts"""
+
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Job(models.Model):
+    """Фоновая задача, которую выполняет manage.py run_jobs"""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=16, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+
+class MediaBlob(models.Model):
+    """Файл контентно-адресуемого хранилища и число ссылок на него из FileField"""
+
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+    class Meta:
+        indexes = [models.Index(fields=["refcount", "updated_at"])]
@@ -0,0 +1,144 @@
+"""Порядок треков в плейлисте.
+
+Позиции PlaylistTrack.position разрежены: соседние записи отстоят на STEP.
+Перемещение пишет одну строку — новую позицию посередине между соседями.
+Когда места между соседями не остается, плейлист перенумеровывается
+(rebalance) — это случается раз в ~16 перемещений в одну и ту же точку.
+Вставки пачкой идут одним bulk_create, удаление — одним DELETE.
+
+Число треков для страницы плейлиста берется из кэша (track_count): append и
+remove сбрасывают его после коммита, правки в обход модуля — через сигнал.
+"""
+
+from typing import Iterable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+from . import likes
+from .models import Playlist, PlaylistTrack
+
+STEP = PlaylistTrack.STEP
+MAX_BULK = 1000
+# Страховка на случай правок, которые не сбросили счетчик
+COUNT_TIMEOUT = 300
+
+
+def entries(playlist_id: int):
+    return PlaylistTrack.objects.filter(playlist_id=playlist_id)
+
+
+def ordered(playlist_id: int):
+    return entries(playlist_id).order_by("position", "id")
+
+
+def lock(playlist: Playlist) -> None:
+    # Сериализует правки одного плейлиста в Postgres; SQLite и так пишет по одному
+    Playlist.objects.select_for_update().filter(pk=playlist.pk).exists()
+
+
+def count_key(playlist_id: int) -> str:
+    return f"music:playlist_count:{playlist_id}"
+
+
+def track_count(playlist: Playlist) -> int:
+    """Число записей плейлиста без COUNT на каждый показ страницы"""
+    if playlist.is_liked_playlist:
+        # Лайки уже лежат в кэше music.likes
+        return len(likes.get_entry(playlist.owner_id).track_ids)
+    return cache.get_or_set(
+        count_key(playlist.pk), lambda: entries(playlist.pk).count(), COUNT_TIMEOUT
+    )
+
+
+def forget_count(playlist_id: int) -> None:
+    cache.delete(count_key(playlist_id))
+
+
+def changed(playlist: Playlist) -> None:
+    transaction.on_commit(lambda: forget_count(playlist.pk))
+    if playlist.is_liked_playlist:
+        transaction.on_commit(lambda: likes.invalidate(playlist.owner_id))
+
+
+def append(playlist: Playlist, track_ids: Iterable[int]) -> list:
+    """Добавляет треки в конец плейлиста в заданном порядке.
+
+    В плейлист лайков попадают только треки, которых в нем еще нет.
+    """
+    track_ids = list(track_ids)
+    with transaction.atomic():
+        lock(playlist)
+        if playlist.is_liked_playlist:
+            # В "Мне нравится" трек лежит один раз, как при likes.like
+            present = set(
+                entries(playlist.pk)
+                .filter(track_id__in=track_ids)
+                .values_list("track_id", flat=True)
+            )
+            track_ids = [pk for pk in dict.fromkeys(track_ids) if pk not in present]
+        last = (
+            ordered(playlist.pk).reverse().values_list("position", flat=True).first()
+            or 0
+        )
+        created = PlaylistTrack.objects.bulk_create(
+            PlaylistTrack(
+                playlist_id=playlist.pk,
+                track_id=track_id,
+                position=last + STEP * number,
+            )
+            for number, track_id in enumerate(track_ids, start=1)
+        )
+        changed(playlist)
+    return created
+
+
+def remove(playlist: Playlist, track_ids: Iterable[int]) -> int:
+    """Удаляет все вхождения треков; возвращает число удаленных записей"""
+    with transaction.atomic():
+        deleted, _ = entries(playlist.pk).filter(track_id__in=list(track_ids)).delete()
+        changed(playlist)
+    return deleted
+
+
+def rebalance(playlist_id: int) -> None:
+    rows = list(ordered(playlist_id).only("pk", "position"))
+    for number, row in enumerate(rows, start=1):
+        row.position = number * STEP
+    PlaylistTrack.objects.bulk_update(rows, ["position"], batch_size=500)
+
+
+def position_between(playlist_id: int, entry_id: int, after_id: Optional[int]):
+    """Позиция для записи сразу после after_id (None — в начало) или None, если нет места"""
+    rows = ordered(playlist_id).exclude(pk=entry_id)
+    if after_id is None:
+        previous = None
+        following = rows.values_list("position", flat=True).first()
+    else:
+        previous = rows.filter(pk=after_id).values_list("position", "id").get()
+        following = (
+            rows.filter(position__gte=previous[0])
+            .exclude(position=previous[0], id__lte=previous[1])
+            .values_list("position", flat=True)
+            .first()
+        )
+        previous = previous[0]
+    if following is None:
+        return (previous or 0) + STEP
+    if previous is None:
+        previous = following - 2 * STEP
+    if following - previous < 2:
+        return None
+    return (previous + following) // 2
+
+
+def move(playlist: Playlist, entry_id: int, after_id: Optional[int]) -> int:
+    """Ставит запись entry_id после записи after_id (None — в начало): одна запись в базу"""
+    with transaction.atomic():
+        lock(playlist)
+        position = position_between(playlist.pk, entry_id, after_id)
+        if position is None:
+            rebalance(playlist.pk)
+            position = position_between(playlist.pk, entry_id, after_id)
+        entries(playlist.pk).filter(pk=entry_id).update(position=position)
+    return position
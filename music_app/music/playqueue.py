@@ -0,0 +1,214 @@
+"""Очередь воспроизведения в сессии: плейлист, альбом, артист или радио.
+
+В сессии хранится только окно из MUSIC_QUEUE_WINDOW ближайших треков
+(упакованные id), курсор источника для дозагрузки следующего окна и, для
+радио, недавно сыгранные треки. Окно дозаполняется keyset-запросом от
+курсора; радио продолжается соседями последнего трека (music.recommendations),
+а когда они уже сыграны — соседями более старых треков истории и
+рекомендациями пользователя.
+
+Вместе с очередью клиент получает первый диапазон байт следующего трека —
+примерно MUSIC_QUEUE_PREFETCH_SECONDS секунд звука — и Link: rel=preload,
+чтобы переход между треками шел без холодного запроса. Адреса предзагрузки
+помечены ?prefetch=1 и не считаются прослушиванием.
+"""
+
+import base64
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.urls import reverse
+
+from .models import Playlist, PlaylistTrack, Track, TrackNeighbors, TrackSeekIndex
+from .recommendations import (
+    ID_TYPECODE,
+    MAX_LIMIT,
+    merge,
+    pack,
+    ready_tracks,
+    recommend_for_user,
+    unpack,
+)
+
+SESSION_KEY = "music_queue"
+SOURCES = ("playlist", "album", "artist", "radio")
+MAX_COUNT = 20
+HISTORY = 100
+# Сколько сыгранных треков радио берет в сиды за один запрос соседей
+RADIO_SEEDS = 20
+# Без таблицы перемотки и длительности: ~10 секунд MP3 320 кбит/с
+FALLBACK_PREFETCH_BYTES = 400 * 1024
+
+
+def get_window() -> int:
+    return getattr(settings, "MUSIC_QUEUE_WINDOW", 50)
+
+
+def get_prefetch_seconds() -> int:
+    return getattr(settings, "MUSIC_QUEUE_PREFETCH_SECONDS", 10)
+
+
+def encode(track_ids) -> str:
+    return base64.b64encode(pack(track_ids, ID_TYPECODE)).decode()
+
+
+def decode(data: str) -> list:
+    return list(unpack(base64.b64decode(data), ID_TYPECODE))
+
+
+def can_play(source: str, source_id: int, user) -> bool:
+    if source == "playlist":
+        visible = Q(is_public=True)
+        if user.is_authenticated:
+            visible |= Q(owner=user)
+        return Playlist.objects.filter(visible, pk=source_id).exists()
+    if source == "radio":
+        return Track.objects.filter(pk=source_id, status=Track.Status.READY).exists()
+    field = "album_id" if source == "album" else "artist_id"
+    return Track.objects.filter(**{field: source_id}).exists()
+
+
+def radio_tracks(seed_ids: list, skip: set, count: int) -> list:
+    """id готовых соседей seed_ids, кроме skip, лучшие сверху"""
+    rows = TrackNeighbors.objects.filter(track_id__in=seed_ids).values_list(
+        "track_ids", "scores"
+    )
+    # Запас на треки, которые сейчас не готовы
+    return [track.pk for track in ready_tracks(merge(rows, skip, count * 2), count)]
+
+
+def load_radio(source_id: int, exclude: list, count: int, user=None) -> list:
+    skip = set(exclude) | {source_id}
+    # Сначала последний трек, затем пачками более старые и исходный
+    played = list(dict.fromkeys(reversed([source_id] + exclude)))
+    seeds = [played[:1]] + [
+        played[start : start + RADIO_SEEDS]
+        for start in range(1, len(played), RADIO_SEEDS)
+    ]
+    track_ids: list = []
+    for seed_ids in seeds:
+        if len(track_ids) >= count:
+            return track_ids
+        more = radio_tracks(seed_ids, skip, count - len(track_ids))
+        track_ids += more
+        skip.update(more)
+    if len(track_ids) < count and user is not None and user.is_authenticated:
+        more = [
+            track.pk
+            for track in recommend_for_user(user, MAX_LIMIT)
+            if track.pk not in skip
+        ]
+        track_ids += more[: count - len(track_ids)]
+    return track_ids
+
+
+def load(
+    source: str, source_id: int, cursor, exclude: list, count: int, user=None
+) -> tuple:
+    """Следующие count треков источника после cursor: (id, новый курсор)"""
+    ready = Track.Status.READY
+    if source == "playlist":
+        rows = PlaylistTrack.objects.filter(
+            playlist_id=source_id, track__status=ready
+        ).order_by("position", "id")
+        if cursor is not None:
+            position, entry_id = cursor
+            rows = rows.filter(
+                Q(position__gt=position) | Q(position=position, id__gt=entry_id)
+            )
+        rows = list(rows.values_list("position", "id", "track_id")[:count])
+        cursor = list(rows[-1][:2]) if rows else cursor
+        return [track_id for _, _, track_id in rows], cursor
+    if source == "radio":
+        return load_radio(source_id, exclude, count, user), None
+    field = "album_id" if source == "album" else "artist_id"
+    rows = Track.objects.filter(**{field: source_id}, status=ready).order_by("id")
+    if cursor is not None:
+        rows = rows.filter(id__gt=cursor)
+    track_ids = list(rows.values_list("id", flat=True)[:count])
+    return track_ids, track_ids[-1] if track_ids else cursor
+
+
+def start(session, source: str, source_id: int, user) -> bool:
+    """Начинает очередь с начала источника; False — источник недоступен"""
+    if source not in SOURCES or not can_play(source, source_id, user):
+        return False
+    if source == "radio":
+        track_ids, cursor = [source_id], None
+    else:
+        track_ids, cursor = load(source, source_id, None, [], get_window())
+    session[SESSION_KEY] = {
+        "source": source,
+        "id": source_id,
+        "tracks": encode(track_ids),
+        "cursor": cursor,
+        "history": encode([]),
+    }
+    return True
+
+
+def upcoming(session, count: int, user=None) -> Optional[list]:
+    """Текущий и следующие треки очереди (до count); None — очереди нет"""
+    state = session.get(SESSION_KEY)
+    if state is None:
+        return None
+    count = max(1, min(count, MAX_COUNT))
+    track_ids = decode(state["tracks"])
+    if len(track_ids) <= count:
+        # Окно кончается: дозагружаем, пока источник не исчерпан
+        history = decode(state["history"])
+        more, state["cursor"] = load(
+            state["source"],
+            state["id"],
+            state["cursor"],
+            history + track_ids,
+            get_window() - len(track_ids),
+            user,
+        )
+        track_ids += more
+        state["tracks"] = encode(track_ids)
+        session.modified = True
+    tracks = Track.objects.select_related("artist").in_bulk(track_ids[:count])
+    return [tracks[pk] for pk in track_ids[:count] if pk in tracks]
+
+
+def advance(session) -> bool:
+    """Переходит к следующему треку; False — очереди нет"""
+    state = session.get(SESSION_KEY)
+    if state is None:
+        return False
+    track_ids = decode(state["tracks"])
+    if track_ids:
+        history = decode(state["history"]) + track_ids[:1]
+        state["history"] = encode(history[-HISTORY:])
+        state["tracks"] = encode(track_ids[1:])
+        session.modified = True
+    return True
+
+
+def prefetch_range(track: Track) -> tuple:
+    """Первые байты трека на MUSIC_QUEUE_PREFETCH_SECONDS секунд: (начало, конец)"""
+    seconds = get_prefetch_seconds()
+    seek_index = TrackSeekIndex.objects.filter(track=track).first()
+    if seek_index is not None:
+        end = seek_index.offset_for(seconds)
+    else:
+        end = FALLBACK_PREFETCH_BYTES
+        if track.duration and track.audio_file:
+            try:
+                end = track.audio_file.size * seconds // track.duration
+            except OSError:
+                # Файла нет в хранилище: поток все равно ответит 404
+                pass
+    return 0, max(end, 1) - 1
+
+
+def prefetch_url(track: Track) -> str:
+    """Адрес предзагрузки: music.plays не считает его прослушиванием"""
+    url = reverse("music:stream_audio", kwargs={"track_id": track.pk})
+    return f"{url}?prefetch=1"
+
+
+def preload_link(track: Track) -> str:
+    return f"<{prefetch_url(track)}>; rel=preload; as=audio"
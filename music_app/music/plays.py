@@ -0,0 +1,252 @@
+"""Счетчики прослушиваний за скользящие 30 дней.
+
+Начало прослушивания (запрос потока с нулевого байта длиннее проверки
+плеера) попадает в буфер процесса. Раз в MUSIC_PLAYS_FLUSH_INTERVAL секунд
+буфер сбрасывается пачкой в фоновом потоке, не задерживая ответ: суточные
+корзины TrackPlayDay и денормализованный Track.month_plays увеличиваются на
+накопленные значения. Artist.month_listeners — число различных слушателей
+артиста за окно, строк ArtistListener с днем последнего прослушивания.
+Корзины и слушатели старше окна вычитаются и удаляются командой
+manage.py refresh_play_counters.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Artist, ArtistListener, Track, TrackPlayDay
+
+logger = logging.getLogger(__name__)
+
+# Диапазоны с нулевого байта короче этого — проверки плеера (Safari шлет
+# bytes=0-1), а не прослушивание
+MIN_PLAY_BYTES = 1024
+
+
+def get_window_days() -> int:
+    return getattr(settings, "MUSIC_PLAYS_WINDOW_DAYS", 30)
+
+
+def is_auto_flush() -> bool:
+    return getattr(settings, "MUSIC_PLAYS_AUTO_FLUSH", True)
+
+
+def is_prefetch(request) -> bool:
+    """Предзагрузка: адрес очереди music.playqueue или заголовок браузера"""
+    purpose = request.headers.get("Sec-Purpose") or request.headers.get("Purpose")
+    return "prefetch" in request.GET or "prefetch" in (purpose or "")
+
+
+def is_play_start(request) -> bool:
+    """Первый запрос сессии прослушивания: GET без Range или с нулевого байта"""
+    if request.method != "GET" or "t" in request.GET or is_prefetch(request):
+        return False
+    range_header = request.headers.get("Range", "").replace(" ", "")
+    if not range_header:
+        return True
+    if not range_header.startswith("bytes=0-") or "," in range_header:
+        return False
+    end = range_header.removeprefix("bytes=0-")
+    return not end or (end.isdigit() and int(end) + 1 >= MIN_PLAY_BYTES)
+
+
+def listener_key(request) -> str:
+    # Cookie сессии читается без запроса к базе, в отличие от request.user
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return session
+    return f"{request.META.get('REMOTE_ADDR', '')}|{request.headers.get('User-Agent', '')}"
+
+
+def hash_listener(listener: str) -> str:
+    # Ключ сессии и адрес не хранятся в базе как есть
+    return hashlib.sha1(listener.encode()).hexdigest()
+
+
+class PlayBuffer:
+    def __init__(self, flush_interval: float, max_size: int):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.counts: Counter = Counter()
+        # {(artist_id, sha1 слушателя): день}
+        self.listeners: dict = {}
+        # Повторные старты одного трека одним слушателем внутри окна не считаются
+        self.seen: set = set()
+        self.last_flush = time.monotonic()
+        # Занят, пока идет фоновый сброс: второй поток не запускается
+        self.flushing = threading.Lock()
+        self.flusher: Optional[threading.Thread] = None
+
+    def add(self, track_id: int, artist_id: int, listener: str) -> bool:
+        """Учитывает прослушивание; True — пора вызвать flush()"""
+        with self.lock:
+            if (listener, track_id) not in self.seen:
+                self.seen.add((listener, track_id))
+                day = timezone.localdate()
+                self.counts[(track_id, artist_id, day)] += 1
+                self.listeners[(artist_id, hash_listener(listener))] = day
+            return (
+                max(len(self.counts), len(self.listeners)) >= self.max_size
+                or time.monotonic() - self.last_flush >= self.flush_interval
+            )
+
+    def flush(self) -> int:
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            listeners, self.listeners = self.listeners, {}
+            self.seen = set()
+            self.last_flush = time.monotonic()
+        if counts:
+            apply_counts(counts, listeners)
+        return sum(counts.values())
+
+    def flush_soon(self) -> None:
+        """Запускает flush() в фоновом потоке, если он еще не идет"""
+        if not is_auto_flush() or not self.flushing.acquire(blocking=False):
+            return
+        self.flusher = threading.Thread(
+            target=self.flush_in_background, name="music-plays-flush", daemon=True
+        )
+        self.flusher.start()
+
+    def flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("play counters flush failed")
+        finally:
+            # Соединения потока иначе остались бы открытыми
+            connections.close_all()
+            self.flushing.release()
+
+
+def apply_counts(counts: Counter, listeners: dict) -> None:
+    track_totals: Counter = Counter()
+    # Трек могли удалить, пока событие лежало в буфере
+    existing = set(
+        Track.objects.filter(pk__in={key[0] for key in counts}).values_list(
+            "pk", flat=True
+        )
+    )
+    with transaction.atomic():
+        for (track_id, artist_id, day), plays in counts.items():
+            if track_id not in existing:
+                continue
+            add_to_day(track_id, day, plays)
+            track_totals[track_id] += plays
+        for track_id, plays in track_totals.items():
+            Track.objects.filter(pk=track_id).update(month_plays=F("month_plays") + plays)
+        add_listeners(listeners)
+
+
+def add_listeners(listeners: dict) -> None:
+    """Продлевает известных слушателей и прибавляет новых к month_listeners"""
+    by_artist: defaultdict = defaultdict(dict)
+    for (artist_id, listener), day in listeners.items():
+        by_artist[artist_id][listener] = day
+    # Артиста могли удалить, пока событие лежало в буфере
+    artists = set(Artist.objects.filter(pk__in=by_artist).values_list("pk", flat=True))
+    created = []
+    for artist_id in artists:
+        days = by_artist[artist_id]
+        rows = ArtistListener.objects.filter(artist_id=artist_id)
+        known = set(rows.filter(listener__in=days).values_list("listener", flat=True))
+        by_day: defaultdict = defaultdict(list)
+        for listener in known:
+            by_day[days[listener]].append(listener)
+        for day, listeners_of_day in by_day.items():
+            rows.filter(listener__in=listeners_of_day, last_day__lt=day).update(
+                last_day=day
+            )
+        new = [
+            ArtistListener(artist_id=artist_id, listener=listener, last_day=day)
+            for listener, day in days.items()
+            if listener not in known
+        ]
+        created.extend(new)
+        if new:
+            # Вставку параллельного воркера счетчик может учесть дважды:
+            # refresh_play_counters --rebuild пересчитывает его по строкам
+            Artist.objects.filter(pk=artist_id).update(
+                month_listeners=F("month_listeners") + len(new)
+            )
+    ArtistListener.objects.bulk_create(created, ignore_conflicts=True)
+
+
+def add_to_day(track_id: int, day: date, plays: int) -> None:
+    bucket = TrackPlayDay.objects.filter(track_id=track_id, day=day)
+    if bucket.update(plays=F("plays") + plays):
+        return
+    try:
+        with transaction.atomic():
+            TrackPlayDay.objects.create(track_id=track_id, day=day, plays=plays)
+    except IntegrityError:
+        # Корзину только что создал другой процесс
+        bucket.update(plays=F("plays") + plays)
+
+
+def expire(today: Optional[date] = None) -> int:
+    """Вычитает из счетчиков и удаляет корзины и слушателей, выпавших из окна"""
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=get_window_days())
+    expired = TrackPlayDay.objects.filter(day__lte=cutoff)
+    expired_listeners = ArtistListener.objects.filter(last_day__lte=cutoff)
+    with transaction.atomic():
+        for row in expired.values("track_id").annotate(plays=Sum("plays")):
+            Track.objects.filter(pk=row["track_id"]).update(
+                month_plays=Greatest(F("month_plays") - row["plays"], Value(0))
+            )
+        for row in expired_listeners.values("artist_id").annotate(
+            listeners=Count("id")
+        ):
+            Artist.objects.filter(pk=row["artist_id"]).update(
+                month_listeners=Greatest(
+                    F("month_listeners") - row["listeners"], Value(0)
+                )
+            )
+        expired_listeners.delete()
+        deleted, _ = expired.delete()
+    return deleted
+
+
+def rebuild() -> None:
+    """Пересчитывает счетчики заново по корзинам и слушателям окна"""
+    cutoff = timezone.localdate() - timedelta(days=get_window_days())
+    window = TrackPlayDay.objects.filter(day__gt=cutoff)
+    listeners = ArtistListener.objects.filter(last_day__gt=cutoff)
+    with transaction.atomic():
+        Track.objects.update(month_plays=0)
+        Artist.objects.update(month_listeners=0)
+        for row in window.values("track_id").annotate(plays=Sum("plays")):
+            Track.objects.filter(pk=row["track_id"]).update(month_plays=row["plays"])
+        for row in listeners.values("artist_id").annotate(count=Count("id")):
+            Artist.objects.filter(pk=row["artist_id"]).update(
+                month_listeners=row["count"]
+            )
+
+
+buffer = PlayBuffer(
+    flush_interval=getattr(settings, "MUSIC_PLAYS_FLUSH_INTERVAL", 5.0),
+    max_size=getattr(settings, "MUSIC_PLAYS_MAX_BUFFER", 1000),
+)
+atexit.register(buffer.flush)
+
+
+def record(track: Track, request) -> None:
+    """Учитывает прослушивание; запросов к базе нет, годится и для async"""
+    if is_play_start(request) and buffer.add(
+        track.pk, track.artist_id, listener_key(request)
+    ):
+        buffer.flush_soon()
@@ -0,0 +1,221 @@
+"""Рекомендации "похожее" по совместной встречаемости треков в плейлистах.
+
+manage.py rebuild_recommendations (по расписанию) строит разреженную
+матрицу трек x плейлист, считает косинусное сходство треков
+(совместные плейлисты / sqrt(плейлистов у каждого)) и сохраняет для
+каждого трека MUSIC_RECOMMENDATIONS_NEIGHBORS лучших соседей в
+TrackNeighbors. Считается SciPy блоками строк, без него — словарями в
+Python (годится для небольших каталогов); SciPy и NumPy ставятся extra
+recommendations (pip install .[recommendations]).
+
+В запросе соседи последних MUSIC_RECOMMENDATIONS_SEEDS лайков
+складываются с весами сходства; лайкнутые треки исключаются.
+"""
+
+import heapq
+import math
+import sys
+from array import array
+from collections import Counter, defaultdict
+from itertools import groupby
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+
+from . import likes
+from .models import PlaylistTrack, Track, TrackNeighbors
+
+try:
+    import numpy
+    import scipy.sparse
+except ImportError:  # SciPy и NumPy не обязательны
+    numpy = None
+
+BLOCK_ROWS = 2048
+MAX_LIMIT = 100
+# Первичные ключи — BigAutoField: id пакуются в uint64
+ID_TYPECODE = "Q"
+
+
+def get_neighbors_count() -> int:
+    return getattr(settings, "MUSIC_RECOMMENDATIONS_NEIGHBORS", 50)
+
+
+def get_max_playlist() -> int:
+    return getattr(settings, "MUSIC_RECOMMENDATIONS_MAX_PLAYLIST", 500)
+
+
+def get_seeds_count() -> int:
+    return getattr(settings, "MUSIC_RECOMMENDATIONS_SEEDS", 500)
+
+
+def pack(values: Iterable, typecode: str) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack(data: bytes, typecode: str) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def track_lists() -> list:
+    """Треки каждого плейлиста, в длинных — только последние добавленные.
+
+    Вся таблица читается одним потоком; для плейлистов по id есть загрузчик
+    music.loaders.playlist_track_ids.
+    """
+    limit = get_max_playlist()
+    rows = (
+        PlaylistTrack.objects.order_by("playlist_id", "-position")
+        .values_list("playlist_id", "track_id")
+        .iterator(chunk_size=10000)
+    )
+    playlists = []
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        tracks = list(dict.fromkeys(track_id for _, track_id in group))[:limit]
+        if len(tracks) > 1:
+            playlists.append(tracks)
+    return playlists
+
+
+def compute_neighbors_python(playlists: list, k: int) -> dict:
+    degree = Counter(track for tracks in playlists for track in tracks)
+    together = defaultdict(Counter)
+    for tracks in playlists:
+        for position, first in enumerate(tracks):
+            for second in tracks[position + 1 :]:
+                together[first][second] += 1
+                together[second][first] += 1
+    neighbors = {}
+    for track, counts in together.items():
+        scores = (
+            (count / math.sqrt(degree[track] * degree[other]), other)
+            for other, count in counts.items()
+        )
+        best = heapq.nlargest(k, scores)
+        neighbors[track] = ([other for _, other in best], [score for score, _ in best])
+    return neighbors
+
+
+def compute_neighbors_scipy(playlists: list, k: int) -> dict:
+    lengths = numpy.fromiter((len(tracks) for tracks in playlists), numpy.int64)
+    flat = numpy.fromiter(
+        (track for tracks in playlists for track in tracks),
+        numpy.int64,
+        count=int(lengths.sum()),
+    )
+    track_ids, rows = numpy.unique(flat, return_inverse=True)
+    columns = numpy.repeat(numpy.arange(len(playlists)), lengths)
+    matrix = scipy.sparse.csr_matrix(
+        (numpy.ones(len(flat), numpy.float32), (rows, columns)),
+        shape=(len(track_ids), len(playlists)),
+    )
+    inverse_norms = 1 / numpy.sqrt(numpy.asarray(matrix.sum(axis=1)).ravel())
+    normalized = scipy.sparse.diags(inverse_norms) @ matrix
+    transposed = normalized.T.tocsr()
+
+    neighbors = {}
+    # Матрица сходства целиком не материализуется: по BLOCK_ROWS строк за раз
+    for start in range(0, len(track_ids), BLOCK_ROWS):
+        block = (normalized[start : start + BLOCK_ROWS] @ transposed).tocsr()
+        for row in range(block.shape[0]):
+            begin, end = block.indptr[row], block.indptr[row + 1]
+            others, scores = block.indices[begin:end], block.data[begin:end]
+            keep = others != start + row
+            others, scores = others[keep], scores[keep]
+            if len(scores) > k:
+                best = numpy.argpartition(-scores, k)[:k]
+                others, scores = others[best], scores[best]
+            order = numpy.argsort(-scores, kind="stable")
+            neighbors[int(track_ids[start + row])] = (
+                track_ids[others[order]].tolist(),
+                scores[order].tolist(),
+            )
+    return neighbors
+
+
+def compute_neighbors(playlists: list, k: int) -> dict:
+    """{id трека: ([id соседей], [сходства])} по спискам треков плейлистов"""
+    if numpy is not None:
+        return compute_neighbors_scipy(playlists, k)
+    return compute_neighbors_python(playlists, k)
+
+
+def rebuild() -> int:
+    """Пересчитывает соседей всех треков; возвращает число треков с соседями"""
+    # Счет идет вне транзакции: в SQLite она держала бы блокировку записи
+    neighbors = compute_neighbors(track_lists(), get_neighbors_count())
+    with transaction.atomic():
+        TrackNeighbors.objects.all().delete()
+        TrackNeighbors.objects.bulk_create(
+            (
+                TrackNeighbors(
+                    track_id=track_id,
+                    track_ids=pack(others, ID_TYPECODE),
+                    scores=pack(scores, "f"),
+                )
+                for track_id, (others, scores) in neighbors.items()
+            ),
+            batch_size=1000,
+        )
+    return len(neighbors)
+
+
+def merge(rows: Iterable, exclude, limit: int) -> list:
+    """Складывает сходства соседей из rows (байты id, байты сходств), лучшие сверху"""
+    totals = defaultdict(float)
+    for track_ids, scores in rows:
+        pairs = zip(unpack(track_ids, ID_TYPECODE), unpack(scores, "f"))
+        for track_id, score in pairs:
+            if track_id not in exclude:
+                totals[track_id] += score
+    return heapq.nlargest(limit, totals, key=totals.__getitem__)
+
+
+def ready_tracks(track_ids: list, limit: int) -> list:
+    """Готовые треки в порядке track_ids"""
+    tracks = Track.objects.filter(pk__in=track_ids, status=Track.Status.READY)
+    by_id = {track.pk: track for track in tracks.select_related("artist")}
+    return [by_id[pk] for pk in track_ids if pk in by_id][:limit]
+
+
+def result(track: Track) -> dict:
+    return {
+        "id": track.pk,
+        "title": track.title,
+        "artist": track.artist.name,
+        "url": reverse("music:stream_audio", kwargs={"track_id": track.pk}),
+    }
+
+
+def similar_to(track_id: int, limit: int = 20) -> list:
+    limit = max(1, min(limit, MAX_LIMIT))
+    rows = TrackNeighbors.objects.filter(track_id=track_id).values_list(
+        "track_ids", "scores"
+    )
+    # Запас на треки, которые сейчас не готовы
+    return ready_tracks(merge(rows, {track_id}, limit * 2), limit)
+
+
+def recommend_for_user(user, limit: int = 20) -> list:
+    limit = max(1, min(limit, MAX_LIMIT))
+    liked = likes.liked_track_ids(user)
+    if not liked:
+        return []
+    seeds = (
+        PlaylistTrack.objects.filter(playlist_id=likes.get_liked_playlist_id(user))
+        .order_by("-position")
+        .values_list("track_id", flat=True)[: get_seeds_count()]
+    )
+    rows = TrackNeighbors.objects.filter(track_id__in=list(seeds)).values_list(
+        "track_ids", "scores"
+    )
+    return ready_tracks(merge(rows.iterator(), liked, limit * 2), limit)
@@ -0,0 +1,101 @@
+"""Уменьшенные копии обложек для srcset.
+
+Копия исходника <name> шириной w лежит в renditions/<name>/<w>.<ext> хранилища
+"renditions". Копии строятся фоновой задачей build_renditions после загрузки
+или лениво при первом запросе (serve_media / music:rendition), дальше
+отдаются как обычные файлы.
+"""
+
+import posixpath
+from io import BytesIO
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+PREFIX = "renditions/"
+FORMATS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+DEFAULT_WIDTHS = (64, 128, 256, 320, 512, 640)
+
+
+def get_widths() -> tuple:
+    return tuple(getattr(settings, "MUSIC_IMAGE_WIDTHS", DEFAULT_WIDTHS))
+
+
+def get_format() -> str:
+    return getattr(settings, "MUSIC_IMAGE_FORMAT", "WEBP")
+
+
+def rendition_name(source: str, width: int) -> str:
+    return f"{PREFIX}{source.lstrip('/')}/{width}.{FORMATS[get_format()]}"
+
+
+def parse_rendition_name(name: str) -> Optional[tuple]:
+    """(исходник, ширина) по имени копии или None, если имя не наше"""
+    if not name.startswith(PREFIX):
+        return None
+    source, _, filename = name[len(PREFIX) :].rpartition("/")
+    width, _, extension = filename.partition(".")
+    if not source or extension != FORMATS[get_format()] or not width.isdigit():
+        return None
+    if int(width) not in get_widths() or ".." in source.split("/"):
+        return None
+    return source, int(width)
+
+
+def render(source_file, width: int) -> bytes:
+    image = ImageOps.exif_transpose(Image.open(source_file))
+    image_format = get_format()
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    # Не увеличиваем: узкий исходник сохраняется в своем размере
+    image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+    output = BytesIO()
+    image.save(output, image_format, quality=80, method=4)
+    return output.getvalue()
+
+
+def ensure_rendition(name: str) -> bool:
+    """Строит копию, если ее еще нет; False — имя некорректно или исходник не картинка"""
+    parsed = parse_rendition_name(name)
+    if parsed is None:
+        return False
+    storage = storages["renditions"]
+    if storage.exists(name):
+        return True
+    source, width = parsed
+    if not default_storage.exists(source):
+        return False
+    try:
+        with default_storage.open(source) as source_file:
+            data = render(source_file, width)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        # Не картинка или слишком много пикселей (защита Pillow от бомб)
+        return False
+    storage.save(name, ContentFile(data))
+    return True
+
+
+def build_renditions(source: str) -> None:
+    for width in get_widths():
+        ensure_rendition(rendition_name(source, width))
+
+
+def delete_renditions(source: str) -> None:
+    storage = storages["renditions"]
+    directory = PREFIX + source.lstrip("/")
+    if not storage.exists(directory):
+        return
+    for filename in storage.listdir(directory)[1]:
+        storage.delete(posixpath.join(directory, filename))
+
+
+def srcset(source: str) -> str:
+    return ", ".join(
+        f"{storages['renditions'].url(rendition_name(source, width))} {width}w"
+        for width in get_widths()
+    )
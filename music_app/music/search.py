@@ -0,0 +1,274 @@
+"""Полнотекстовый поиск по артистам, альбомам, трекам и публичным плейлистам.
+
+Индекс — таблица music_search: виртуальная FTS5 в SQLite или таблица с
+tsvector и GIN-индексом в Postgres. Строка индекса адресуется ключом
+object_id * len(KINDS) + номер типа, поэтому обновление и удаление одной
+записи — поиск по первичному ключу. Индекс обновляется сигналами (см.
+music.signals), manage.py rebuild_search_index строит его заново.
+"""
+
+import hashlib
+import re
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.urls import reverse
+
+TABLE = "music_search"
+KINDS = ("artist", "album", "track", "playlist")
+MAX_TERMS = 8
+MAX_LIMIT = 50
+MAX_CANDIDATES = 500
+# Слова короче этого совпадают с огромной частью каталога: такие запросы кэшируются
+SHORT_TERM = 3
+SHORT_QUERY_TIMEOUT = 60
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "title, subtitle, kind UNINDEXED, object_id UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+]
+POSTGRES_DDL = [
+    f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+    "id bigint PRIMARY KEY, title text NOT NULL, subtitle text NOT NULL, "
+    "kind varchar(16) NOT NULL, object_id bigint NOT NULL, "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || "
+    "setweight(to_tsvector('simple', subtitle), 'B')) STORED)",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin (document)",
+]
+
+# Тексты для индекса по всем объектам; {key} — выражение ключа строки
+SOURCES = {
+    "artist": "SELECT {key}, a.name, '', 'artist', a.id FROM music_artist a",
+    "album": (
+        "SELECT {key}, a.title, ar.name, 'album', a.id "
+        "FROM music_album a JOIN music_artist ar ON ar.id = a.artist_id"
+    ),
+    "track": (
+        "SELECT {key}, a.title, ar.name, 'track', a.id "
+        "FROM music_track a JOIN music_artist ar ON ar.id = a.artist_id "
+        "WHERE a.status = 'ready'"
+    ),
+    "playlist": (
+        "SELECT {key}, a.title, u.username, 'playlist', a.id "
+        "FROM music_playlist a JOIN users_user u ON u.id = a.owner_id "
+        "WHERE a.is_public AND NOT a.is_liked_playlist"
+    ),
+}
+
+
+def is_supported(conn=connection) -> bool:
+    return conn.vendor in ("sqlite", "postgresql")
+
+
+def key_column(conn=connection) -> str:
+    return "rowid" if conn.vendor == "sqlite" else "id"
+
+
+def row_key(kind: str, object_id: int) -> int:
+    return object_id * len(KINDS) + KINDS.index(kind)
+
+
+def create_index(conn=connection) -> None:
+    if not is_supported(conn):
+        return
+    ddl = SQLITE_DDL if conn.vendor == "sqlite" else POSTGRES_DDL
+    with conn.cursor() as cursor:
+        for statement in ddl:
+            cursor.execute(statement)
+
+
+def drop_index(conn=connection) -> None:
+    if is_supported(conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def rebuild(conn=connection) -> None:
+    if not is_supported(conn):
+        return
+    key = key_column(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        for kind, source in SOURCES.items():
+            cursor.execute(
+                f"INSERT INTO {TABLE} ({key}, title, subtitle, kind, object_id) "
+                + source.format(key=f"a.id * {len(KINDS)} + {KINDS.index(kind)}")
+            )
+
+
+def document(instance) -> Optional[tuple]:
+    """(тип, заголовок, подзаголовок) объекта или None, если он не ищется"""
+    from .models import Album, Artist, Playlist, Track
+
+    if isinstance(instance, Artist):
+        return "artist", instance.name, ""
+    if isinstance(instance, Album):
+        return "album", instance.title, instance.artist.name
+    if isinstance(instance, Track):
+        if instance.status != Track.Status.READY:
+            return None
+        return "track", instance.title, instance.artist.name
+    if isinstance(instance, Playlist):
+        if not instance.is_public or instance.is_liked_playlist:
+            return None
+        return "playlist", instance.title, instance.owner.username
+    return None
+
+
+def kind_of(instance) -> str:
+    return type(instance).__name__.lower()
+
+
+def index_object(instance) -> None:
+    if not is_supported():
+        return
+    entry = document(instance)
+    if entry is None:
+        remove_object(instance)
+        return
+    kind, title, subtitle = entry
+    params = [row_key(kind, instance.pk), title, subtitle, kind, instance.pk]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {TABLE} "
+                "(rowid, title, subtitle, kind, object_id) VALUES (%s, %s, %s, %s, %s)",
+                params,
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {TABLE} (id, title, subtitle, kind, object_id) "
+                "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (id) DO UPDATE "
+                "SET title = EXCLUDED.title, subtitle = EXCLUDED.subtitle",
+                params,
+            )
+
+
+def remove_object(instance) -> None:
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE {key_column()} = %s",
+            [row_key(kind_of(instance), instance.pk)],
+        )
+
+
+def reindex_artist_releases(artist) -> None:
+    """Подзаголовок альбомов и треков — имя артиста, обновляем его"""
+    if not is_supported():
+        return
+    key = key_column()
+    with connection.cursor() as cursor:
+        for kind in ("album", "track"):
+            cursor.execute(
+                f"UPDATE {TABLE} SET subtitle = %s WHERE {key} IN ("
+                f"SELECT id * {len(KINDS)} + {KINDS.index(kind)} "
+                f"FROM music_{kind} WHERE artist_id = %s)",
+                [artist.name, artist.pk],
+            )
+
+
+def parse_terms(query: str) -> list:
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def result_url(kind: str, object_id: int) -> str:
+    if kind == "artist":
+        return reverse("music:artist_detail", kwargs={"pk": object_id})
+    if kind == "album":
+        return reverse("music:album_detail", kwargs={"album_id": object_id})
+    if kind == "track":
+        return reverse("music:stream_audio", kwargs={"track_id": object_id})
+    return reverse("music:playlist_detail", kwargs={"pk": object_id})
+
+
+def search(query: str, kind: Optional[str] = None, limit: int = 20) -> list:
+    """Поиск с префиксным совпадением каждого слова, лучшие сверху.
+
+    Ранжируются не все совпадения, а MAX_CANDIDATES самых новых: короткий
+    префикс на большом каталоге совпадает с сотнями тысяч строк, и bm25 по
+    всем стоил бы сотни миллисекунд. Если кандидатов больше, отдельно
+    ранжируются столько же новейших совпадений целых слов — так точное
+    старое совпадение не теряется за новыми записями с тем же префиксом.
+    """
+    terms = parse_terms(query)
+    if not terms or not is_supported():
+        return []
+    limit = max(1, min(limit, MAX_LIMIT))
+    if min(len(term) for term in terms) >= SHORT_TERM:
+        return run_query(terms, kind, limit)
+    cache = caches[getattr(settings, "MUSIC_SEARCH_CACHE", "default")]
+    digest = hashlib.sha1(" ".join(terms).encode()).hexdigest()
+    key = f"music:search:{kind}:{limit}:{digest}"
+    results = cache.get(key)
+    if results is None:
+        results = run_query(terms, kind, limit)
+        cache.set(key, results, timeout=SHORT_QUERY_TIMEOUT)
+    return results
+
+
+def ranked(match: str, kind: Optional[str], limit: int) -> list:
+    """Лучшие из MAX_CANDIDATES новейших совпадений match.
+
+    Строки — (тип, id, заголовок, подзаголовок, оценка, число кандидатов);
+    чем меньше оценка, тем лучше. MATCH вычисляется один раз: ранжирование
+    идет по уже выбранным кандидатам.
+    """
+    kind_filter = "AND kind = %s" if kind else ""
+    kind_params = [kind] if kind else []
+    if connection.vendor == "sqlite":
+        # Заголовок весит больше подзаголовка; bm25 тем лучше, чем меньше.
+        # Тексты читаются только для limit лучших, а не для всех кандидатов
+        sql = (
+            "SELECT kind, object_id, title, subtitle, score, total "
+            f"FROM {TABLE} JOIN (SELECT id, score, count(*) OVER () AS total "
+            f"FROM (SELECT rowid AS id, bm25({TABLE}, 10.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s {kind_filter} "
+            "ORDER BY rowid DESC LIMIT %s) ORDER BY score LIMIT %s) best "
+            f"ON {TABLE}.rowid = best.id ORDER BY score"
+        )
+        params = [match, *kind_params, MAX_CANDIDATES, limit]
+    else:
+        sql = (
+            "SELECT kind, object_id, title, subtitle, "
+            "-ts_rank(document, to_tsquery('simple', %s)) AS score, "
+            "count(*) OVER () FROM ("
+            f"SELECT kind, object_id, title, subtitle, document FROM {TABLE} "
+            f"WHERE document @@ to_tsquery('simple', %s) {kind_filter} "
+            "ORDER BY id DESC LIMIT %s) candidates ORDER BY score LIMIT %s"
+        )
+        params = [match, match, *kind_params, MAX_CANDIDATES, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def run_query(terms: list, kind: Optional[str], limit: int) -> list:
+    if connection.vendor == "sqlite":
+        prefix = " ".join(f'"{term}"*' for term in terms)
+        exact = " ".join(f'"{term}"' for term in terms)
+    else:
+        prefix = " & ".join(f"{term}:*" for term in terms)
+        exact = " & ".join(terms)
+    rows = ranked(prefix, kind, limit)
+    if rows and rows[0][5] >= MAX_CANDIDATES:
+        # Кандидаты обрезаны: старые совпадения целых слов добираем отдельно
+        rows = sorted(rows + ranked(exact, kind, limit), key=lambda row: row[4])
+    results = {}
+    for row_kind, object_id, title, subtitle, _, _ in rows:
+        results.setdefault(
+            (row_kind, object_id),
+            {
+                "type": row_kind,
+                "id": object_id,
+                "title": title,
+                "subtitle": subtitle,
+                "url": result_url(row_kind, object_id),
+            },
+        )
+    return list(results.values())[:limit]
@@ -0,0 +1,107 @@
+"""Обработчики сигналов: ссылки на файлы, кэши плейлистов и поисковый индекс.
+
+Обработчики подключаются к конкретным моделям в connect(), чтобы удаление
+остальных моделей (например, строк M2M) шло одним DELETE без Collector.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+from . import likes, playlists, search
+from .jobs import enqueue
+from .models import Album, Artist, Playlist, Track
+from .storage import change_references, tracked_file_fields
+
+# Поля с обложками, для которых строятся уменьшенные копии
+IMAGE_FIELDS = ("image",)
+
+
+def file_fields(sender) -> list:
+    return [field for model, field in tracked_file_fields() if model is sender]
+
+
+def file_names(instance, fields: list) -> list:
+    return [getattr(instance, field).name for field in fields if getattr(instance, field)]
+
+
+def remember_file_names(sender, instance, raw=False, **kwargs):
+    fields = file_fields(sender)
+    if raw or instance._state.adding:
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._stored_file_names = [name for name in old or () if name]
+
+
+def count_file_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    fields = file_fields(sender)
+    old = instance.__dict__.pop("_stored_file_names", [])
+    new = file_names(instance, fields)
+    change_references([name for name in new if name not in old], +1)
+    change_references([name for name in old if name not in new], -1)
+
+    images = file_names(instance, [field for field in fields if field in IMAGE_FIELDS])
+    for name in images:
+        if name not in old:
+            enqueue("build_renditions", source=name)
+
+
+def release_file_references(sender, instance, **kwargs):
+    change_references(file_names(instance, file_fields(sender)), -1)
+
+
+def invalidate_liked_tracks(sender, instance, action, reverse, pk_set, **kwargs):
+    """Изменения лайков в обход music.likes (админка, add/remove) сбрасывают кэш"""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        if instance.is_liked_playlist:
+            likes.invalidate(instance.owner_id)
+    elif pk_set is None:
+        likes.clear()
+    else:
+        owners = Playlist.objects.filter(
+            pk__in=pk_set, is_liked_playlist=True
+        ).values_list("owner_id", flat=True)
+        for owner_id in owners:
+            likes.invalidate(owner_id)
+
+
+def invalidate_playlist_count(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        playlists.forget_count(instance.pk)
+    elif pk_set is not None:
+        for playlist_id in pk_set:
+            playlists.forget_count(playlist_id)
+
+
+def invalidate_deleted_liked_playlist(sender, instance, **kwargs):
+    if instance.is_liked_playlist:
+        likes.invalidate(instance.owner_id)
+
+
+def update_search_index(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_object(instance)
+    if sender is Artist and not created:
+        search.reindex_artist_releases(instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_object(instance)
+
+
+def connect() -> None:
+    for model in {model for model, _ in tracked_file_fields()}:
+        pre_save.connect(remember_file_names, sender=model)
+        post_save.connect(count_file_references, sender=model)
+        post_delete.connect(release_file_references, sender=model)
+    m2m_changed.connect(invalidate_liked_tracks, sender=Playlist.tracks.through)
+    m2m_changed.connect(invalidate_playlist_count, sender=Playlist.tracks.through)
+    post_delete.connect(invalidate_deleted_liked_playlist, sender=Playlist)
+    for model in (Artist, Album, Track, Playlist):
+        post_save.connect(update_search_index, sender=model)
+        post_delete.connect(remove_from_search_index, sender=model)
@@ -0,0 +1,206 @@
+"""Контентно-адресуемое хранилище загрузок.
+
+Файл сохраняется под именем <upload_to>/<xx>/<sha256>.<ext>, поэтому
+повторная загрузка того же содержимого не пишет на диск ничего. Ссылки на
+файлы из FileField считаются в MediaBlob (см. music.signals), а
+manage.py gc_media удаляет файлы, на которые больше никто не ссылается.
+"""
+
+import functools
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Iterable, Iterator
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .renditions import delete_renditions
+from .streaming import local_path
+
+CONTENT_ADDRESSED_NAME = re.compile(r"^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$")
+
+
+class ContentAddressedMixin:
+    """Подмешивается к любому Storage: имя файла определяется его содержимым"""
+
+    def hashed_name(self, name: str, content) -> str:
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return "/".join(
+            part for part in (directory, hexdigest[:2], hexdigest + extension) if part
+        )
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        # Запись о файле продлевается до проверки exists(): gc_media удаляет
+        # файл только вместе с непродленной записью (collect_garbage)
+        register_blob(name)
+        if not self.exists(name):
+            name = super()._save(name, content)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Одинаковое имя означает одинаковое содержимое, суффиксы не нужны
+        return name
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    def __init__(self, **kwargs):
+        # Два одновременных сохранения одного содержимого пишут одни и те же байты
+        kwargs.setdefault("allow_overwrite", True)
+        super().__init__(**kwargs)
+
+
+@contextmanager
+def local_file(field_file) -> Iterator[str]:
+    """Путь к файлу на диске для внешних программ; удаленный файл копируется"""
+    path = local_path(field_file.storage, field_file.name)
+    if path is not None:
+        yield path
+        return
+    suffix = os.path.splitext(field_file.name)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as copy:
+        with field_file.open("rb") as source:
+            shutil.copyfileobj(source, copy)
+        copy.flush()
+        yield copy.name
+
+
+def is_content_addressed(name: str) -> bool:
+    return bool(name) and CONTENT_ADDRESSED_NAME.match(name) is not None
+
+
+@functools.cache
+def tracked_file_fields() -> list:
+    """(модель, имя поля) для всех FileField приложения music"""
+    return [
+        (model, field.name)
+        for model in apps.get_app_config("music").get_models()
+        for field in model._meta.fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def register_blob(name: str) -> None:
+    """Заводит запись о сохраненном файле; без ссылок ее заберет gc_media.
+
+    Повторное сохранение продлевает запись, чтобы gc не удалил файл между
+    сохранением и записью модели.
+    """
+    MediaBlob = apps.get_model("music", "MediaBlob")
+    if not MediaBlob.objects.filter(name=name).update(updated_at=timezone.now()):
+        MediaBlob.objects.get_or_create(name=name)
+
+
+def change_references(names: Iterable[str], delta: int) -> None:
+    MediaBlob = apps.get_model("music", "MediaBlob")
+    now = timezone.now()
+    for name, count in Counter(n for n in names if is_content_addressed(n)).items():
+        updated = MediaBlob.objects.filter(name=name).update(
+            refcount=F("refcount") + delta * count, updated_at=now
+        )
+        if not updated and delta > 0:
+            try:
+                MediaBlob.objects.create(name=name, refcount=count)
+            except IntegrityError:
+                MediaBlob.objects.filter(name=name).update(
+                    refcount=F("refcount") + count, updated_at=now
+                )
+
+
+def referenced_names(names: Iterable[str]) -> set:
+    """Какие из имен реально упомянуты в FileField моделей"""
+    names = list(names)
+    referenced = set()
+    for model, field in tracked_file_fields():
+        referenced.update(
+            model.objects.filter(**{f"{field}__in": names}).values_list(
+                field, flat=True
+            )
+        )
+    return referenced
+
+
+def collect_garbage(grace: timedelta = timedelta(hours=1), dry_run: bool = False):
+    """Удаляет файлы без ссылок старше grace; возвращает список удаленных имен.
+
+    Перед удалением ссылки перепроверяются по базе, поэтому разошедшийся
+    счетчик приводит к исправлению refcount, а не к потере файла. Файл
+    удаляется только вместе со своей записью: запись, которую повторная
+    загрузка успела продлить, и ее файл остаются.
+    """
+    MediaBlob = apps.get_model("music", "MediaBlob")
+    candidates = MediaBlob.objects.filter(
+        refcount__lte=0, updated_at__lt=timezone.now() - grace
+    )
+    names = list(candidates.values_list("name", flat=True))
+    deleted = []
+    for start in range(0, len(names), 500):
+        batch = names[start : start + 500]
+        referenced = referenced_names(batch)
+        for name in referenced:
+            count = sum(
+                model.objects.filter(**{field: name}).count()
+                for model, field in tracked_file_fields()
+            )
+            MediaBlob.objects.filter(name=name).update(refcount=count)
+        orphans = [name for name in batch if name not in referenced]
+        if dry_run:
+            deleted.extend(orphans)
+            continue
+        with transaction.atomic():
+            # Блокировка держит register_blob до конца удаления файлов
+            rows = candidates.select_for_update().filter(name__in=orphans)
+            orphans = list(rows.values_list("name", flat=True))
+            MediaBlob.objects.filter(name__in=orphans).delete()
+            for name in orphans:
+                default_storage.delete(name)
+                delete_renditions(name)
+        deleted.extend(orphans)
+    return deleted
+
+
+def migrate_legacy_files(dry_run: bool = False) -> int:
+    """Переносит файлы, сохраненные до контентной адресации, и удаляет дубликаты.
+
+    Возвращает число обновленных ссылок.
+    """
+    moved = {}
+    updated = 0
+    for model, field in tracked_file_fields():
+        rows = model.objects.exclude(**{field: ""}).values_list("pk", field)
+        for pk, name in rows.iterator():
+            if is_content_addressed(name):
+                continue
+            if name not in moved:
+                path = name.lstrip("/")
+                if not default_storage.exists(path):
+                    continue
+                if dry_run:
+                    moved[name] = name
+                else:
+                    with default_storage.open(path) as content:
+                        moved[name] = default_storage.save(path, content)
+            if not dry_run:
+                model.objects.filter(pk=pk).update(**{field: moved[name]})
+                change_references([moved[name]], +1)
+            updated += 1
+
+    if not dry_run:
+        for name in set(moved) - referenced_names(moved):
+            default_storage.delete(name.lstrip("/"))
+    return updated
@@ -0,0 +1,479 @@
+import asyncio
+import math
+import mimetypes
+import os
+import secrets
+import weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.module_loading import import_string
+
+CHUNK_SIZE = 8192
+# Форматы, которые принимает CreateTrackForm, и частые прочие
+AUDIO_CONTENT_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".oga": "audio/ogg",
+    ".flac": "audio/flac",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/aac",
+}
+# Больше диапазонов в одном запросе не обслуживаем, чтобы не плодить мелкие чтения
+MAX_RANGES = 16
+
+
+def audio_content_type(name: str) -> str:
+    extension = os.path.splitext(name)[1].lower()
+    if extension in AUDIO_CONTENT_TYPES:
+        return AUDIO_CONTENT_TYPES[extension]
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[list]:
+    """Разбирает заголовок Range (RFC 7233) в список диапазонов (start, end) включительно.
+
+    None — заголовок некорректен и игнорируется (отдаем файл целиком),
+    пустой список — ни один диапазон не удовлетворим (416).
+    Пересекающиеся и соседние диапазоны склеиваются.
+    """
+    # Разделяем "bytes=0-100,200-" на "bytes" и "0-100,200-"
+    unit, sep, specs = range_header.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+
+    ranges = []
+    parsed = 0
+    for spec in specs.split(","):
+        spec = spec.strip()
+        if not spec:
+            continue
+        start_str, sep, end_str = spec.partition("-")
+        if not sep or not (start_str or end_str):
+            return None
+        if not all(part.isdigit() for part in (start_str, end_str) if part):
+            return None
+        parsed += 1
+
+        if not start_str:
+            # Суффиксный диапазон "bytes=-500": последние 500 байт файла
+            length = int(end_str)
+            if length == 0:
+                continue
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            start = int(start_str)
+            # Если end не указан (например, "bytes=0-"), берем конец файла
+            end = int(end_str) if end_str else file_size - 1
+            if end_str and end < start:
+                return None
+
+        if start >= file_size:
+            continue
+        # Корректируем end, если он больше размера файла
+        ranges.append((start, min(end, file_size - 1)))
+
+    if not parsed or parsed > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def seek_ranges(seek_index, seconds: str, file_size: int) -> Optional[list]:
+    """Диапазон от кадра, в котором звучит момент ?t=seconds, до конца файла"""
+    if seek_index is None:
+        return None
+    try:
+        seconds = float(seconds)
+    except ValueError:
+        return None
+    if not math.isfinite(seconds):
+        return None
+    start = seek_index.offset_for(seconds)
+    return [(start, file_size - 1)] if start < file_size else None
+
+
+def file_validators(file_stat: os.stat_result, content_hash: str = "") -> tuple:
+    """ETag и Last-Modified файла: по хешу содержимого, если он известен, иначе по stat"""
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        etag = f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+    return etag, int(file_stat.st_mtime)
+
+
+def set_validators(response: HttpResponseBase, etag: str, last_modified: int) -> None:
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(
+        response, max_age=getattr(settings, "MUSIC_STREAM_MAX_AGE", 60 * 60 * 24)
+    )
+
+
+def conditional_response(request, etag: str, last_modified: int):
+    """304/412 по If-None-Match, If-Modified-Since и т.п. или None"""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def if_range_matches(request, etag: str, last_modified: int) -> bool:
+    """Проверяет If-Range: при несовпадении Range игнорируется и отдается весь файл"""
+    if_range = request.headers.get("If-Range", "").strip()
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        # Для If-Range допустимо только строгое сравнение, слабый ETag не совпадает
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def range_not_satisfiable(file_size: int) -> HttpResponse:
+    response = HttpResponse(status=416)
+    response["Content-Range"] = f"bytes */{file_size}"
+    return response
+
+
+def read_range(file, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+    file.seek(start)
+    remaining = end - start + 1
+
+    while remaining > 0:
+        data = file.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def iter_parts(
+    file_path: str, parts: list, closing: bytes = b"", chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Отдает части (заголовок, start, end) файла, открывая его один раз"""
+    with open(file_path, "rb") as file:
+        for header, start, end in parts:
+            if header:
+                yield header
+            yield from read_range(file, start, end, chunk_size)
+    if closing:
+        yield closing
+
+
+def file_iterator(file_path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    """Читает байты [start, end] файла кусками по chunk_size"""
+    return iter_parts(file_path, [(b"", start, end)], chunk_size=chunk_size)
+
+
+# Семафоры ограничения открытых файлов, по одному на event loop
+_open_file_slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def open_file_slot():
+    """Ждет свободный слот из settings.MUSIC_STREAM_MAX_OPEN_FILES"""
+    loop = asyncio.get_running_loop()
+    slots = _open_file_slots.get(loop)
+    if slots is None:
+        limit = getattr(settings, "MUSIC_STREAM_MAX_OPEN_FILES", 1024)
+        slots = _open_file_slots[loop] = asyncio.Semaphore(limit)
+    async with slots:
+        yield
+
+
+async def aiter_parts(
+    file_path: str, parts: list, closing: bytes = b"", chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Асинхронный iter_parts: чтение идет в пуле потоков и не блокирует event loop"""
+    async with open_file_slot():
+        file = await asyncio.to_thread(open, file_path, "rb")
+        try:
+            for header, start, end in parts:
+                if header:
+                    yield header
+                await asyncio.to_thread(file.seek, start)
+                remaining = end - start + 1
+
+                while remaining > 0:
+                    data = await asyncio.to_thread(
+                        file.read, min(chunk_size, remaining)
+                    )
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+        finally:
+            await asyncio.to_thread(file.close)
+    if closing:
+        yield closing
+
+
+def afile_iterator(
+    file_path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """Асинхронный file_iterator"""
+    return aiter_parts(file_path, [(b"", start, end)], chunk_size=chunk_size)
+
+
+class RangeFileWrapper:
+    """Файловый объект, ограниченный диапазоном [start, end].
+
+    Отдает fileno(), поэтому wsgi.file_wrapper сервера (gunicorn) отправляет
+    диапазон через os.sendfile. Если сервер так не умеет, FileResponse читает
+    файл через read() и не выходит за конец диапазона.
+    """
+
+    def __init__(self, file, start: int, end: int):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = end - start + 1
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class BaseDelivery:
+    """Способ отдачи аудиофайла клиенту"""
+
+    def serve(
+        self,
+        file_path: str,
+        file_size: int,
+        byte_ranges: Optional[list],
+        content_type: str,
+    ) -> HttpResponseBase:
+        if not byte_ranges:
+            response = self.full(file_path, file_size, content_type)
+        elif len(byte_ranges) == 1:
+            start, end = byte_ranges[0]
+            response = self.partial(file_path, start, end, content_type)
+            response.status_code = 206
+            response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+            response["Content-Length"] = end - start + 1
+        else:
+            response = self.multipart(file_path, file_size, byte_ranges, content_type)
+            response.status_code = 206
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    def full(self, file_path: str, file_size: int, content_type: str):
+        return FileResponse(
+            open(file_path, "rb"), content_type=content_type, as_attachment=False
+        )
+
+    def partial(self, file_path: str, start: int, end: int, content_type: str):
+        raise NotImplementedError
+
+    def multipart(
+        self, file_path: str, file_size: int, byte_ranges: list, content_type: str
+    ):
+        """Ответ multipart/byteranges с заранее посчитанной длиной"""
+        boundary = secrets.token_hex(16)
+        parts = [
+            (
+                (
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+                ).encode(),
+                start,
+                end,
+            )
+            for start, end in byte_ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode()
+        response = StreamingHttpResponse(
+            self.iter_parts(file_path, parts, closing),
+            content_type=f"multipart/byteranges; boundary={boundary}",
+        )
+        response["Content-Length"] = len(closing) + sum(
+            len(header) + end - start + 1 for header, start, end in parts
+        )
+        return response
+
+    def iter_parts(self, file_path: str, parts: list, closing: bytes):
+        return iter_parts(file_path, parts, closing)
+
+
+class PythonDelivery(BaseDelivery):
+    """Чтение диапазона в Python кусками по CHUNK_SIZE"""
+
+    def partial(self, file_path, start, end, content_type):
+        return StreamingHttpResponse(
+            file_iterator(file_path, start, end), content_type=content_type
+        )
+
+
+class SendfileDelivery(BaseDelivery):
+    """Отдача диапазона через os.sendfile с помощью wsgi.file_wrapper.
+
+    multipart/byteranges отдается через Python, как в PythonDelivery.
+    """
+
+    def partial(self, file_path, start, end, content_type):
+        return FileResponse(
+            RangeFileWrapper(open(file_path, "rb"), start, end),
+            content_type=content_type,
+        )
+
+
+class AsyncDelivery(BaseDelivery):
+    """Отдача через асинхронный итератор для ASGI"""
+
+    def full(self, file_path, file_size, content_type):
+        return self.partial(file_path, 0, file_size - 1, content_type)
+
+    def partial(self, file_path, start, end, content_type):
+        response = StreamingHttpResponse(
+            afile_iterator(file_path, start, end, self.chunk_size),
+            content_type=content_type,
+        )
+        response["Content-Length"] = end - start + 1
+        return response
+
+    def iter_parts(self, file_path, parts, closing):
+        return aiter_parts(file_path, parts, closing, self.chunk_size)
+
+    @property
+    def chunk_size(self) -> int:
+        return getattr(settings, "MUSIC_STREAM_ASYNC_CHUNK_SIZE", 64 * 1024)
+
+
+class XAccelRedirectDelivery(BaseDelivery):
+    """Передает отдачу файла nginx через X-Accel-Redirect.
+
+    Range (в том числе multipart) nginx обрабатывает сам, поэтому ответ
+    всегда без тела.
+    """
+
+    header = "X-Accel-Redirect"
+
+    def serve(self, file_path, file_size, byte_ranges, content_type):
+        response = HttpResponse(content_type=content_type)
+        response[self.header] = self.get_location(file_path)
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    def get_location(self, file_path: str) -> str:
+        prefix = getattr(settings, "MUSIC_STREAM_ACCEL_PREFIX", "/protected-media/")
+        relative = os.path.relpath(file_path, settings.MEDIA_ROOT)
+        return prefix.rstrip("/") + "/" + relative.replace(os.sep, "/")
+
+
+class XSendfileDelivery(XAccelRedirectDelivery):
+    """Передает отдачу файла Apache (mod_xsendfile) и lighttpd"""
+
+    header = "X-Sendfile"
+
+    def get_location(self, file_path: str) -> str:
+        return os.path.abspath(file_path)
+
+
+DELIVERY_BACKENDS = {
+    "python": PythonDelivery,
+    "sendfile": SendfileDelivery,
+    "x-accel-redirect": XAccelRedirectDelivery,
+    "x-sendfile": XSendfileDelivery,
+}
+
+
+def get_delivery_backend() -> BaseDelivery:
+    """Возвращает бэкенд из settings.MUSIC_STREAM_DELIVERY (имя или путь к классу)"""
+    name = getattr(settings, "MUSIC_STREAM_DELIVERY", "sendfile")
+    if name == "sendfile" and not hasattr(os, "sendfile"):
+        name = "python"
+    backend_class = DELIVERY_BACKENDS.get(name) or import_string(name)
+    return backend_class()
+
+
+def get_async_delivery_backend() -> BaseDelivery:
+    """Бэкенд для ASGI: выгрузка в веб-сервер, если настроена, иначе AsyncDelivery"""
+    backend = get_delivery_backend()
+    if isinstance(backend, XAccelRedirectDelivery):
+        return backend
+    return AsyncDelivery()
+
+
+def local_path(storage, name: str) -> Optional[str]:
+    """Путь к файлу на диске или None для удаленного хранилища (S3 и т.п.)"""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def get_url_expire() -> int:
+    return getattr(settings, "MUSIC_STORAGE_URL_EXPIRE", 300)
+
+
+def signed_url(storage, name: str, content_type: Optional[str] = None) -> str:
+    """Ссылка на файл в хранилище; подписанная, если хранилище это умеет"""
+    if hasattr(storage, "signed_url"):
+        return storage.signed_url(name, get_url_expire(), content_type)
+    return storage.url(name)
+
+
+def redirect_to_storage(
+    storage, name: str, content_type: Optional[str] = None
+) -> HttpResponseRedirect:
+    """Отправляет клиента за файлом прямо в хранилище; Range обработает оно само"""
+    response = HttpResponseRedirect(signed_url(storage, name, content_type))
+    # Подпись истекает через expire секунд: редирект кэшируем вдвое меньше
+    patch_cache_control(response, private=True, max_age=get_url_expire() // 2)
+    return response
+
+
+def iter_storage_range(
+    storage, name: str, start: int, end: int, chunk_size: int = CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Байты [start, end] файла хранилища; S3 читает только этот диапазон"""
+    if hasattr(storage, "iter_range"):
+        yield from storage.iter_range(name, start, end, chunk_size)
+        return
+    with storage.open(name, "rb") as file:
+        yield from read_range(file, start, end, chunk_size)
+
+
+def proxy_storage_range(
+    storage, name: str, file_size: int, start: int, end: int, content_type: str
+) -> StreamingHttpResponse:
+    """206 с диапазоном из хранилища, когда редирект не подходит (перемотка ?t)"""
+    response = StreamingHttpResponse(
+        iter_storage_range(storage, name, start, end), content_type=content_type
+    )
+    response.status_code = 206
+    response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    response["Content-Length"] = end - start + 1
+    response["Accept-Ranges"] = "bytes"
+    return response
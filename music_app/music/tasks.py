@@ -0,0 +1,56 @@
+from mutagen import File
+
+from . import hls
+from .jobs import enqueue, task
+from .models import Genre, Track, TrackAnalysis, TrackSeekIndex
+from .renditions import build_renditions
+
+
+def mark_track_failed(track_id: int) -> None:
+    Track.objects.filter(pk=track_id).update(status=Track.Status.FAILED)
+
+
+@task("ingest_track", on_failure=mark_track_failed)
+def ingest_track(track_id: int) -> None:
+    """Обработка загруженного трека: длительность, теги, хеш, таблица перемотки"""
+    track = Track.objects.filter(pk=track_id).first()
+    if track is None:
+        return
+
+    with track.audio_file.open("rb") as audio_file:
+        audio = File(audio_file, easy=True)
+    if audio is None:
+        raise ValueError(f"Unsupported audio file {track.audio_file.name}")
+
+    track.duration = int(audio.info.length)
+    genres = (audio.tags or {}).get("genre")
+    if track.genre_id is None and genres:
+        track.genre, _ = Genre.objects.get_or_create(title=genres[0][:64])
+    track.update_content_hash()
+    TrackSeekIndex.build_for(track)
+
+    track.status = Track.Status.READY
+    track.save(update_fields=["duration", "genre", "content_hash", "status"])
+    enqueue("transcode_track", track_id=track.pk)
+    enqueue("analyze_track", track_id=track.pk)
+
+
+@task("transcode_track")
+def transcode_track(track_id: int) -> None:
+    """HLS-варианты трека; до их появления трек играет целиком через stream_audio"""
+    track = Track.objects.filter(pk=track_id).first()
+    if track is not None:
+        hls.package(track)
+
+
+@task("analyze_track")
+def analyze_track(track_id: int) -> None:
+    """Волна и громкость для плеера"""
+    track = Track.objects.filter(pk=track_id).first()
+    if track is not None:
+        TrackAnalysis.build_for(track)
+
+
+@task("build_renditions")
+def build_image_renditions(source: str) -> None:
+    build_renditions(source)
@@ -0,0 +1,26 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+from music.renditions import srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, sizes: str = "100vw", **attrs) -> str:
+    """<img> со srcset из уменьшенных копий: {% responsive_image track.image sizes="60px" alt=track.title %}
+
+    image — поле модели или имя файла в хранилище (например, из снимка чартов).
+    """
+    if not image:
+        return ""
+    name = image if isinstance(image, str) else image.name
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" loading="lazy" decoding="async"{}>',
+        default_storage.url(name),
+        srcset(name),
+        sizes,
+        flatatt(attrs),
+    )
@@ -1,3 +1,1467 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import wave
+
+from array import array
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from mutagen.easyid3 import EasyID3
+from PIL import Image
+from users.models import User
+
+from . import (
+    api,
+    database,
+    charts,
+    explain,
+    hls,
+    jobs,
+    likes,
+    loaders,
+    metrics,
+    playlists,
+    playqueue,
+    plays,
+    recommendations,
+    search,
+    seeking,
+    storage,
+)
+from .analysis import analyze_file
+from .jobs import run_pending
+from .mixins import encode_cursor
+from .models import (
+    Album,
+    Artist,
+    ArtistListener,
+    ChartSnapshot,
+    Job,
+    MediaBlob,
+    Playlist,
+    PlaylistTrack,
+    Track,
+    TrackAnalysis,
+    TrackNeighbors,
+    TrackPlayDay,
+    TrackRendition,
+    TrackSeekIndex,
+)
+from .renditions import rendition_name
+from .seeking import build_seek_index
+from .storage import ContentAddressedStorage, collect_garbage
+from .streaming import parse_range_header
+from .tasks import analyze_track, transcode_track
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def setUpModule():
+    # Буфер прослушиваний сбрасывают сами тесты, без фонового потока
+    override = override_settings(MUSIC_PLAYS_AUTO_FLUSH=False)
+    override.enable()
+    unittest.addModuleCleanup(override.disable)
+
+
+# Кадр MPEG 1 Layer III, 128 кбит/с, 44100 Гц: 417 байт, 1152 сэмпла
+MP3_FRAME = b"\xff\xfb\x90\x00" + bytes(413)
+
+
+class ParseRangeHeaderTests(TestCase):
+    def test_closed_range(self):
+        self.assertEqual(parse_range_header("bytes=0-99", 1000), [(0, 99)])
+
+    def test_open_range(self):
+        self.assertEqual(parse_range_header("bytes=500-", 1000), [(500, 999)])
+
+    def test_end_clamped_to_file_size(self):
+        self.assertEqual(parse_range_header("bytes=900-5000", 1000), [(900, 999)])
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range_header("bytes=-300", 1000), [(700, 999)])
+        self.assertEqual(parse_range_header("bytes=-5000", 1000), [(0, 999)])
+
+    def test_multiple_ranges_are_sorted_and_coalesced(self):
+        self.assertEqual(
+            parse_range_header("bytes=200-299, 0-99,250-400", 1000),
+            [(0, 99), (200, 400)],
+        )
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range_header("bytes=1000-", 1000), [])
+        self.assertEqual(parse_range_header("bytes=-0", 1000), [])
+
+    def test_invalid_is_ignored(self):
+        self.assertIsNone(parse_range_header("items=0-1", 1000))
+        self.assertIsNone(parse_range_header("bytes=5-1", 1000))
+        self.assertIsNone(parse_range_header("bytes=a-b", 1000))
+        self.assertIsNone(parse_range_header("bytes=", 1000))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AudioStreamViewTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.payload = bytes(range(256)) * 40
+        artist = Artist.objects.create(name="artist", image="artists_cards/a.jpg")
+        self.track = Track.objects.create(title="track", artist=artist)
+        self.track.audio_file.save("track.mp3", ContentFile(self.payload))
+        self.url = reverse("music:stream_audio", kwargs={"track_id": self.track.pk})
+
+    def tearDown(self):
+        # События из буфера пишутся внутри транзакции теста
+        plays.buffer.flush()
+
+    def test_partial_content_for_each_backend(self):
+        for backend in ("python", "sendfile"):
+            with self.subTest(backend=backend), self.settings(
+                MUSIC_STREAM_DELIVERY=backend
+            ):
+                response = self.client.get(self.url, headers={"Range": "bytes=10-8999"})
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response["Content-Length"], "8990")
+                self.assertEqual(
+                    response["Content-Range"], f"bytes 10-8999/{len(self.payload)}"
+                )
+                self.assertEqual(
+                    b"".join(response.streaming_content), self.payload[10:9000]
+                )
+
+    async def test_async_partial_content(self):
+        url = reverse("music:stream_audio_async", kwargs={"track_id": self.track.pk})
+        response = await self.async_client.get(url, headers={"Range": "bytes=100-"})
+        self.assertEqual(response.status_code, 206)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(content, self.payload[100:])
+
+    def test_multipart_byteranges(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=0-9,-10"})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        content = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(content))
+        self.assertIn(self.payload[:10], content)
+        self.assertIn(f"Content-Range: bytes 0-9/{len(self.payload)}".encode(), content)
+        self.assertIn(self.payload[-10:], content)
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=99999-"})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.payload)}")
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=0-9", "If-Range": etag}
+        )
+        self.assertEqual(response.status_code, 206)
+
+        response = self.client.get(
+            self.url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.payload)
+
+    def test_content_hash_etag(self):
+        self.track.update_content_hash()
+        self.track.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response["ETag"], f'"{self.track.content_hash}"')
+
+    def test_seek_by_time(self):
+        self.track.audio_file.save("seek.mp3", ContentFile(MP3_FRAME * 200))
+        index = TrackSeekIndex.build_for(self.track)
+        self.assertEqual(index.offset_for(1.0), 417 * 38)
+
+        response = self.client.get(self.url, {"t": "1.0"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes {417 * 38}-{417 * 200 - 1}/{417 * 200}"
+        )
+
+    def test_seek_index_is_built_in_chunks(self):
+        # Кадр на стыке кусков и мусор между кадрами
+        data = MP3_FRAME * 50 + b"\x00\x01\x02" + MP3_FRAME * 50
+        whole = build_seek_index(io.BytesIO(data), 0.5)
+        with mock.patch.object(seeking, "CHUNK_SIZE", 100):
+            self.assertEqual(build_seek_index(io.BytesIO(data), 0.5), whole)
+
+    def test_content_type_follows_file_format(self):
+        self.track.audio_file.save("track.wav", ContentFile(self.payload))
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "audio/wav")
+
+    @override_settings(MUSIC_STREAM_DELIVERY="x-accel-redirect")
+    def test_accel_redirect(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=0-9"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/{self.track.audio_file.name}"
+        )
+        self.assertEqual(response.content, b"")
+
+
+class RemoteStorage(ContentAddressedStorage):
+    """Хранилище без доступа к файлам по пути, как S3; ссылки подписанные"""
+
+    def path(self, name):
+        raise NotImplementedError
+
+    def size(self, name):
+        return os.path.getsize(FileSystemStorage.path(self, name))
+
+    def signed_url(self, name, expire, content_type=None):
+        return f"https://bucket.example/{name}?expires={expire}&type={content_type}"
+
+    def iter_range(self, name, start, end, chunk_size):
+        with open(FileSystemStorage.path(self, name), "rb") as file:
+            file.seek(start)
+            yield file.read(end - start + 1)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    STORAGES={**settings.STORAGES, "default": {"BACKEND": "music.tests.RemoteStorage"}},
+)
+class RemoteStorageStreamTests(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="artist")
+        self.track = Track.objects.create(title="track", artist=artist)
+        # Файл кладем локальным хранилищем: у удаленного нет path() для записи
+        local = ContentAddressedStorage()
+        name = local.save("tracks/seek.mp3", ContentFile(MP3_FRAME * 200))
+        Track.objects.filter(pk=self.track.pk).update(audio_file=name)
+        self.track.refresh_from_db()
+        with local.open(name) as audio:
+            TrackSeekIndex.objects.create(
+                track=self.track, step=0.5, offsets=build_seek_index(audio, 0.5)
+            )
+        self.url = reverse("music:stream_audio", kwargs={"track_id": self.track.pk})
+
+    def tearDown(self):
+        plays.buffer.flush()
+
+    def test_redirects_to_signed_url(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=0-"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            response["Location"],
+            f"https://bucket.example/{self.track.audio_file.name}"
+            "?expires=300&type=audio/mpeg",
+        )
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_seek_is_proxied(self):
+        response = self.client.get(self.url, {"t": "1.0"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            b"".join(response.streaming_content), (MP3_FRAME * 200)[417 * 38 :]
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CreateTrackTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("label", password="password")
+        self.artist = Artist.objects.create(
+            name="artist", image="artists_cards/a.jpg", user=self.user
+        )
+        self.client.force_login(self.user)
+
+    def upload(self):
+        cover = io.BytesIO()
+        Image.new("RGB", (10, 10)).save(cover, "JPEG")
+        return self.client.post(
+            reverse("music:create_track", kwargs={"pk": self.artist.pk}),
+            {
+                "title": "track",
+                "image": SimpleUploadedFile("cover.jpg", cover.getvalue(), "image/jpeg"),
+                "audio_file": SimpleUploadedFile(
+                    "track.mp3", MP3_FRAME * 400, "audio/mpeg"
+                ),
+            },
+        )
+
+    def test_upload_is_processed_in_background(self):
+        response = self.upload()
+        self.assertRedirects(
+            response, reverse("music:artist_detail", kwargs={"pk": self.artist.pk})
+        )
+        track = Track.objects.get()
+        self.assertEqual(track.status, Track.Status.PENDING)
+        self.assertEqual(track.duration, 0)
+        job = Job.objects.get(name="ingest_track")
+        self.assertEqual(job.payload, {"track_id": track.pk})
+
+        self.assertTrue(
+            Job.objects.filter(
+                name="build_renditions", payload={"source": track.image.name}
+            ).exists()
+        )
+        run_pending()
+        track.refresh_from_db()
+        self.assertEqual(track.status, Track.Status.READY)
+        self.assertEqual(track.duration, 10)
+        self.assertEqual(len(track.content_hash), 64)
+        self.assertTrue(TrackSeekIndex.objects.filter(track=track).exists())
+        self.assertTrue(
+            storages["renditions"].exists(rendition_name(track.image.name, 64))
+        )
+
+
+    def test_result_of_reclaimed_job_is_discarded(self):
+        self.upload()
+        job = jobs.claim_next()
+        # Другой воркер забрал задачу после LOCK_TIMEOUT
+        stolen = job.locked_at + timedelta(seconds=1)
+        Job.objects.filter(pk=job.pk).update(locked_at=stolen)
+        self.assertFalse(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_at), (Job.Status.RUNNING, stolen))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MUSIC_FFMPEG="missing-ffmpeg")
+class HLSTests(TestCase):
+    def setUp(self):
+        artist = Artist.objects.create(name="artist")
+        self.track = Track.objects.create(title="track", artist=artist)
+        # 400 кадров по 1152 сэмпла: 10.45 с
+        self.track.audio_file.save("track.mp3", ContentFile(MP3_FRAME * 400))
+
+    def tearDown(self):
+        plays.buffer.flush()
+
+    def test_mp3_is_segmented_without_ffmpeg(self):
+        transcode_track(self.track.pk)
+        rendition = TrackRendition.objects.get(track=self.track)
+        self.assertEqual(rendition.bitrate, 128)
+        segments = list(rendition.segments.order_by("number"))
+        self.assertEqual(len(segments), 2)
+        self.assertAlmostEqual(sum(s.duration for s in segments), 400 * 1152 / 44100)
+        with segments[1].file.open() as segment:
+            self.assertEqual(segment.read(3), b"ID3")
+        self.assertEqual(
+            MediaBlob.objects.get(name=segments[0].file.name).refcount, 1
+        )
+
+        url = reverse("music:hls_master", kwargs={"track_id": self.track.pk})
+        master = self.client.get(url)
+        self.assertEqual(master["Content-Type"], "application/vnd.apple.mpegurl")
+        playlist_url = reverse(
+            "music:hls_playlist", kwargs={"track_id": self.track.pk, "bitrate": 128}
+        )
+        self.assertIn(playlist_url, master.content.decode())
+
+        playlist = self.client.get(playlist_url).content.decode()
+        self.assertIn("#EXT-X-TARGETDURATION:7", playlist)
+        self.assertIn(segments[1].file.url, playlist)
+        self.assertTrue(playlist.endswith("#EXT-X-ENDLIST\n"))
+
+    def test_segments_are_read_in_chunks(self):
+        data = MP3_FRAME * 200 + b"\x00\x01" + MP3_FRAME * 200
+        with mock.patch.object(seeking, "CHUNK_SIZE", 100):
+            segments = list(hls.segment_mp3(io.BytesIO(data), 6))
+        payload = b"".join(
+            segment[len(hls.id3_timestamp(0)) :] for segment, _ in segments
+        )
+        self.assertEqual(payload, data)
+        self.assertEqual(len(segments), 2)
+
+    def test_master_playlist_404_before_transcoding(self):
+        url = reverse("music:hls_master", kwargs={"track_id": self.track.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+def wav_bytes(samples: list, rate: int) -> bytes:
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(array("h", samples).tobytes())
+    return output.getvalue()
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, MUSIC_FFMPEG="missing-ffmpeg", MUSIC_WAVEFORM_POINTS=40
+)
+class TrackAnalysisTests(TestCase):
+    def setUp(self):
+        rate = 8000
+        # Секунда тишины, две секунды синуса 440 Гц на половине шкалы, секунда тишины
+        tone = [
+            round(16384 * math.sin(2 * math.pi * 440 * n / rate))
+            for n in range(2 * rate)
+        ]
+        samples = [0] * rate + tone + [0] * rate
+        artist = Artist.objects.create(name="artist")
+        self.track = Track.objects.create(title="track", artist=artist)
+        self.track.audio_file.save("track.wav", ContentFile(wav_bytes(samples, rate)))
+        self.track.update_content_hash()
+        self.track.save()
+
+    def test_analysis_and_peaks_endpoint(self):
+        analyze_track(self.track.pk)
+        analysis = TrackAnalysis.objects.get(track=self.track)
+        self.assertAlmostEqual(analysis.trim_start, 1.0, delta=0.02)
+        self.assertAlmostEqual(analysis.trim_end, 3.0, delta=0.02)
+        self.assertAlmostEqual(analysis.peak, 0.5, delta=0.01)
+        # Синус с амплитудой 0.5: -0.691 + 10 lg 0.125 = -9.72; блоки на краях
+        # звука проходят относительный гейт и немного понижают оценку
+        self.assertAlmostEqual(analysis.loudness, -9.72, delta=1.0)
+        self.assertAlmostEqual(analysis.replay_gain, -18 - analysis.loudness)
+        peaks = bytes(analysis.peaks)
+        self.assertEqual(len(peaks), 40)
+        self.assertEqual(peaks[0], 0)
+        self.assertEqual(peaks[20], 128)
+
+        url = reverse("music:track_peaks", kwargs={"track_id": self.track.pk})
+        response = self.client.get(url, {"format": "bin"})
+        self.assertEqual(response.content, peaks)
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.client.get(url, {"v": self.track.content_hash})
+        self.assertEqual(response.json()["peaks"], list(peaks))
+        self.assertIn("immutable", response["Cache-Control"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_compressed_file_without_ffmpeg_is_logged(self):
+        path = os.path.join(MEDIA_ROOT, "not-a-wav.mp3")
+        with open(path, "wb") as target:
+            target.write(b"ID3" + bytes(64))
+        with self.settings(MUSIC_FFMPEG="no-such-ffmpeg"):
+            with self.assertLogs("music.analysis", "WARNING"):
+                self.assertIsNone(analyze_file(path))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="artist", image="artists_cards/a.jpg")
+
+    def create_track(self, content: bytes) -> Track:
+        track = Track.objects.create(title="track", artist=self.artist)
+        track.audio_file.save("upload.mp3", ContentFile(content))
+        return track
+
+    def test_same_content_is_stored_once(self):
+        first = self.create_track(b"same audio")
+        second = self.create_track(b"same audio")
+        self.assertEqual(first.audio_file.name, second.audio_file.name)
+        self.assertEqual(MediaBlob.objects.get().refcount, 2)
+
+    def test_orphans_are_collected(self):
+        track = self.create_track(b"orphan audio")
+        name = track.audio_file.name
+        self.assertEqual(collect_garbage(grace=timedelta(0)), [])
+
+        track.delete()
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 0)
+        self.assertEqual(collect_garbage(grace=timedelta(0)), [name])
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_reupload_during_collection_keeps_file(self):
+        track = self.create_track(b"shared audio")
+        name = track.audio_file.name
+        track.delete()
+
+        def reupload(names):
+            # Та же загрузка пришла после проверки ссылок
+            self.create_track(b"shared audio")
+            return set()
+
+        with mock.patch.object(storage, "referenced_names", reupload):
+            self.assertEqual(collect_garbage(grace=timedelta(0)), [])
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RenditionTests(TestCase):
+    def test_lazy_rendition(self):
+        cover = io.BytesIO()
+        Image.new("RGB", (1000, 500)).save(cover, "JPEG")
+        source = default_storage.save(
+            "albums_images/cover.jpg", ContentFile(cover.getvalue())
+        )
+        name = rendition_name(source, 128)
+
+        response = self.client.get(
+            reverse("music:rendition", args=[name.removeprefix("renditions/")])
+        )
+        self.assertEqual(response.status_code, 200)
+        with storages["renditions"].open(name) as rendition:
+            self.assertEqual(Image.open(rendition).size, (128, 64))
+
+    def test_decompression_bomb_is_not_found(self):
+        cover = io.BytesIO()
+        Image.new("RGB", (1000, 500)).save(cover, "JPEG")
+        source = default_storage.save(
+            "albums_images/bomb.jpg", ContentFile(cover.getvalue())
+        )
+        name = rendition_name(source, 128)
+
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            response = self.client.get(
+                reverse("music:rendition", args=[name.removeprefix("renditions/")])
+            )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(storages["renditions"].exists(name))
+
+    def test_unknown_width_is_rejected(self):
+        response = self.client.get(
+            reverse("music:rendition", args=["albums_images/cover.jpg/100.webp"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ArtistDetailViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        self.artist = Artist.objects.create(name="artist", image="artists_cards/a.jpg")
+        self.liked = Playlist.objects.create(
+            title="favorite", owner=self.user, is_liked_playlist=True
+        )
+        self.url = reverse("music:artist_detail", kwargs={"pk": self.artist.pk})
+        self.client.force_login(self.user)
+        likes.clear()
+
+    def add_releases(self, count: int) -> None:
+        for number in range(count):
+            album = Album.objects.create(
+                title=f"album {number}", artist=self.artist, image="albums_images/a.jpg"
+            )
+            track = Track.objects.create(
+                title=f"track {number}",
+                artist=self.artist,
+                album=album,
+                audio_file="tracks/a.mp3",
+            )
+            if number % 2:
+                self.liked.tracks.add(track)
+
+    def test_query_count_does_not_depend_on_catalog_size(self):
+        # сессия, пользователь, артист, страница треков, страница альбомов;
+        # лайки берутся из кэша
+        self.add_releases(1)
+        likes.liked_track_ids(self.user)
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+        self.add_releases(60)
+        likes.liked_track_ids(self.user)
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        tracks = response.context["tracks"]
+        self.assertEqual(len(tracks), 50)
+
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url + tracks.next_query)
+        self.assertEqual(len(response.context["tracks"]), 11)
+        self.assertFalse(response.context["tracks"].has_next())
+
+    def test_liked_tracks_are_marked(self):
+        self.add_releases(2)
+        liked = self.liked.tracks.get()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["liked_track_ids"], {liked.pk})
+        self.assertContains(response, 'value="unlike"', count=1)
+
+
+class LikesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        artist = Artist.objects.create(name="artist")
+        self.tracks = [
+            Track.objects.create(title=f"track {number}", artist=artist)
+            for number in range(3)
+        ]
+        likes.clear()
+
+    def test_like_and_unlike_skip_loading_liked_set(self):
+        first, second, _ = self.tracks
+        likes.like(self.user, first.pk)
+        self.assertTrue(likes.is_liked(self.user, first.pk))
+
+        # savepoint, блокировка плейлиста, проверка дубликата, INSERT, release
+        with self.assertNumQueries(5):
+            likes.like(self.user, second.pk)
+        with self.assertNumQueries(1):
+            likes.unlike(self.user, first.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                likes.liked_among(self.user, [track.pk for track in self.tracks]),
+                {second.pk},
+            )
+
+        likes.clear()
+        self.assertEqual(likes.liked_track_ids(self.user), {second.pk})
+
+    def test_stale_cache_does_not_duplicate_like(self):
+        track = self.tracks[0]
+        likes.like(self.user, track.pk)
+        # Другой воркер со старой записью кэша
+        likes.clear()
+        playlist_id = likes.get_liked_playlist_id(self.user)
+        likes.store_entry(self.user.pk, likes.LikedEntry(playlist_id, frozenset()))
+        likes.like(self.user, track.pk)
+        self.assertEqual(PlaylistTrack.objects.filter(track=track).count(), 1)
+
+    def test_local_entries_expire(self):
+        cache = likes.LRUCache(maxsize=10, timeout=0)
+        cache.set(self.user.pk, likes.LikedEntry(None, frozenset()))
+        self.assertIsNone(cache.get(self.user.pk))
+
+    @override_settings(MUSIC_LIKES_CACHE="default")
+    def test_shared_cache_entry_is_dropped_on_like(self):
+        cache.clear()
+        first, second, _ = self.tracks
+        likes.like(self.user, first.pk)
+        self.assertTrue(likes.is_liked(self.user, first.pk))
+        likes.like(self.user, second.pk)
+        self.assertIsNone(cache.get(likes.cache_key(self.user.pk)))
+        self.assertEqual(likes.liked_track_ids(self.user), {first.pk, second.pk})
+        likes.unlike(self.user, first.pk)
+        self.assertEqual(likes.liked_track_ids(self.user), {second.pk})
+
+    def test_m2m_changes_invalidate_cache(self):
+        likes.like(self.user, self.tracks[0].pk)
+        playlist = Playlist.objects.get(owner=self.user, is_liked_playlist=True)
+        playlist.tracks.add(self.tracks[2])
+        self.assertTrue(likes.is_liked(self.user, self.tracks[2].pk))
+
+        playlist.delete()
+        self.assertEqual(likes.liked_track_ids(self.user), frozenset())
+
+    def test_manage_favorite_track_view(self):
+        self.client.force_login(self.user)
+        track = self.tracks[0]
+        url = reverse("music:manage_track", kwargs={"track_id": track.pk})
+        self.client.post(url, {"action": "like"})
+        self.assertTrue(likes.is_liked(self.user, track.pk))
+        self.client.post(url, {"action": "unlike"})
+        self.assertFalse(likes.is_liked(self.user, track.pk))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PlayCountersTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="artist")
+        self.track = Track.objects.create(title="track", artist=self.artist)
+        self.track.audio_file.save("plays.mp3", ContentFile(MP3_FRAME * 4))
+        self.url = reverse("music:stream_audio", kwargs={"track_id": self.track.pk})
+        plays.buffer.flush()
+
+    def tearDown(self):
+        plays.buffer.flush()
+
+    def counters(self) -> tuple:
+        self.track.refresh_from_db()
+        self.artist.refresh_from_db()
+        return self.track.month_plays, self.artist.month_listeners
+
+    def test_only_session_start_is_counted_and_buffered(self):
+        # Только чтение трека на каждый запрос, без записей
+        with self.assertNumQueries(3):
+            self.client.get(self.url, HTTP_RANGE="bytes=0-")
+            self.client.get(self.url, HTTP_RANGE="bytes=100-")
+            self.client.get(self.url, HTTP_RANGE="bytes=0-", HTTP_USER_AGENT="other")
+        self.assertEqual(self.counters(), (0, 0))
+
+        self.assertEqual(plays.buffer.flush(), 2)
+        self.assertEqual(self.counters(), (2, 2))
+        self.assertEqual(TrackPlayDay.objects.get(track=self.track).plays, 2)
+
+    def test_month_listeners_counts_distinct_listeners(self):
+        other = Track.objects.create(title="other", artist=self.artist)
+        plays.buffer.add(self.track.pk, self.artist.pk, "listener")
+        plays.buffer.add(other.pk, self.artist.pk, "listener")
+        self.assertEqual(plays.buffer.flush(), 2)
+        plays.buffer.add(self.track.pk, self.artist.pk, "listener")
+        plays.buffer.add(self.track.pk, self.artist.pk, "second")
+        self.assertEqual(plays.buffer.flush(), 2)
+        self.assertEqual(self.counters(), (3, 2))
+        self.assertEqual(ArtistListener.objects.filter(artist=self.artist).count(), 2)
+        plays.rebuild()
+        self.assertEqual(self.counters(), (3, 2))
+
+    def test_player_probes_are_not_plays(self):
+        self.client.get(self.url, HTTP_RANGE="bytes=0-1")
+        self.client.get(self.url, HTTP_RANGE="bytes=0-1,100-200", HTTP_USER_AGENT="a")
+        self.client.head(self.url, HTTP_USER_AGENT="b")
+        self.assertEqual(plays.buffer.flush(), 0)
+        self.client.get(self.url, HTTP_RANGE="bytes=0-1023")
+        self.assertEqual(plays.buffer.flush(), 1)
+
+    def test_prefetch_is_not_a_play(self):
+        self.client.get(self.url + "?prefetch=1", HTTP_RANGE="bytes=0-9999")
+        self.client.get(self.url, HTTP_SEC_PURPOSE="prefetch", HTTP_USER_AGENT="a")
+        self.assertEqual(plays.buffer.flush(), 0)
+
+    def test_no_background_flush_without_auto_flush(self):
+        buffer = plays.PlayBuffer(flush_interval=0, max_size=1)
+        buffer.flush_soon()
+        self.assertIsNone(buffer.flusher)
+
+    @override_settings(MUSIC_PLAYS_AUTO_FLUSH=True)
+    def test_background_flush_runs_one_at_a_time(self):
+        buffer = plays.PlayBuffer(flush_interval=0, max_size=1)
+        release = threading.Event()
+        calls = []
+
+        def flush():
+            calls.append(1)
+            release.wait(5)
+
+        with mock.patch.object(buffer, "flush", flush):
+            buffer.flush_soon()
+            first = buffer.flusher
+            buffer.flush_soon()
+            self.assertIs(buffer.flusher, first)
+            release.set()
+            first.join(5)
+            buffer.flush_soon()
+            buffer.flusher.join(5)
+        self.assertEqual(len(calls), 2)
+
+    def test_expired_days_leave_the_window(self):
+        today = timezone.localdate()
+        plays.buffer.add(self.track.pk, self.artist.pk, "listener")
+        plays.buffer.flush()
+        TrackPlayDay.objects.create(
+            track=self.track, day=today - timedelta(days=40), plays=5
+        )
+        ArtistListener.objects.create(
+            artist=self.artist, listener="old", last_day=today - timedelta(days=40)
+        )
+        Track.objects.filter(pk=self.track.pk).update(month_plays=6)
+        Artist.objects.filter(pk=self.artist.pk).update(month_listeners=2)
+
+        self.assertEqual(plays.expire(today), 1)
+        self.assertEqual(self.counters(), (1, 1))
+        plays.rebuild()
+        self.assertEqual(self.counters(), (1, 1))
+
+
+class ChartsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.popular = Artist.objects.create(name="popular", month_listeners=10)
+        Artist.objects.create(name="quiet", month_listeners=1)
+        Album.objects.create(title="fresh", artist=self.popular)
+
+    def test_anonymous_home_page_is_served_without_queries(self):
+        charts.refresh()
+        self.client.get(reverse("main"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("main"))
+        self.assertContains(response, "popular")
+        self.assertContains(response, "fresh")
+
+    def test_refresh_publishes_new_version(self):
+        first = charts.get_charts()
+        self.assertEqual(
+            [artist["name"] for artist in first["top_artists"]], ["popular", "quiet"]
+        )
+        Artist.objects.filter(name="quiet").update(month_listeners=100)
+        self.assertEqual(charts.get_charts(), first)
+
+        second = charts.refresh()
+        self.assertNotEqual(second["version"], first["version"])
+        self.assertEqual(charts.get_charts()["top_artists"][0]["name"], "quiet")
+        self.assertEqual(ChartSnapshot.objects.count(), 1)
+
+    def test_cache_miss_reloads_snapshot_once(self):
+        charts.refresh()
+        cache.clear()
+        with self.assertNumQueries(1):
+            charts.get_charts()
+        with self.assertNumQueries(0):
+            charts.get_charts()
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user("curator", password="password")
+        self.artist = Artist.objects.create(name="Кино")
+        self.album = Album.objects.create(title="Группа крови", artist=self.artist)
+        self.track = Track.objects.create(title="Звезда по имени Солнце", artist=self.artist)
+        Track.objects.create(
+            title="Звезда черновик", artist=self.artist, status=Track.Status.PENDING
+        )
+        Playlist.objects.create(title="Звезды рока", owner=self.owner, is_public=True)
+
+    def search(self, **params) -> list:
+        response = self.client.get(reverse("music:search"), params)
+        self.assertEqual(response.status_code, 200)
+        return [(item["type"], item["title"]) for item in response.json()["results"]]
+
+    def test_prefix_search_ranks_titles_first(self):
+        self.assertCountEqual(
+            self.search(q="звезд"),
+            [("track", "Звезда по имени Солнце"), ("playlist", "Звезды рока")],
+        )
+        self.assertEqual(self.search(q="кино")[0], ("artist", "Кино"))
+        self.assertEqual(
+            self.search(q="кино зв", type="track"),
+            [("track", "Звезда по имени Солнце")],
+        )
+
+    def test_index_follows_model_changes(self):
+        self.artist.name = "Аквариум"
+        self.artist.save()
+        self.assertIn(("album", "Группа крови"), self.search(q="аквар"))
+
+        self.track.delete()
+        self.assertEqual(self.search(q="солнце"), [])
+
+    def test_exact_match_survives_candidate_cap(self):
+        for number in range(3):
+            Track.objects.create(title=f"Звездами {number}", artist=self.artist)
+        with mock.patch.object(search, "MAX_CANDIDATES", 2):
+            results = self.search(q="звезда")
+        self.assertIn(("track", "Звезда по имени Солнце"), results)
+
+    def test_invalid_type(self):
+        response = self.client.get(reverse("music:search"), {"q": "a", "type": "user"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        artist = Artist.objects.create(name="artist")
+        self.playlist = Playlist.objects.create(title="long", owner=self.user)
+        tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=artist, audio_file="tracks/a.mp3")
+            for number in range(120)
+        )
+        # Порядок добавления не совпадает с порядком id треков
+        playlists.append(self.playlist, [track.pk for track in reversed(tracks)])
+        self.url = reverse("music:playlist_detail", kwargs={"pk": self.playlist.pk})
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def titles(self, response) -> list:
+        return [track.title for track in response.context["tracks"]]
+
+    def test_pages_follow_insertion_order_both_ways(self):
+        first = self.client.get(self.url)
+        self.assertEqual(self.titles(first)[:2], ["track 119", "track 118"])
+        self.assertFalse(first.context["tracks"].has_previous())
+
+        second = self.client.get(self.url + first.context["tracks"].next_query)
+        third = self.client.get(self.url + second.context["tracks"].next_query)
+        self.assertEqual(self.titles(third)[-1], "track 0")
+        self.assertEqual(len(self.titles(third)), 20)
+        self.assertFalse(third.context["tracks"].has_next())
+
+        back = self.client.get(self.url + second.context["tracks"].previous_query)
+        self.assertEqual(self.titles(back), self.titles(first))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+        # Длина верная, но тип значения не совпадает с полем position
+        forged = encode_cursor(False, ["abc", 1])
+        response = self.client.get(self.url, {"cursor": forged})
+        self.assertEqual(response.status_code, 404)
+
+    def test_track_count_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["track_count"], 120)
+        with self.assertNumQueries(0):
+            self.assertEqual(playlists.track_count(self.playlist), 120)
+        with self.captureOnCommitCallbacks(execute=True):
+            playlists.remove(self.playlist, [Track.objects.first().pk])
+        self.assertEqual(playlists.track_count(self.playlist), 119)
+
+    def test_my_playlists_page_has_no_count_query(self):
+        for number in range(12):
+            Playlist.objects.create(title=f"playlist {number}", owner=self.user)
+        response = self.client.get(reverse("music:my_playlists"))
+        self.assertEqual(len(response.context["playlists"]), 10)
+        response = self.client.get(
+            reverse("music:my_playlists") + response.context["page_obj"].next_query
+        )
+        self.assertEqual(
+            [playlist.title for playlist in response.context["playlists"]],
+            ["playlist 9", "playlist 10", "playlist 11"],
+        )
+
+
+class PlaylistOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("curator", password="password")
+        artist = Artist.objects.create(name="artist")
+        self.tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=artist) for number in range(5)
+        )
+        self.playlist = Playlist.objects.create(title="mix", owner=self.user)
+        self.client.force_login(self.user)
+
+    def order(self) -> list:
+        return list(
+            playlists.ordered(self.playlist.pk).values_list("track__title", flat=True)
+        )
+
+    def test_bulk_append_and_remove(self):
+        url = reverse("music:edit_playlist_tracks", kwargs={"pk": self.playlist.pk})
+        ids = [track.pk for track in self.tracks]
+        # Число запросов не зависит от числа треков: одна проверка id, одна
+        # блокировка, одна последняя позиция, один bulk_create, плюс savepoint
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                url, {"action": "append", "track_id": ids + [ids[0], 999]}
+            )
+        self.assertEqual(len(response.json()["added"]), 6)
+        self.assertEqual(self.order()[-1], "track 0")
+
+        response = self.client.post(url, {"action": "remove", "track_id": ids[:1]})
+        self.assertEqual(response.json()["removed"], 2)
+        self.assertEqual(self.order(), [f"track {n}" for n in range(1, 5)])
+
+    def test_liked_playlist_keeps_one_entry_per_track(self):
+        likes.clear()
+        first, second, third = (track.pk for track in self.tracks[:3])
+        likes.like(self.user, first)
+        liked = likes.get_liked_playlist_id(self.user)
+        self.client.post(
+            reverse("music:add_track", kwargs={"track_id": first}),
+            {"playlist_id": liked},
+        )
+        url = reverse("music:edit_playlist_tracks", kwargs={"pk": liked})
+        response = self.client.post(
+            url, {"action": "append", "track_id": [second, second, first, third]}
+        )
+        self.assertEqual(len(response.json()["added"]), 2)
+        rows = PlaylistTrack.objects.filter(playlist_id=liked)
+        self.assertEqual(
+            sorted(rows.values_list("track_id", flat=True)), [first, second, third]
+        )
+
+    def test_move_rewrites_one_row(self):
+        entries = playlists.append(self.playlist, [track.pk for track in self.tracks])
+        url = reverse("music:move_playlist_track", kwargs={"pk": self.playlist.pk})
+        self.client.post(url, {"entry_id": entries[4].pk, "after_id": entries[0].pk})
+        self.assertEqual(self.order()[:3], ["track 0", "track 4", "track 1"])
+        self.client.post(url, {"entry_id": entries[2].pk, "after_id": ""})
+        self.assertEqual(self.order()[0], "track 2")
+
+        positions = dict(PlaylistTrack.objects.values_list("pk", "position"))
+        playlists.move(self.playlist, entries[3].pk, entries[0].pk)
+        changed = {
+            pk
+            for pk, position in PlaylistTrack.objects.values_list("pk", "position")
+            if positions[pk] != position
+        }
+        self.assertEqual(changed, {entries[3].pk})
+
+    def test_repeated_moves_rebalance(self):
+        entries = playlists.append(self.playlist, [track.pk for track in self.tracks])
+        for _ in range(40):
+            playlists.move(self.playlist, entries[4].pk, entries[0].pk)
+            playlists.move(self.playlist, entries[3].pk, entries[0].pk)
+        self.assertEqual(
+            self.order(), ["track 0", "track 3", "track 4", "track 1", "track 2"]
+        )
+
+
+class QueryAuditTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        artist = Artist.objects.create(name="artist", user=self.user)
+        album = Album.objects.create(title="album", artist=artist)
+        track = Track.objects.create(
+            title="track", artist=artist, album=album, audio_file="tracks/a.mp3"
+        )
+        playlist = Playlist.objects.create(title="mix", owner=self.user)
+        playlists.append(playlist, [track.pk])
+        likes.clear()
+
+    def test_views_do_not_scan_tables(self):
+        results = {view.name: view for view in explain.audit(self.user)}
+        for name in ("music:artist_detail", "music:playlist_detail", "users:profile"):
+            self.assertEqual(results[name].status, 200)
+            self.assertTrue(results[name].queries)
+            for query in results[name].queries:
+                self.assertEqual(query.full_scans, [], query.sql)
+        self.assertEqual(results["music:manage_track"].skipped, "без GET")
+        self.assertEqual(results["music:stream_audio"].skipped, "побочные эффекты")
+
+    def test_one_liked_playlist_per_owner(self):
+        other = User.objects.create_user("other", password="password")
+        self.assertNotEqual(
+            likes.get_liked_playlist_id(self.user), likes.get_liked_playlist_id(other)
+        )
+        with self.assertRaises(IntegrityError):
+            Playlist.objects.create(
+                title="second", owner=self.user, is_liked_playlist=True
+            )
+
+
+class RecommendationsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        artist = Artist.objects.create(name="artist")
+        self.tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=artist) for number in range(5)
+        )
+        first, second, third, fourth, fifth = self.tracks
+        mixes = [
+            (first, second),
+            (first, second),
+            (first, second, third),
+            (first, third),
+            (second, fifth),
+            (fourth,),
+        ]
+        for number, tracks in enumerate(mixes):
+            playlist = Playlist.objects.create(title=f"mix {number}", owner=self.user)
+            playlists.append(playlist, [track.pk for track in tracks])
+        likes.clear()
+
+    def test_python_and_scipy_scores_match(self):
+        rows = recommendations.track_lists()
+        first, second, third, _, fifth = self.tracks
+        expected = [first.pk, fifth.pk, third.pk]
+        others, scores = recommendations.compute_neighbors_python(rows, 10)[second.pk]
+        self.assertEqual(others, expected)
+        self.assertAlmostEqual(scores[0], 3 / math.sqrt(4 * 4))
+        if recommendations.numpy is not None:
+            neighbors = recommendations.compute_neighbors_scipy(rows, 10)
+            self.assertEqual(neighbors[second.pk][0], expected)
+
+    def test_neighbor_ids_above_32_bits(self):
+        big = 2**40
+        rows = [
+            (
+                recommendations.pack([big], recommendations.ID_TYPECODE),
+                recommendations.pack([1.0], "f"),
+            )
+        ]
+        self.assertEqual(recommendations.merge(rows, set(), 1), [big])
+
+    def test_similar_and_user_recommendations(self):
+        first, second, third, fourth, fifth = self.tracks
+        # Трек из одиночного плейлиста соседей не получает
+        self.assertEqual(recommendations.rebuild(), 4)
+        self.assertFalse(TrackNeighbors.objects.filter(track=fourth).exists())
+        self.assertEqual(recommendations.similar_to(third.pk), [first, second])
+        self.assertEqual(recommendations.recommend_for_user(self.user), [])
+
+        likes.like(self.user, first.pk)
+        likes.like(self.user, second.pk)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("music:recommendations"))
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]],
+            [third.pk, fifth.pk],
+        )
+        response = self.client.get(
+            reverse("music:similar_tracks", kwargs={"track_id": third.pk}),
+            {"limit": 1},
+        )
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]], [first.pk]
+        )
+
+
+class PlaybackQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        artist = Artist.objects.create(name="artist")
+        self.tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=artist) for number in range(4)
+        )
+        self.playlist = Playlist.objects.create(title="mix", owner=self.user)
+        playlists.append(self.playlist, [track.pk for track in self.tracks[::-1]])
+        self.client.force_login(self.user)
+
+    def ids(self, response) -> list:
+        return [track["id"] for track in response.json()["tracks"]]
+
+    @override_settings(MUSIC_QUEUE_WINDOW=3)
+    def test_playlist_queue_refills_window(self):
+        url = reverse("music:queue")
+        ordered = [track.pk for track in self.tracks[::-1]]
+        response = self.client.post(
+            url + "?count=2", {"source": "playlist", "id": self.playlist.pk}
+        )
+        self.assertEqual(self.ids(response), ordered[:2])
+        following = reverse("music:stream_audio", kwargs={"track_id": ordered[1]})
+        following += "?prefetch=1"
+        self.assertEqual(response["Link"], f"<{following}>; rel=preload; as=audio")
+        self.assertEqual(response.json()["prefetch"]["url"], following)
+
+        for _ in range(2):
+            response = self.client.post(reverse("music:queue_next") + "?count=5")
+        # Окно из трех треков дозагружено с курсора
+        self.assertEqual(self.ids(response), ordered[2:])
+        response = self.client.post(reverse("music:queue_next"))
+        response = self.client.post(reverse("music:queue_next"))
+        self.assertEqual(self.ids(response), [])
+        self.assertNotIn("Link", response)
+
+    def test_private_playlist_and_missing_queue(self):
+        self.assertEqual(self.client.get(reverse("music:queue")).status_code, 404)
+        other = User.objects.create_user("other", password="password")
+        private = Playlist.objects.create(title="private", owner=other)
+        response = self.client.post(
+            reverse("music:queue"), {"source": "playlist", "id": private.pk}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_radio_falls_back_to_older_history_and_likes(self):
+        first, second, third, fourth = self.tracks
+        fifth = Track.objects.create(title="track 4", artist=first.artist)
+        for track, others in ((second, [first]), (first, [third]), (fourth, [fifth])):
+            TrackNeighbors.objects.create(
+                track=track,
+                track_ids=recommendations.pack(
+                    [other.pk for other in others], recommendations.ID_TYPECODE
+                ),
+                scores=recommendations.pack([1.0] * len(others), "f"),
+            )
+        likes.clear()
+        likes.like(self.user, fourth.pk)
+        history = [first.pk, second.pk]
+
+        # Соседи последнего трека уже сыграны: берутся соседи первого
+        track_ids, _ = playqueue.load("radio", first.pk, None, history, 5)
+        self.assertEqual(track_ids, [third.pk])
+        track_ids, _ = playqueue.load("radio", first.pk, None, history, 5, self.user)
+        self.assertEqual(track_ids, [third.pk, fifth.pk])
+
+    def test_radio_needs_ready_seed(self):
+        Track.objects.filter(pk=self.tracks[0].pk).update(status=Track.Status.FAILED)
+        response = self.client.post(
+            reverse("music:queue"), {"source": "radio", "id": self.tracks[0].pk}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_prefetch_range_follows_seek_index(self):
+        track = self.tracks[0]
+        TrackSeekIndex.objects.create(
+            track=track, step=1.0, offsets=array("I", range(0, 20000, 1000)).tobytes()
+        )
+        self.assertEqual(playqueue.prefetch_range(track), (0, 9999))
+
+    def test_prefetch_range_without_file(self):
+        track = self.tracks[1]
+        track.duration, track.audio_file = 100, "tracks/missing.mp3"
+        end = playqueue.FALLBACK_PREFETCH_BYTES - 1
+        self.assertEqual(playqueue.prefetch_range(track), (0, end))
+
+
+class APITests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("listener", password="password")
+        self.artist = Artist.objects.create(name="artist")
+        self.tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=self.artist, duration=60)
+            for number in range(3)
+        )
+
+    def get(self, kind: str, **params):
+        return self.client.get(
+            reverse("music:api_collection", kwargs={"kind": kind}), params
+        )
+
+    def test_ids_are_fetched_in_one_query_in_requested_order(self):
+        first, second, third = self.tracks
+        with self.assertNumQueries(1):
+            response = self.get(
+                "tracks", ids=f"{third.pk},{first.pk},{third.pk},99", fields="id,title"
+            )
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"id": third.pk, "title": "track 2"},
+                {"id": first.pk, "title": "track 0"},
+            ],
+        )
+        with self.assertNumQueries(1):
+            response = self.get("tracks", ids=str(second.pk))
+        self.assertEqual(response.json()["results"][0]["artist_name"], "artist")
+        self.assertEqual(self.get("tracks", fields="lyrics").status_code, 400)
+        self.assertEqual(self.get("tracks", ids="1,x").status_code, 400)
+
+    def test_ids_out_of_range_are_rejected(self):
+        for value in ("0", "-1", str(2**63), "9" * 30):
+            self.assertEqual(self.get("tracks", ids=value).status_code, 400)
+            self.assertEqual(self.get("tracks", artist=value).status_code, 400)
+        url = reverse("music:api_detail", kwargs={"kind": "tracks", "pk": 2**63})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_pages_and_filters(self):
+        other = Artist.objects.create(name="other")
+        Track.objects.create(title="elsewhere", artist=other)
+        response = self.get("tracks", artist=self.artist.pk, limit=2, fields="id")
+        data = response.json()
+        self.assertEqual(data["results"], [{"id": t.pk} for t in self.tracks[:2]])
+        response = self.get(
+            "tracks", artist=self.artist.pk, limit=2, fields="id", cursor=data["next"]
+        )
+        self.assertEqual(response.json()["results"], [{"id": self.tracks[2].pk}])
+
+    def test_playlists_are_visible_to_owner_or_public(self):
+        playlist = Playlist.objects.create(title="mix", owner=self.user)
+        playlists.append(playlist, [track.pk for track in self.tracks[::-1]])
+        url = reverse(
+            "music:api_detail", kwargs={"kind": "playlists", "pk": playlist.pk}
+        )
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.user)
+        with self.assertNumQueries(4):  # сессия, пользователь, плейлист, треки
+            response = self.client.get(url, {"fields": "title,tracks"})
+        self.assertEqual(
+            response.json(),
+            {"title": "mix", "tracks": [track.pk for track in self.tracks[::-1]]},
+        )
+
+    def test_list_fields_go_through_request_loaders(self):
+        album = Album.objects.create(title="album", artist=self.artist)
+        Track.objects.filter(pk__in=[t.pk for t in self.tracks[:2]]).update(album=album)
+        request_loaders = loaders.Loaders()
+        data = api.fetch("albums", {"fields": "id,tracks"}, self.user, request_loaders)
+        track_ids = [track.pk for track in self.tracks[:2]]
+        self.assertEqual(data["results"], [{"id": album.pk, "tracks": track_ids}])
+        self.assertEqual(
+            request_loaders.stats(), {"album_track_ids": {"batches": [1], "hits": 0}}
+        )
+
+
+class DataLoaderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("curator", password="password")
+        artists = Artist.objects.bulk_create(
+            Artist(name=f"artist {number}") for number in range(4)
+        )
+        self.tracks = Track.objects.bulk_create(
+            Track(title=f"track {number}", artist=artists[number % 4])
+            for number in range(10)
+        )
+        self.playlist = Playlist.objects.create(title="mix", owner=self.user)
+        playlists.append(self.playlist, [track.pk for track in self.tracks])
+
+    def test_loads_are_batched_and_deduplicated(self):
+        loader = loaders.DataLoader(Track.objects.in_bulk)
+        first, second = self.tracks[:2]
+        pending = [loader.load(pk) for pk in (first.pk, second.pk, first.pk, 0)]
+        with self.assertNumQueries(1):
+            values = [item.get() for item in pending]
+        self.assertEqual(values, [first, second, first, None])
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.load_many([second.pk]), [second])
+        self.assertEqual(loader.batches, [3])
+        self.assertEqual(loader.hits, 1)
+
+    def test_playlist_graph_resolves_in_three_queries(self):
+        request_loaders = loaders.Loaders()
+        with self.assertNumQueries(3):
+            (ids,) = request_loaders.playlist_track_ids.load_many([self.playlist.pk])
+            tracks = request_loaders.model(Track).load_many(ids)
+            request_loaders.attach(tracks, "artist")
+            names = [track.artist.name for track in tracks]
+        self.assertEqual(names[:5], [f"artist {number % 4}" for number in range(5)])
+        self.assertEqual(
+            request_loaders.stats(),
+            {
+                "playlist_track_ids": {"batches": [1], "hits": 0},
+                "music.track": {"batches": [10], "hits": 0},
+                "music.artist": {"batches": [4], "hits": 0},
+            },
+        )
+
+
+    def test_middleware_runs_in_async_stack(self):
+        async def get_response(request):
+            request.loaders.batch(loaders.playlist_track_ids)
+            return HttpResponse("ok")
+
+        middleware = loaders.DataLoaderMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get("/")
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.content, b"ok")
+        self.assertIn("playlist_track_ids", request.loaders.loaders)
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.artist = Artist.objects.create(name="artist")
+        self.track = Track.objects.create(
+            title="track", artist=self.artist, audio_file="tracks/track.mp3"
+        )
+        self.url = reverse("music:api_collection", kwargs={"kind": "tracks"})
+
+    def counter(self, name: str, view: str) -> float:
+        return metrics.registry.get(name, (("view", view),))
+
+    def test_queries_templates_and_bytes_are_counted(self):
+        view = "music:api_collection"
+        queries = self.counter("music_db_queries_total", view)
+        sent = self.counter("music_response_bytes_total", view)
+        response = self.client.get(self.url, {"ids": self.track.pk})
+        self.assertEqual(self.counter("music_db_queries_total", view), queries + 1)
+        self.assertEqual(
+            self.counter("music_response_bytes_total", view),
+            sent + len(response.content),
+        )
+
+        view = "music:artist_detail"
+        rendering = self.counter("music_template_duration_seconds_total", view)
+        self.client.get(reverse(view, kwargs={"pk": self.artist.pk}))
+        self.assertGreater(
+            self.counter("music_template_duration_seconds_total", view), rendering
+        )
+
+        url = reverse("music:metrics")
+        with self.settings(MUSIC_METRICS_TOKEN="secret"):
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+            self.assertIn(
+                'music_requests_total{view="music:api_collection",method="GET",'
+                'status="200"}',
+                response.content.decode(),
+            )
+            # Адрес клиента ничего не решает: за nginx это всегда 127.0.0.1
+            self.assertEqual(self.client.get(url).status_code, 404)
+            response = self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong")
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(MUSIC_SLOW_REQUEST_MS=0)
+    def test_slow_request_is_logged_with_sql(self):
+        with self.assertLogs("music.metrics", "WARNING") as logs:
+            self.client.get(self.url, {"ids": self.track.pk})
+        sample = json.loads(logs.records[0].getMessage().split(" ", 2)[2])
+        self.assertEqual(sample["view"], "music:api_collection")
+        self.assertEqual(sample["queries"], 1)
+        self.assertIn("music_track", sample["slowest_sql"][0]["sql"])
+
+    def test_async_stack_is_measured_without_thread_hop(self):
+        async def get_response(request):
+            await sync_to_async(Track.objects.count)()
+            return HttpResponse("ok")
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        queries = self.counter("music_db_queries_total", "unresolved")
+        async_to_sync(middleware)(RequestFactory().get("/"))
+        self.assertEqual(
+            self.counter("music_db_queries_total", "unresolved"), queries + 1
+        )
+
+
+class DatabaseProfileTests(TestCase):
+    def test_sqlite_connection_pragmas(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("PRAGMA есть только в SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    @override_settings(MUSIC_SQLITE_PRAGMAS={"synchronous": "full"})
+    def test_settings_override_default_pragmas(self):
+        pragmas = database.sqlite_pragmas()
+        self.assertEqual(pragmas["synchronous"], "full")
+        self.assertEqual(pragmas["busy_timeout"], 5000)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.label = User.objects.create_user("label", is_label=True)
+        self.source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        os.mkdir(os.path.join(self.source, "album"))
+        for name, frames, tags in (
+            ("album/1.mp3", 100, {"title": "One", "artist": "Band", "album": "First"}),
+            ("album/2.mp3", 200, {"title": "Two", "artist": "band", "album": "First"}),
+            ("untagged.mp3", 50, {}),
+        ):
+            path = os.path.join(self.source, name)
+            with open(path, "wb") as audio:
+                audio.write(MP3_FRAME * frames)
+            if tags:
+                id3 = EasyID3()
+                id3.update({**tags, "genre": "Rock"})
+                id3.save(path)
+        self.checkpoint = self.source + ".checkpoint"
+        self.addCleanup(
+            lambda: os.path.exists(self.checkpoint) and os.remove(self.checkpoint)
+        )
+
+    def run_import(self):
+        output = io.StringIO()
+        call_command(
+            "import_catalog",
+            self.source,
+            label="label",
+            workers=1,
+            stdout=output,
+            stderr=output,
+        )
+        return output.getvalue()
+
+    def test_import_and_resume(self):
+        output = self.run_import()
+        self.assertIn("untagged.mp3: нет исполнителя", output)
+        artist = Artist.objects.get(user=self.label)
+        album = Album.objects.get(artist=artist)
+        tracks = Track.objects.filter(artist=artist).order_by("title")
+        self.assertEqual([t.title for t in tracks], ["One", "Two"])
+        self.assertEqual({t.album_id for t in tracks}, {album.pk})
+        self.assertEqual(tracks[1].duration, 5)
+        self.assertEqual(tracks[0].genre.title, "Rock")
+        self.assertEqual(tracks[0].status, Track.Status.PENDING)
+        self.assertEqual(len(tracks[0].content_hash), 64)
+        self.assertEqual(Job.objects.filter(name="ingest_track").count(), 2)
+        self.assertEqual(
+            MediaBlob.objects.get(name=tracks[0].audio_file.name).refcount, 1
+        )
+
+        # Контрольная точка: второй запуск ничего не читает
+        self.assertIn("Импортировано треков: 0", self.run_import())
+        # Без нее те же файлы распознаются как уже импортированные
+        os.remove(self.checkpoint)
+        self.assertIn("уже были: 2", self.run_import())
+        self.assertEqual(Track.objects.count(), 2)
 
-# Create your tests here.
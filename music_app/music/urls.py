@@ -3,15 +3,30 @@ from django.urls import path
 from .views import (
     AddTrackInPlaylist,
     AlbumDetailView,
+    AsyncAudioStreamView,
     ArtistDetailView,
     AudioStreamView,
     CreateAlbum,
     CreateArtist,
     CreatePlaylist,
     CreateTrack,
+    EditPlaylistTracks,
     ManageFavoriteTrack,
+    MovePlaylistTrack,
     MyPlaylists,
+    PlaybackQueue,
+    PlaybackQueueNext,
     PlaylistDetail,
+    Recommendations,
+    api_collection,
+    api_detail,
+    hls_master,
+    hls_playlist,
+    metrics_view,
+    rendition,
+    search,
+    similar_tracks,
+    track_peaks,
 )
 
 app_name = "music"
@@ -26,6 +41,16 @@ urlpatterns = [
     ),
     path("artist/<int:pk>/create-track/", CreateTrack.as_view(), name="create_track"),
     path("playlist/<int:pk>", PlaylistDetail.as_view(), name="playlist_detail"),
+    path(
+        "playlist/<int:pk>/tracks/",
+        EditPlaylistTracks.as_view(),
+        name="edit_playlist_tracks",
+    ),
+    path(
+        "playlist/<int:pk>/move/",
+        MovePlaylistTrack.as_view(),
+        name="move_playlist_track",
+    ),
     path("my-playlists/", MyPlaylists.as_view(), name="my_playlists"),
     path("create-playlist/", CreatePlaylist.as_view(), name="create_playlist"),
     path(
@@ -39,5 +64,26 @@ urlpatterns = [
         name="manage_track",
     ),
     path("stream/<int:track_id>/", AudioStreamView.as_view(), name="stream_audio"),
+    path(
+        "stream/<int:track_id>/async/",
+        AsyncAudioStreamView.as_view(),
+        name="stream_audio_async",
+    ),
+    path("stream/<int:track_id>/hls/", hls_master, name="hls_master"),
+    path(
+        "stream/<int:track_id>/hls/<int:bitrate>.m3u8",
+        hls_playlist,
+        name="hls_playlist",
+    ),
+    path("stream/<int:track_id>/peaks/", track_peaks, name="track_peaks"),
     path("album/<int:album_id>/", AlbumDetailView.as_view(), name="album_detail"),
+    path("renditions/<path:name>", rendition, name="rendition"),
+    path("search/", search, name="search"),
+    path("api/<slug:kind>/", api_collection, name="api_collection"),
+    path("api/<slug:kind>/<int:pk>/", api_detail, name="api_detail"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("queue/", PlaybackQueue.as_view(), name="queue"),
+    path("queue/next/", PlaybackQueueNext.as_view(), name="queue_next"),
+    path("recommendations/", Recommendations.as_view(), name="recommendations"),
+    path("track/<int:track_id>/similar/", similar_tracks, name="similar_tracks"),
 ]
@@ -1,12 +1,19 @@
+import asyncio
+import logging
 import os
+from fnmatch import fnmatch
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.files.storage import storages
 from django.forms import BaseModelForm
-from django.http import FileResponse, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.http.response import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import (
     CreateView,
     DeleteView,
@@ -15,7 +22,7 @@ from django.views.generic import (
     UpdateView,
     View,
 )
-from mutagen import File
+from django.views.static import serve
 
 from .forms import (
     CreateAlbumForm,
@@ -23,16 +30,147 @@ from .forms import (
     CreatePlaylistForm,
     CreateTrackForm,
 )
-from .mixins import ArtistAccessMixin
-from .models import Album, Artist, Playlist, Track
+from . import (
+    api,
+    hls,
+    likes,
+    metrics,
+    playlists,
+    playqueue,
+    plays,
+    recommendations,
+)
+from .charts import get_cache as get_charts_cache
+from .charts import get_charts
+from .charts import page_key as charts_page_key
+from .jobs import enqueue
+from .loaders import get_loaders
+from .mixins import ArtistAccessMixin, CursorPaginationMixin
+from .search import KINDS as SEARCH_KINDS
+from .search import search as search_index
+from .renditions import PREFIX as RENDITIONS_PREFIX
+from .renditions import ensure_rendition
+from .models import (
+    Album,
+    Artist,
+    Playlist,
+    PlaylistTrack,
+    Track,
+    TrackAnalysis,
+    TrackRendition,
+    TrackSeekIndex,
+)
+from .streaming import (
+    audio_content_type,
+    conditional_response,
+    file_validators,
+    get_async_delivery_backend,
+    get_delivery_backend,
+    if_range_matches,
+    get_url_expire,
+    local_path,
+    parse_range_header,
+    proxy_storage_range,
+    range_not_satisfiable,
+    redirect_to_storage,
+    seek_ranges,
+    set_validators,
+)
+
+logger = logging.getLogger(__name__)
 
 
 # Create your views here.
 def index(request) -> HttpResponse:
-    """Главная страница с топом артистов, последними релизами артистов за которыми следит пользователь"""
-    top_month_artists = Artist.objects.order_by("-month_listeners")[:5]
-    context: dict = {"top_month_artists": top_month_artists}
-    return render(request, "index.html", context=context)
+    """Главная страница с чартами; анонимам отдается целиком из кэша"""
+    charts = get_charts()
+    context: dict = {"charts": charts}
+    if request.user.is_authenticated:
+        return render(request, "index.html", context=context)
+
+    cache = get_charts_cache()
+    key = charts_page_key(charts["version"])
+    content = cache.get(key)
+    if content is None:
+        response = render(request, "index.html", context=context)
+        cache.set(key, response.content, timeout=settings.MUSIC_CHARTS_PAGE_TIMEOUT)
+        return response
+    return HttpResponse(content)
+
+
+def serve_media(request, path: str, document_root=None) -> HttpResponse:
+    """django.views.static.serve с долгим кэшем для неизменяемых загрузок"""
+    if path.startswith(RENDITIONS_PREFIX):
+        # Уменьшенные копии обложек строятся при первом запросе
+        ensure_rendition(path)
+    response = serve(request, path, document_root=document_root)
+    if any(fnmatch(path, pattern) for pattern in settings.MUSIC_IMMUTABLE_MEDIA):
+        patch_cache_control(
+            response, public=True, max_age=60 * 60 * 24 * 365, immutable=True
+        )
+    return response
+
+
+def rendition(request, name: str) -> FileResponse:
+    """Ленивое построение копии обложки: fallback для nginx try_files"""
+    name = RENDITIONS_PREFIX + name
+    if not ensure_rendition(name):
+        raise Http404("Rendition not found")
+    storage = storages["renditions"]
+    if local_path(storage, name) is None:
+        return redirect_to_storage(storage, name)
+    response = FileResponse(storage.open(name))
+    patch_cache_control(
+        response, public=True, max_age=60 * 60 * 24 * 365, immutable=True
+    )
+    return response
+
+
+def search(request) -> JsonResponse:
+    """Поиск для подсказок: ?q=текст[&type=track][&limit=20]"""
+    kind = request.GET.get("type") or None
+    if kind is not None and kind not in SEARCH_KINDS:
+        return JsonResponse({"error": "Unknown type"}, status=400)
+    try:
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    results = search_index(request.GET.get("q", ""), kind=kind, limit=limit)
+    return JsonResponse({"results": results})
+
+
+def metrics_view(request) -> HttpResponse:
+    """Метрики в формате Prometheus по токену MUSIC_METRICS_TOKEN"""
+    if not metrics.is_authorized(request):
+        raise Http404("Not found")
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def api_response(data, status: int = 200) -> HttpResponse:
+    return HttpResponse(api.dumps(data), content_type="application/json", status=status)
+
+
+def api_collection(request, kind: str) -> HttpResponse:
+    """Список ресурса: ?ids=1,2,3 или страница ?cursor=; поля — ?fields=a,b"""
+    if kind not in api.RESOURCES:
+        raise Http404("Unknown resource")
+    try:
+        data = api.fetch(kind, request.GET, request.user, get_loaders(request))
+    except api.APIError as error:
+        return api_response({"error": str(error)}, status=400)
+    return api_response(data)
+
+
+def api_detail(request, kind: str, pk: int) -> HttpResponse:
+    if kind not in api.RESOURCES:
+        raise Http404("Unknown resource")
+    try:
+        data = api.fetch_one(kind, pk, request.GET, request.user, get_loaders(request))
+    except api.APIError as error:
+        return api_response({"error": str(error)}, status=400)
+    if data is None:
+        return api_response({"error": "Not found"}, status=404)
+    return api_response(data)
 
 
 class CreateArtist(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -52,34 +190,36 @@ class CreateArtist(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         return reverse_lazy("music:artist_detail", kwargs={"pk": self.object.pk})
 
 
-class ArtistDetailView(DetailView):
+class ArtistDetailView(CursorPaginationMixin, DetailView):
     """Подробная страница артиста"""
 
     model = Artist
     pk_url_kwarg = "pk"
     template_name = "music/artist_detail.html"
     context_object_name = "artist"
+    tracks_per_page = 50
+    albums_per_page = 24
+
+    def get_queryset(self):
+        return Artist.objects.select_related("user")
 
     def get_context_data(self, **kwargs) -> dict:
         context = super().get_context_data(**kwargs)
         artist = self.object
         user = self.request.user
+        # Querysets менеджеров artist.*_set сразу знают track.artist и album.artist
         context.update(
             {
-                "tracks": Track.objects.filter(artist=artist),
-                "albums": Album.objects.filter(artist=artist),
+                "tracks": self.paginate_by_cursor(
+                    artist.track_set.all(), self.tracks_per_page, param="tracks"
+                ),
+                "albums": self.paginate_by_cursor(
+                    artist.album_set.all(), self.albums_per_page, param="albums"
+                ),
+                "liked_track_ids": likes.liked_track_ids(user),
             }
         )
 
-        user_likes_playlist, _ = Playlist.objects.get_or_create(
-            owner=user, is_liked_playlist=True
-        )
-        context["liked_tracks"] = (
-            user_likes_playlist.tracks.filter(artist=artist)
-            if user_likes_playlist
-            else []
-        )
-
         return context
 
 
@@ -117,19 +257,15 @@ class CreateTrack(LoginRequiredMixin, CreateView):
     template_name = "music/create_track.html"
 
     def get_success_url(self):
-        return reverse_lazy(
-            "music:artist_detail", kwargs={"pk": self.kwargs["artist_id"]}
-        )
+        return reverse_lazy("music:artist_detail", kwargs={"pk": self.object.artist_id})
 
     def form_valid(self, form: BaseModelForm):
-        self.object = form.save(commit=False)
-        audio_file = self.object.audio_file
-        audio = File(audio_file)
-        self.object.artist = Artist.objects.filter(user=self.request.user.id).first()
-        self.object.duration = int(audio.info.length)
-        self.object.save()
-        self.kwargs["artist_id"] = self.object.artist.pk
-        return super().form_valid(form)
+        # Файл сохраняется один раз, остальное делает фоновая задача ingest_track
+        form.instance.artist = Artist.objects.filter(user=self.request.user.id).first()
+        form.instance.status = Track.Status.PENDING
+        response = super().form_valid(form)
+        enqueue("ingest_track", track_id=self.object.pk)
+        return response
 
 
 class AlbumDetailView(DetailView):
@@ -140,145 +276,296 @@ class AlbumDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        album = self.get_object()
+        album = self.object
+        get_loaders(self.request).attach([album], "artist")
         context.update({"tracks": Track.objects.filter(album=album)})
         return context
 
 
-class AudioStreamView(View):
-    CHUNK_SIZE = 8192
-    MIME_TYPE = "audio/mpeg"
+def remote_stream(request, track: Track, content_type: str) -> HttpResponse:
+    """Аудио из удаленного хранилища: редирект на подписанную ссылку.
+
+    Перемотку ?t отдаем диапазоном через приложение: в редирект Range не передать.
+    """
+    storage, name = track.audio_file.storage, track.audio_file.name
+    plays.record(track, request)
+    if "t" in request.GET and not request.headers.get("Range"):
+        seek_index = TrackSeekIndex.objects.filter(track=track).first()
+        if seek_index is not None:
+            file_size = storage.size(name)
+            byte_ranges = seek_ranges(seek_index, request.GET["t"], file_size)
+            if byte_ranges:
+                start, end = byte_ranges[0]
+                return proxy_storage_range(
+                    storage, name, file_size, start, end, content_type
+                )
+    return redirect_to_storage(storage, name, content_type)
+
 
+class AudioStreamView(View):
     def get(self, request, track_id):
         try:
             track = get_object_or_404(Track, pk=track_id)
-            file_path = track.audio_file.path
+            if not track.audio_file:
+                raise FileNotFoundError("Audio file not found")
+            file_path = local_path(track.audio_file.storage, track.audio_file.name)
+            if file_path is None:
+                return remote_stream(
+                    request, track, audio_content_type(track.audio_file.name)
+                )
 
             if not os.path.exists(file_path):
                 raise FileNotFoundError("Audio file not found")
 
-            file_size: int = os.path.getsize(file_path)
-            range_header: str = request.headers.get("Range", "").strip()
-            print(range_header)
-            if not range_header:
-                response = FileResponse(
-                    open(file_path, "rb"),
-                    content_type=self.MIME_TYPE,
-                    as_attachment=False,
-                )
-                response["Accept-Ranges"] = "bytes"
+            file_stat = os.stat(file_path)
+            file_size: int = file_stat.st_size
+            etag, last_modified = file_validators(file_stat, track.content_hash)
+            response = conditional_response(request, etag, last_modified)
+            if response is not None:
                 return response
 
-            byte_range = self.parse_range_header(range_header, file_size)
-
-            if not byte_range:
-                return HttpResponse(status=416)
-            start, end = byte_range
-            content_length = end - start + 1
-            response = FileResponse(
-                self.file_iterator(file_path, start, end),
-                status=206,
-                content_type=self.MIME_TYPE,
+            range_header: str = request.headers.get("Range", "").strip()
+            byte_ranges = None
+            if range_header and if_range_matches(request, etag, last_modified):
+                byte_ranges = parse_range_header(range_header, file_size)
+                if byte_ranges == []:
+                    return range_not_satisfiable(file_size)
+            elif "t" in request.GET:
+                seek_index = TrackSeekIndex.objects.filter(track=track).first()
+                byte_ranges = seek_ranges(seek_index, request.GET["t"], file_size)
+
+            plays.record(track, request)
+            response = get_delivery_backend().serve(
+                file_path, file_size, byte_ranges, audio_content_type(file_path)
             )
-            response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-            response["Accept-Ranges"] = "bytes"
-            response["Content-Length"] = content_length
+            set_validators(response, etag, last_modified)
             return response
         except Track.DoesNotExist:
             return HttpResponse("Track not found", status=404)
+        except Http404:
+            raise
         except FileNotFoundError:
             return HttpResponse("Audio file not found", status=404)
         except Exception as e:
-            # В продакшене следует добавить логирование ошибки
+            logger.exception("Ошибка отдачи трека %s", track_id)
             return HttpResponse(str(e), status=500)
 
-    def parse_range_header(self, range_header: str, file_size: int) -> tuple:
+
+class AsyncAudioStreamView(View):
+    """Вариант AudioStreamView для ASGI, не блокирующий event loop"""
+
+    async def get(self, request, track_id):
+        try:
+            track = await Track.objects.aget(pk=track_id)
+        except Track.DoesNotExist:
+            return HttpResponse("Track not found", status=404)
+        if not track.audio_file:
+            return HttpResponse("Audio file not found", status=404)
+        file_path = local_path(track.audio_file.storage, track.audio_file.name)
+        content_type = audio_content_type(track.audio_file.name)
+        if file_path is None:
+            return await sync_to_async(remote_stream)(request, track, content_type)
         try:
-            # Разделяем "bytes=0-100" на "bytes" и "0-100"
-            unit, ranges = range_header.split("=")
-            if unit.strip().lower() != "bytes":
-                return None
+            file_stat = await asyncio.to_thread(os.stat, file_path)
+        except FileNotFoundError:
+            return HttpResponse("Audio file not found", status=404)
+
+        file_size: int = file_stat.st_size
+        etag, last_modified = file_validators(file_stat, track.content_hash)
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
 
-            # Разделяем "0-100" на start_str и end_str
-            start_str, end_str = ranges.split("-", 1)
+        range_header: str = request.headers.get("Range", "").strip()
+        byte_ranges = None
+        if range_header and if_range_matches(request, etag, last_modified):
+            byte_ranges = parse_range_header(range_header, file_size)
+            if byte_ranges == []:
+                return range_not_satisfiable(file_size)
+        elif "t" in request.GET:
+            seek_index = await TrackSeekIndex.objects.filter(track=track).afirst()
+            byte_ranges = seek_ranges(seek_index, request.GET["t"], file_size)
+
+        plays.record(track, request)
+        response = get_async_delivery_backend().serve(
+            file_path, file_size, byte_ranges, content_type
+        )
+        set_validators(response, etag, last_modified)
+        return response
 
-            # Парсим start
-            start = int(start_str) if start_str else 0
 
-            # Парсим end
-            if end_str:
-                end = int(end_str)
-            else:
-                # Если end не указан (например, "bytes=0-"), берем конец файла
-                end = file_size - 1
+def hls_master(request, track_id: int) -> HttpResponse:
+    """Master playlist HLS: варианты трека по битрейту, качество выбирает плеер"""
+    track = get_object_or_404(
+        Track.objects.only("artist_id"), pk=track_id, status=Track.Status.READY
+    )
+    renditions = list(TrackRendition.objects.filter(track=track).order_by("bitrate"))
+    if not renditions:
+        # Трек еще не нарезан: клиент играет music:stream_audio
+        raise Http404("Track has no HLS renditions")
+    plays.record(track, request)
+    content = hls.master_playlist(
+        renditions,
+        lambda rendition: reverse(
+            "music:hls_playlist",
+            kwargs={"track_id": track.pk, "bitrate": rendition.bitrate},
+        ),
+    )
+    return HttpResponse(content, content_type=hls.PLAYLIST_CONTENT_TYPE)
+
+
+def hls_playlist(request, track_id: int, bitrate: int) -> HttpResponse:
+    """Media playlist одного варианта: ссылки на сегменты в хранилище"""
+    rendition = get_object_or_404(TrackRendition, track_id=track_id, bitrate=bitrate)
+    segments = list(rendition.segments.order_by("number").only("duration", "file"))
+    content = hls.media_playlist(segments, lambda segment: segment.file.url)
+    response = HttpResponse(content, content_type=hls.PLAYLIST_CONTENT_TYPE)
+    # В удаленном хранилище ссылки на сегменты подписаны и истекают
+    patch_cache_control(response, private=True, max_age=get_url_expire() // 2)
+    return response
+
+
+def track_peaks(request, track_id: int) -> HttpResponse:
+    """Волна и громкость трека: JSON или ?format=bin — байты пиков 0..255.
+
+    С ?v=<content_hash> ответ неизменяем и кэшируется навсегда.
+    """
+    analysis = get_object_or_404(
+        TrackAnalysis.objects.select_related("track"), track_id=track_id
+    )
+    content_hash = analysis.track.content_hash
+    if request.GET.get("format") == "bin":
+        response = HttpResponse(
+            bytes(analysis.peaks), content_type="application/octet-stream"
+        )
+    else:
+        response = JsonResponse(
+            {
+                "peaks": list(bytes(analysis.peaks)),
+                "loudness": analysis.loudness,
+                "replay_gain": analysis.replay_gain,
+                "peak": analysis.peak,
+                "trim_start": analysis.trim_start,
+                "trim_end": analysis.trim_end,
+            }
+        )
+    if content_hash and request.GET.get("v") == content_hash:
+        patch_cache_control(
+            response, public=True, max_age=60 * 60 * 24 * 365, immutable=True
+        )
+    else:
+        patch_cache_control(response, no_cache=True)
+    if content_hash:
+        etag = f'"{content_hash}"'
+        response["ETag"] = etag
+        # 304 на If-None-Match получает заголовки полного ответа, но без тела
+        response = get_conditional_response(request, etag=etag, response=response)
+    return response
+
+
+def similar_tracks(request, track_id: int) -> JsonResponse:
+    """Похожие треки по совместным плейлистам: ?limit=20"""
+    try:
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+    tracks = recommendations.similar_to(track_id, limit=limit)
+    return JsonResponse({"results": [recommendations.result(t) for t in tracks]})
+
+
+class Recommendations(LoginRequiredMixin, View):
+    """Рекомендации по лайкам пользователя: ?limit=20"""
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get("limit", 20))
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit"}, status=400)
+        tracks = recommendations.recommend_for_user(request.user, limit=limit)
+        response = JsonResponse(
+            {"results": [recommendations.result(track) for track in tracks]}
+        )
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
-            # Корректируем end, если он больше размера файла
-            end = min(end, file_size - 1)
 
-            # Проверяем валидность диапазона
-            if start < 0 or start > end:
-                return None
+def queue_response(request) -> JsonResponse:
+    """Текущий и следующие треки очереди с подсказкой предзагрузки следующего"""
+    try:
+        count = int(request.GET.get("count", 5))
+    except ValueError:
+        return JsonResponse({"error": "Invalid count"}, status=400)
+    tracks = playqueue.upcoming(request.session, count, request.user)
+    if tracks is None:
+        return JsonResponse({"error": "Queue not started"}, status=404)
+    data = {"tracks": [recommendations.result(track) for track in tracks]}
+    following = tracks[1] if len(tracks) > 1 else None
+    if following is not None:
+        start, end = playqueue.prefetch_range(following)
+        data["prefetch"] = {
+            "url": playqueue.prefetch_url(following),
+            "range": f"bytes={start}-{end}",
+        }
+    response = JsonResponse(data)
+    if following is not None:
+        response["Link"] = playqueue.preload_link(following)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+
+class PlaybackQueue(View):
+    """GET ?count=5 — очередь; POST source=playlist|album|artist|radio, id — старт"""
+
+    def get(self, request):
+        return queue_response(request)
+
+    def post(self, request):
+        try:
+            source_id = int(request.POST.get("id", ""))
+        except ValueError:
+            return JsonResponse({"error": "Invalid id"}, status=400)
+        source = request.POST.get("source", "")
+        if not playqueue.start(request.session, source, source_id, request.user):
+            raise Http404("Queue source not found")
+        return queue_response(request)
 
-            return (start, end)
-        except (ValueError, AttributeError, TypeError):
-            return None
 
-    def file_iterator(self, file_path: str, start: int, end: int):
-        with open(file_path, "rb") as file:
-            file.seek(start)
-            remaining = end - start + 1
+class PlaybackQueueNext(View):
+    """POST — переход к следующему треку очереди"""
 
-            while remaining > 0:
-                chunk_size = min(self.CHUNK_SIZE, remaining)
-                data = file.read(chunk_size)
-                if not data:
-                    break
-                remaining -= len(data)
-                yield (data)
+    def post(self, request):
+        if not playqueue.advance(request.session):
+            return JsonResponse({"error": "Queue not started"}, status=404)
+        return queue_response(request)
 
 
 class ManageFavoriteTrack(LoginRequiredMixin, View):
     def post(self, request, track_id: int):
-        track: Track = get_object_or_404(Track, pk=track_id)
-        liked_playlist, created = Playlist.objects.get_or_create(
-            owner=request.user,
-            is_liked_playlist=True,
-            title="favorite",
-            image="/playlists_images/favorite.jpg",
+        track: Track = get_object_or_404(
+            Track.objects.only("title", "artist_id"), pk=track_id
         )
-        print(liked_playlist.tracks)
         action = request.POST.get("action")
         if action == "like":
-            print("До:", liked_playlist.tracks.all())
-            liked_playlist.tracks.add(track)
-
-            print("После:", liked_playlist.tracks.all())
+            likes.like(request.user, track.pk)
             messages.success(request, f"Трек {track.title} был добавлен в мне нравится")
         elif action == "unlike":
-            print("До:", liked_playlist.tracks.all())
-            liked_playlist.tracks.remove(track)
-            print(liked_playlist.tracks.all())
-            print("После:", liked_playlist.tracks.all())
+            likes.unlike(request.user, track.pk)
             messages.info(request, f"Трек {track.title} был удален")
         else:
             messages.error(request, "Неизвестное действие")
-        return redirect("music:artist_detail", pk=track.artist.id)
+        return redirect("music:artist_detail", pk=track.artist_id)
 
 
 class UnlikeTrack(LoginRequiredMixin, View):
     def post(self, request, track_id: int):
-        track: Track = get_object_or_404(Track, pk=track_id)
-        liked_playlist = Playlist.objects.get(
-            owner=request.user, is_liked_playlist=True
-        )
-        if liked_playlist:
-            liked_playlist.tracks.delete(track)
-        return redirect("music:artist_detail", pk=track.artist.id)
+        track: Track = get_object_or_404(Track.objects.only("artist_id"), pk=track_id)
+        likes.unlike(request.user, track.pk)
+        return redirect("music:artist_detail", pk=track.artist_id)
 
 
 class AddTrackInPlaylist(LoginRequiredMixin, View):
     def post(self, request, track_id: int):
-        track: Track = get_object_or_404(Track, pk=track_id)
+        track: Track = get_object_or_404(Track.objects.only("artist_id"), pk=track_id)
         playlist_id: int = request.POST.get("playlist_id")
         if playlist_id:
             playlist = get_object_or_404(
@@ -286,9 +573,54 @@ class AddTrackInPlaylist(LoginRequiredMixin, View):
                 pk=playlist_id,
                 owner=request.user,
             )
-            print(playlist)
-            playlist.tracks.add(track)
-        return redirect("music:artist_detail", pk=track.artist.id)
+            playlists.append(playlist, [track.pk])
+        return redirect("music:artist_detail", pk=track.artist_id)
+
+
+class EditPlaylistTracks(LoginRequiredMixin, View):
+    """Пакетная правка: POST action=append|remove и track_id=1&track_id=2..."""
+
+    def post(self, request, pk: int):
+        playlist = get_object_or_404(Playlist, pk=pk, owner=request.user)
+        action = request.POST.get("action")
+        try:
+            track_ids = [int(value) for value in request.POST.getlist("track_id")]
+        except ValueError:
+            return JsonResponse({"error": "Invalid track_id"}, status=400)
+        if len(track_ids) > playlists.MAX_BULK:
+            return JsonResponse({"error": "Too many tracks"}, status=400)
+
+        if action == "append":
+            existing = set(
+                Track.objects.filter(pk__in=track_ids).values_list("pk", flat=True)
+            )
+            created = playlists.append(
+                playlist, [track_id for track_id in track_ids if track_id in existing]
+            )
+            return JsonResponse({"added": [entry.pk for entry in created]})
+        if action == "remove":
+            return JsonResponse({"removed": playlists.remove(playlist, track_ids)})
+        return JsonResponse({"error": "Unknown action"}, status=400)
+
+
+class MovePlaylistTrack(LoginRequiredMixin, View):
+    """POST entry_id и after_id (пусто — в начало плейлиста)"""
+
+    def post(self, request, pk: int):
+        playlist = get_object_or_404(Playlist, pk=pk, owner=request.user)
+        try:
+            entry_id = int(request.POST["entry_id"])
+            after = request.POST.get("after_id")
+            after_id = int(after) if after else None
+        except (KeyError, ValueError):
+            return JsonResponse({"error": "Invalid entry_id or after_id"}, status=400)
+        if not PlaylistTrack.objects.filter(pk=entry_id, playlist=playlist).exists():
+            raise Http404("Entry not found")
+        try:
+            position = playlists.move(playlist, entry_id, after_id)
+        except PlaylistTrack.DoesNotExist:
+            raise Http404("Entry not found")
+        return JsonResponse({"entry_id": entry_id, "position": position})
 
 
 class RemoveTrackFromFavorite(DeleteView):
@@ -307,15 +639,26 @@ class CreatePlaylist(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class PlaylistDetail(LoginRequiredMixin, DetailView):
+class PlaylistDetail(LoginRequiredMixin, CursorPaginationMixin, DetailView):
     model = Playlist
     template_name = "music/playlist_detail.html"
     context_object_name = "playlist"
+    tracks_per_page = 50
+    cursor_ordering = ("position", "id")
 
-    """def get_context_data(self, **kwargs):
+    def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["tracks_in_playlist"]=self.get_object()
-"""
+        entries = PlaylistTrack.objects.filter(playlist=self.object).select_related(
+            "track"
+        )
+        page = self.paginate_by_cursor(entries, self.tracks_per_page)
+        # Артисты страницы — одной выборкой без повторов, а не JOIN на каждую строку
+        page.object_list = get_loaders(self.request).attach(
+            [entry.track for entry in page.object_list], "artist"
+        )
+        context["tracks"] = page
+        context["track_count"] = playlists.track_count(self.object)
+        return context
 
 
 class UpdatePlaylist(LoginRequiredMixin, UpdateView):
@@ -326,9 +669,10 @@ class DeletePlaylist(LoginRequiredMixin, DetailView):
     model = Playlist
 
 
-class MyPlaylists(LoginRequiredMixin, ListView):
+class MyPlaylists(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Playlist
     paginate_by = 10
+    cursor_ordering = ("id",)
     template_name = "music/my_playlists.html"
     context_object_name = "playlists"
 
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "music.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -50,13 +51,15 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "music.loaders.DataLoaderMiddleware",
 ]
 
 ROOT_URLCONF = "music_app.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Стандартный DjangoTemplates с замером времени рендера (music.metrics)
+        "BACKEND": "music.metrics.DjangoTemplates",
         "DIRS": [
             BASE_DIR / "templates",
         ],
@@ -80,12 +83,51 @@ LOGIN_URL = "/users/sign-in/"
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Профиль базы: MUSIC_DB_PROFILE=sqlite (по умолчанию) или postgres
+# (зависимости — extra postgres в pyproject.toml).
+# PRAGMA для SQLite (WAL и пр.) выставляет music.database при каждом соединении,
+# см. MUSIC_SQLITE_PRAGMAS
+MUSIC_DB_PROFILE = os.environ.get("MUSIC_DB_PROFILE", "sqlite")
+
+if MUSIC_DB_PROFILE == "postgres":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "music"),
+            "USER": os.environ.get("POSTGRES_USER", "music"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    # Пул psycopg (extra postgres: psycopg[pool]) несовместим с CONN_MAX_AGE: либо пул,
+    # либо постоянное соединение на поток воркера
+    if os.environ.get("POSTGRES_POOL_MAX_SIZE"):
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ["POSTGRES_POOL_MAX_SIZE"]),
+            "timeout": float(os.environ.get("POSTGRES_POOL_TIMEOUT", 10)),
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(
+            os.environ.get("POSTGRES_CONN_MAX_AGE", 60)
+        )
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                # Запись сразу берет блокировку: без IMMEDIATE транзакция, начавшая
+                # с чтения, получает "database is locked" без ожидания busy_timeout
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 5,
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -128,7 +170,122 @@ STATICFILES_DIRS = [
 STATIC_URL = "/static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+STORAGES = {
+    # Загрузки хранятся по хешу содержимого, см. music.storage
+    "default": {"BACKEND": "music.storage.ContentAddressedStorage"},
+    # Уменьшенные копии обложек: имена производные от исходника, см. music.renditions
+    "renditions": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"allow_overwrite": True},
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+# Где лежат загрузки: MUSIC_STORAGE=local (MEDIA_ROOT) или s3 — любое
+# S3-совместимое хранилище (AWS, MinIO), нужны boto3 и django-storages.
+# Ключи доступа boto3 берет из AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY
+MUSIC_STORAGE = os.environ.get("MUSIC_STORAGE", "local")
+if MUSIC_STORAGE == "s3":
+    S3_OPTIONS = {
+        "bucket_name": os.environ.get("S3_BUCKET", "music"),
+        "endpoint_url": os.environ.get("S3_ENDPOINT_URL"),
+        "region_name": os.environ.get("S3_REGION"),
+        "default_acl": None,
+        # Бакет закрыт: все ссылки подписанные
+        "querystring_auth": True,
+        "querystring_expire": 60 * 60,
+    }
+    STORAGES["default"] = {
+        "BACKEND": "music.s3.ContentAddressedS3Storage",
+        "OPTIONS": S3_OPTIONS,
+    }
+    STORAGES["renditions"] = {
+        "BACKEND": "music.s3.RenditionS3Storage",
+        "OPTIONS": S3_OPTIONS,
+    }
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Audio streaming
+# Способ отдачи диапазонов: "python", "sendfile", "x-accel-redirect", "x-sendfile"
+MUSIC_STREAM_DELIVERY = os.environ.get("MUSIC_STREAM_DELIVERY", "sendfile")
+# internal location в nginx, смотрящий на MEDIA_ROOT
+MUSIC_STREAM_ACCEL_PREFIX = "/protected-media/"
+# Максимум одновременно открытых аудиофайлов на процесс в ASGI-стриминге
+MUSIC_STREAM_MAX_OPEN_FILES = int(os.environ.get("MUSIC_STREAM_MAX_OPEN_FILES", 1024))
+MUSIC_STREAM_ASYNC_CHUNK_SIZE = 64 * 1024
+# Шаг таблицы перемотки MP3 в секундах (?t= в music:stream_audio)
+MUSIC_SEEK_INDEX_STEP = 0.5
+# Cache-Control max-age для music:stream_audio (есть ETag/Last-Modified)
+MUSIC_STREAM_MAX_AGE = 60 * 60 * 24
+# Загрузки получают уникальные имена и не меняются: кэшируем их на год.
+# В продакшене те же пути отдает nginx с "expires max"
+MUSIC_IMMUTABLE_MEDIA = ["tracks/*", "*_images/*", "renditions/*"]
+# Выполнять фоновые задачи сразу после коммита, без manage.py run_jobs (для разработки)
+MUSIC_JOBS_EAGER = False
+# Уменьшенные копии обложек для srcset. Отсутствующие nginx отдает Django:
+#   location /media/renditions/ { try_files $uri @rendition; }
+#   location @rendition { rewrite ^/media/(.*)$ /music/$1 break; proxy_pass ...; }
+MUSIC_IMAGE_WIDTHS = (64, 128, 256, 320, 512, 640)
+MUSIC_IMAGE_FORMAT = "WEBP"
+# Кэш лайков (music.likes): алиас общего кэша Django для нескольких воркеров,
+# None — LRU в памяти процесса на MUSIC_LIKES_CACHE_SIZE пользователей;
+# запись LRU живет MUSIC_LIKES_CACHE_TIMEOUT секунд (лайки из других воркеров)
+MUSIC_LIKES_CACHE = None
+MUSIC_LIKES_CACHE_SIZE = 10000
+MUSIC_LIKES_CACHE_TIMEOUT = 60
+# Счетчики прослушиваний (music.plays): события копятся в памяти процесса и
+# пишутся пачкой в фоновом потоке раз в MUSIC_PLAYS_FLUSH_INTERVAL секунд или при
+# MUSIC_PLAYS_MAX_BUFFER различных треко-днях. Раз в сутки (cron):
+#   manage.py refresh_play_counters
+MUSIC_PLAYS_FLUSH_INTERVAL = 5.0
+MUSIC_PLAYS_MAX_BUFFER = 1000
+MUSIC_PLAYS_WINDOW_DAYS = 30
+# False — буфер пишется только явным plays.buffer.flush(): так работают тесты,
+# фоновый поток писал бы в базу мимо транзакции теста
+MUSIC_PLAYS_AUTO_FLUSH = True
+# Чарты главной страницы (music.charts). Пересчет по расписанию (cron):
+#   */5 * * * * manage.py refresh_charts
+# В продакшене MUSIC_CHARTS_CACHE должен указывать на общий кэш (redis/memcached)
+MUSIC_CHARTS_CACHE = "default"
+MUSIC_CHARTS_SIZE = 10
+# Сколько секунд анонимные посетители получают главную страницу из кэша
+MUSIC_CHARTS_PAGE_TIMEOUT = 60
+# Кэш результатов поиска по коротким префиксам (music.search)
+MUSIC_SEARCH_CACHE = "default"
+# PRAGMA для каждого соединения SQLite поверх DEFAULT_SQLITE_PRAGMAS из
+# music.database. SQLITE_JOURNAL_MODE=delete возвращает прежний режим журнала
+# (для сравнения)
+MUSIC_SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "wal"),
+}
+# Срок жизни подписанной ссылки, на которую music:stream_audio отправляет
+# клиента при удаленном хранилище (MUSIC_STORAGE=s3)
+MUSIC_STORAGE_URL_EXPIRE = 5 * 60
+# HLS (music.hls): битрейты вариантов в кбит/с и длина сегмента в секундах.
+# Перекодирование в AAC идет через ffmpeg; без него MP3 режется без перекодирования.
+# ffmpeg нужен воркерам и для анализа (music.analysis): без него — только WAV
+MUSIC_HLS_BITRATES = (64, 128, 256)
+MUSIC_HLS_SEGMENT_SECONDS = 6
+MUSIC_FFMPEG = os.environ.get("MUSIC_FFMPEG", "ffmpeg")
+# Число точек волны трека (music.analysis), отдается music:track_peaks
+MUSIC_WAVEFORM_POINTS = 800
+# Рекомендации (music.recommendations). Пересчет соседей по расписанию (cron):
+#   0 4 * * * manage.py rebuild_recommendations
+# Соседей на трек, треков с конца длинного плейлиста и лайков-затравок в запросе
+MUSIC_RECOMMENDATIONS_NEIGHBORS = 50
+MUSIC_RECOMMENDATIONS_MAX_PLAYLIST = 500
+MUSIC_RECOMMENDATIONS_SEEDS = 500
+# Очередь воспроизведения в сессии (music.playqueue): сколько треков держать
+# в окне и сколько секунд начала следующего трека предлагать для предзагрузки
+MUSIC_QUEUE_WINDOW = 50
+MUSIC_QUEUE_PREFETCH_SECONDS = 10
+# Метрики запросов (music.metrics): music:metrics в формате Prometheus отдается
+# только с заголовком Authorization: Bearer <MUSIC_METRICS_TOKEN> (в Prometheus —
+# authorization.credentials); пустой токен отключает адрес. Запросы дольше
+# MUSIC_SLOW_REQUEST_MS пишутся в лог music.metrics вместе с самыми долгими SQL
+MUSIC_METRICS_TOKEN = os.environ.get("MUSIC_METRICS_TOKEN", "")
+MUSIC_SLOW_REQUEST_MS = 500
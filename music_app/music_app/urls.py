@@ -2,7 +2,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
-from music.views import index
+from music.views import index, serve_media
 
 urlpatterns = [
     path("", index, name="main"),
@@ -11,4 +11,6 @@ urlpatterns = [
     path("music/", include("music.urls")),
 ]
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += static(
+        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT, view=serve_media
+    )